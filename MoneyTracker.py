@@ -1,16 +1,25 @@
 import tkinter as tk
 import customtkinter as ctk
 from tkinter import ttk, messagebox, filedialog
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Настройка тем - принудительно темная
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("dark-blue")
 
+import json
+import queue
 import sqlite3
-import pandas as pd
+import threading
 from typing import List, Dict
 
+from money_core import (DatabaseManager, TrackerModel, TransactionRecord, CarDealRecord, TransactionFilter,
+                        OperationCancelled, INSTRUMENTATION, QUERY_TRACER, timed, to_iso_date,
+                        iso_to_display_day, transaction_key, car_deal_key, compute_summary,
+                        build_monthly_report, write_monthly_report, MONTH_NAMES, SUMMARY_LABELS,
+                        IMPORT_CHUNK_SIZE, SEARCH_DELAY_MS, FILTER_ANY, EXCLUSION_FILTER_VALUES)
+
+
 class Toast(ctk.CTkToplevel):
     def __init__(self, parent, message, duration=2500):
         super().__init__(parent)
@@ -84,262 +93,240 @@ class Toast(ctk.CTkToplevel):
         toast.label.configure(fg_color=fg_color, text_color=text_color)
 
 
-class DatabaseManager:
-    def __init__(self, db_file="money_tracker.db"):
-        self.db_name = db_file
-        self.conn = sqlite3.connect(self.db_name, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.create_tables()
-
-    def create_tables(self):
-        cursor = self.conn.cursor()
-
-        # Создаем таблицу транзакций (с полем exclude_from_total)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                type TEXT NOT NULL,
-                amount REAL NOT NULL,
-                description TEXT NOT NULL,
-                category TEXT NOT NULL,
-                payment_type TEXT NOT NULL DEFAULT 'Наличные',
-                exclude_from_total INTEGER DEFAULT 0
-            )
-        """)
-
-        # Проверяем наличие столбца exclude_from_total и добавляем его, если нужно
-        try:
-            cursor.execute("PRAGMA table_info(transactions)")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'exclude_from_total' not in columns:
-                cursor.execute("ALTER TABLE transactions ADD COLUMN exclude_from_total INTEGER DEFAULT 0")
-        except sqlite3.Error as e:
-            print(f"Ошибка при проверке столбцов: {e}")
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS car_deals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                brand TEXT NOT NULL,
-                year TEXT NOT NULL,
-                vin TEXT NOT NULL,
-                comment TEXT,
-                price REAL DEFAULT 0,
-                cost REAL DEFAULT 0,
-                expenses REAL DEFAULT 0,
-                header REAL DEFAULT 0
-            )
-        """)
-
-        # Проверяем наличие столбца expenses и добавляем его, если нужно
-        try:
-            cursor.execute("SELECT expenses FROM car_deals LIMIT 1")
-        except sqlite3.OperationalError:
-            cursor.execute("ALTER TABLE car_deals ADD COLUMN expenses REAL DEFAULT 0")
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS settings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                initial_capital REAL NOT NULL DEFAULT 0
-            )
-        """)
-
-        cursor.execute("SELECT COUNT(*) FROM settings")
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("INSERT INTO settings (initial_capital) VALUES (0)")
-
-        self.conn.commit()
-
-    # ---------------- Транзакции ----------------
-    def add_transaction(self, transaction):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO transactions (date, type, amount, description, category, payment_type, exclude_from_total)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            transaction['date'],
-            transaction['type'],
-            transaction['amount'],
-            transaction['description'],
-            transaction['category'],
-            transaction.get('payment_type', 'Наличные'),
-            int(transaction.get('exclude_from_total', False))
-        ))
-        self.conn.commit()
-
-    def get_all_transactions(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT id, date, type, amount, description, category, payment_type, exclude_from_total 
-            FROM transactions ORDER BY date DESC
-        ''')
-        transactions = []
-        for row in cursor.fetchall():
-            transactions.append({
-                'id': row[0],
-                'date': row[1],
-                'type': row[2],
-                'amount': row[3],
-                'description': row[4],
-                'category': row[5],
-                'payment_type': row[6],
-                'exclude_from_total': bool(row[7])
-            })
-        return transactions
-
-    def update_transaction(self, transaction_id: int, updates: Dict) -> bool:
-        if not updates:
-            return False
+class VirtualTreeview:
+    """Виртуальный режим для ttk.Treeview: в дереве существуют только видимые строки.
+
+    Строки запрашиваются страницами через fetch_page(offset, limit) по мере прокрутки
+    и кэшируются; count_rows() сообщает общее число строк. Если заданы
+    fetch_after(key, limit, direction) и row_key(row), соседняя с кэшированной страница
+    читается keyset-запросом от ключа ее крайней строки, а OFFSET остается только
+    для прыжков полосой прокрутки. Полоса прокрутки и колесо
+    мыши управляют окном вручную, поэтому открытие таблицы не зависит от ее размера.
+    iid строк задает make_iid, так что двойной клик и контекстное меню работают как раньше.
+    """
+
+    def __init__(self, tree, scrollbar, fetch_page, count_rows, make_iid, make_values,
+                 page_size: int = 100, buffer_rows: int = 2, cached_pages: int = 8,
+                 fetch_after=None, row_key=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.fetch_page = fetch_page
+        self.count_rows = count_rows
+        self.make_iid = make_iid
+        self.make_values = make_values
+        self.fetch_after = fetch_after
+        self.row_key = row_key
+        self.page_size = page_size
+        self.buffer_rows = buffer_rows
+        self.cached_pages = cached_pages
+
+        self.first = 0
+        self.total = 0
+        self.visible_rows = 1
+        self._pages = {}
+        self._selected = None
+
+        self.scrollbar.configure(command=self.on_scrollbar)
+        self.tree.configure(yscrollcommand=lambda *args: None)
+        self.tree.bind("<Configure>", self.on_resize, add="+")
+        self.tree.bind("<MouseWheel>", self.on_mousewheel, add="+")
+        self.tree.bind("<Button-4>", lambda event: self.scroll_by(-3), add="+")
+        self.tree.bind("<Button-5>", lambda event: self.scroll_by(3), add="+")
+        self.tree.bind("<<TreeviewSelect>>", self.on_select, add="+")
+
+    # ---------------- Данные ----------------
+    def refresh(self):
+        """Сбрасывает кэш страниц (данные изменились) и перерисовывает текущее окно"""
+        self._pages.clear()
+        self.total = self.count_rows()
+        self.render()
+
+    def rows(self, start: int, count: int) -> List[Dict]:
+        result = []
+        end = min(start + count, self.total)
+        index = start
+        while index < end:
+            page_no, offset = divmod(index, self.page_size)
+            page = self._page(page_no)
+            if offset >= len(page):
+                break
+            chunk = page[offset:offset + end - index]
+            result.extend(chunk)
+            index += len(chunk)
+        return result
+
+    def _page(self, page_no: int) -> List[Dict]:
+        page = self._pages.pop(page_no, None)
+        if page is None:
+            page = self._fetch(page_no)
+        # Последняя использованная страница - в конце словаря, самые старые вытесняются
+        self._pages[page_no] = page
+        while len(self._pages) > self.cached_pages:
+            del self._pages[next(iter(self._pages))]
+        return page
+
+    def _fetch(self, page_no: int) -> List[Dict]:
+        if self.fetch_after is not None:
+            previous = self._pages.get(page_no - 1)
+            if previous and len(previous) == self.page_size:
+                return self.fetch_after(self.row_key(previous[-1]), self.page_size, "desc")
+            following = self._pages.get(page_no + 1)
+            if following:
+                page = self.fetch_after(self.row_key(following[0]), self.page_size, "asc")
+                page.reverse()
+                return page
+        return self.fetch_page(page_no * self.page_size, self.page_size)
+
+    # ---------------- Отрисовка ----------------
+    @timed("ui.tree_render")
+    def render(self):
+        window = self.visible_rows + self.buffer_rows
+        self.first = max(0, min(self.first, self.total - self.visible_rows))
+
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        for row in self.rows(self.first, window):
+            item_id = self.make_iid(row)
+            self.tree.insert("", "end", iid=item_id, text=item_id, values=self.make_values(row))
+
+        if self._selected and self.tree.exists(self._selected):
+            self.tree.selection_set(self._selected)
+
+        if self.total:
+            self.scrollbar.set(self.first / self.total,
+                               min(1.0, (self.first + self.visible_rows) / self.total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll_to(self, first: int):
+        first = max(0, min(first, self.total - self.visible_rows))
+        if first != self.first:
+            self.first = first
+            self.render()
+
+    def scroll_by(self, rows: int):
+        self.scroll_to(self.first + rows)
+        return "break"
+
+    def select(self, index: int, item_id: str):
+        """Прокручивает окно к строке с номером index и выделяет ее (item_id - iid строки)"""
+        self._selected = item_id
+        self.first = index
+        self.render()
+
+    # ---------------- События ----------------
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.total))
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll_by(int(amount) * step)
+
+    def on_mousewheel(self, event):
+        return self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def on_resize(self, event=None):
+        rowheight = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        # Одна строка высоты уходит на заголовки колонок
+        visible_rows = max(1, self.tree.winfo_height() // rowheight - 1)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.render()
+
+    def on_select(self, event=None):
+        selection = self.tree.selection()
+        if selection:
+            self._selected = selection[0]
+
+
+class BackgroundWorker:
+    """Фоновый поток для долгих операций с базой и файлами.
+
+    Задачи выполняются по очереди в отдельном потоке со своим соединением с базой.
+    Задача - функция job(db, progress), где progress(done, total, message) сообщает
+    о ходе работы и бросает OperationCancelled после нажатия "Отмена". Прогресс и
+    результат передаются в поток Tk через очередь, которую опрашивает root.after.
+    """
+
+    POLL_INTERVAL = 50
+
+    def __init__(self, root, db_file: str):
+        self.root = root
+        self.db_file = db_file
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.on_progress = None
+        self.on_state = None
+        self.active = 0
+
+        self.thread = threading.Thread(target=self._run, name="MoneyTrackerWorker", daemon=True)
+        self.thread.start()
+        self.root.after(self.POLL_INTERVAL, self._poll)
+
+    def submit(self, title: str, job, on_done=None, on_error=None):
+        """Ставит задачу в очередь; on_done(result) и on_error(exc) вызываются в потоке Tk"""
+        self.active += 1
+        if self.on_state:
+            self.on_state(True, title)
+        self.jobs.put((title, job, on_done, on_error))
+
+    def cancel(self):
+        """Просит текущую задачу остановиться при следующем сообщении о прогрессе"""
+        self.cancel_event.set()
+
+    def stop(self):
+        self.cancel_event.set()
+        self.jobs.put(None)
+
+    def _run(self):
+        db = DatabaseManager(self.db_file)
         try:
-            cursor = self.conn.cursor()
-            set_clause = ", ".join(f"{key} = ?" for key in updates.keys())
-            values = list(updates.values()) + [transaction_id]
-            cursor.execute(f"UPDATE transactions SET {set_clause} WHERE id = ?", values)
-            self.conn.commit()
-            return cursor.rowcount > 0
-        except Exception as e:
-            print(f"Ошибка при обновлении транзакции: {e}")
-            return False
+            while True:
+                item = self.jobs.get()
+                if item is None:
+                    break
+                title, job, on_done, on_error = item
+                self.cancel_event.clear()
+
+                def progress(done, total=None, message=""):
+                    if self.cancel_event.is_set():
+                        raise OperationCancelled()
+                    self.events.put(("progress", title, (done, total, message), None))
 
-    def exists_transaction(self, transaction: Dict) -> bool:
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT COUNT(*) FROM transactions
-            WHERE type = ? AND amount = ? AND description = ? 
-            AND category = ? AND payment_type = ?
-            AND date LIKE ?
-        """, (
-            transaction["type"],
-            transaction["amount"],
-            transaction["description"],
-            transaction["category"],
-            transaction.get("payment_type", "Наличные"),
-            f"%{transaction['date'].split()[0]}%"
-        ))
-        return cursor.fetchone()[0] > 0
-
-    # ---------------- Авто-сделки ----------------
-    def add_car_deal(self, car_deal: Dict) -> int:
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            INSERT INTO car_deals (
-                brand, year, vin, comment, price, cost, expenses, header
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            car_deal["brand"],
-            car_deal["year"],
-            car_deal["vin"],
-            car_deal.get("comment", ""),
-            car_deal.get("price", 0),
-            car_deal.get("cost", 0),
-            car_deal.get("expenses", 0),
-            car_deal.get("header", 0)
-        ))
-        self.conn.commit()
-        return cursor.lastrowid
-
-    def get_all_car_deals(self) -> List[Dict]:
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM car_deals ORDER BY year DESC")
-        return [dict(row) for row in cursor.fetchall()]
-
-    def update_car_deal(self, deal_id: int, updates: Dict) -> bool:
-        if not updates:
-            return False
-        try:
-            cursor = self.conn.cursor()
-            set_clause = ", ".join(f"{key} = ?" for key in updates.keys())
-            values = list(updates.values()) + [deal_id]
-            cursor.execute(f"UPDATE car_deals SET {set_clause} WHERE id = ?", values)
-            self.conn.commit()
-            return cursor.rowcount > 0
-        except Exception as e:
-            print(f"Ошибка при обновлении авто-сделки: {e}")
-            return False
+                try:
+                    self.events.put(("done", title, job(db, progress), on_done))
+                except OperationCancelled as e:
+                    self.events.put(("cancelled", title, e, on_error))
+                except Exception as e:
+                    self.events.put(("error", title, e, on_error))
+        finally:
+            db.close()
 
-    def exists_car_deal(self, car_deal: Dict) -> bool:
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT COUNT(*) FROM car_deals
-            WHERE brand = ? AND year = ? AND vin = ?
-            AND ABS(price - ?) < 0.01 AND ABS(cost - ?) < 0.01
-        """, (
-            car_deal["brand"],
-            car_deal["year"],
-            car_deal["vin"],
-            car_deal.get("price", 0),
-            car_deal.get("cost", 0)
-        ))
-        return cursor.fetchone()[0] > 0
-
-    # ---------------- Настройки ----------------
-    def get_initial_capital(self) -> float:
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT initial_capital FROM settings LIMIT 1")
-        result = cursor.fetchone()
-        return result[0] if result else 0.0
-
-    def update_initial_capital(self, amount: float) -> bool:
-        cursor = self.conn.cursor()
-        cursor.execute("UPDATE settings SET initial_capital = ?", (amount,))
-        self.conn.commit()
-        return cursor.rowcount > 0
-
-    # ---------------- Экспорт / импорт ----------------
-    def export_to_excel(self, file_path: str, monthly_data: Dict = None) -> bool:
+    def _poll(self):
+        """Выполняет в потоке Tk все накопившиеся события фоновых задач"""
         try:
-            with pd.ExcelWriter(file_path, engine="openpyxl") as writer:
-                # Экспорт транзакций
-                transactions = self.get_all_transactions()
-                if transactions:
-                    df_transactions = pd.DataFrame(transactions)
-                    df_transactions = df_transactions.rename(columns={
-                        "date": "Дата", "type": "Тип", "amount": "Сумма",
-                        "description": "Описание", "category": "Категория",
-                        "payment_type": "Тип_оплаты", "exclude_from_total": "Исключено_из_расхода"
-                    })
-                    df_transactions.to_excel(writer, sheet_name="Транзакции", index=False)
-
-                # Экспорт авто-сделок
-                car_deals = self.get_all_car_deals()
-                if car_deals:
-                    df_car_deals = pd.DataFrame(car_deals)
-                    df_car_deals = df_car_deals.rename(columns={
-                        "brand": "Марка", "year": "Год", "vin": "VIN",
-                        "price": "Цена_продажи", "cost": "Закупочная_стоимость",
-                        "expenses": "Расходы", "header": "Прибыль", "comment": "Комментарий"
-                    })
-                    df_car_deals.to_excel(writer, sheet_name="Авто-сделки", index=False)
-
-                # Экспорт настроек
-                settings_data = {"Стартовый_капитал": [self.get_initial_capital()]}
-                pd.DataFrame(settings_data).to_excel(writer, sheet_name="Настройки", index=False)
-
-                # Экспорт месячного отчета
-                if monthly_data:
-                    if 'daily_summary' in monthly_data and monthly_data['daily_summary']:
-                        pd.DataFrame(monthly_data['daily_summary']).to_excel(
-                            writer, sheet_name="Месяц_Ежедневно", index=False)
-                    if 'daily_details' in monthly_data and monthly_data['daily_details']:
-                        pd.DataFrame(monthly_data['daily_details']).to_excel(
-                            writer, sheet_name="Месяц_Операции", index=False)
-                    if 'category_stats' in monthly_data and monthly_data['category_stats']:
-                        stats_df = pd.DataFrame(list(monthly_data['category_stats'].items()),
-                                                columns=['Категория', 'Сумма'])
-                        stats_df.to_excel(writer, sheet_name="Месяц_Категории", index=False)
-                    if 'month_info' in monthly_data:
-                        pd.DataFrame([monthly_data['month_info']]).to_excel(
-                            writer, sheet_name="Месяц_Инфо", index=False)
-
-            return True
-        except Exception as e:
-            print(f"Ошибка при экспорте: {e}")
-            return False
-
-    def close(self):
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+            while True:
+                kind, title, payload, callback = self.events.get_nowait()
+                if kind == "progress":
+                    if self.on_progress:
+                        self.on_progress(title, *payload)
+                    continue
+
+                self.active -= 1
+                if self.on_state:
+                    self.on_state(self.active > 0, title)
+                try:
+                    if callback:
+                        callback(payload)
+                    elif kind == "error":
+                        print(f"Ошибка фоновой задачи \"{title}\": {payload}")
+                except Exception as e:
+                    print(f"Ошибка при обработке результата \"{title}\": {e}")
+        except queue.Empty:
+            pass
+        self.root.after(self.POLL_INTERVAL, self._poll)
 
 
 class MoneyTrackerApp:
@@ -353,15 +340,40 @@ class MoneyTrackerApp:
         self.xxlarge_font = ("Arial", 18, "bold")
 
         # Инициализация менеджера базы данных
-        self.db = DatabaseManager()
+        try:
+            self.db = DatabaseManager()
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка", f"Не удалось открыть базу: {e}")
+            raise
 
         # Загрузка данных
-        self.transactions = self.db.get_all_transactions()
-        self.car_deals = self.db.get_all_car_deals()
-        self.initial_capital = self.db.get_initial_capital()
+        self.model = TrackerModel(self.db)
+
+        # Фоновый поток для импорта, экспорта и перезагрузки данных
+        self.worker = BackgroundWorker(self.root, self.db.db_name)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Категории нужны и до постройки вкладки месяца (проверка новых категорий, экспорт)
+        self.categories = self.db.get_categories()
 
         self.setup_ui()
 
+    @property
+    def transactions(self) -> List[TransactionRecord]:
+        return self.model.transactions
+
+    @property
+    def car_deals(self) -> List[CarDealRecord]:
+        return self.model.car_deals
+
+    @property
+    def initial_capital(self) -> float:
+        return self.model.initial_capital
+
+    @initial_capital.setter
+    def initial_capital(self, value: float):
+        self.model.initial_capital = value
+
     def ask_confirmation(self, title, message):
         """Стильное окно подтверждения вместо стандартного messagebox"""
         dialog = ctk.CTkToplevel(self.root)
@@ -407,9 +419,18 @@ class MoneyTrackerApp:
         return result[0]
 
 
-    def show_toast(self, message, duration=2500):
+    def on_close(self):
+        """Останавливает фоновую задачу и закрывает базу перед выходом"""
+        self.worker.stop()
+        self.worker.thread.join(timeout=2)
+        self.db.close()
+        self.root.destroy()
+
+    def show_toast(self, message, duration=2500, toast_type="info"):
         """Показывает временное уведомление в правом нижнем углу"""
         toast = Toast(self.root, message, duration)
+        if toast_type == "error":
+            toast.label.configure(fg_color="#D8000C", text_color="#FFFFFF")
 
 
     def setup_ui(self):
@@ -438,51 +459,75 @@ class MoneyTrackerApp:
         self.notebook = ttk.Notebook(self.main_frame)
         self.notebook.pack(fill="both", expand=True)
 
-        # Сначала создаем все фреймы
         self.add_frame = ctk.CTkFrame(self.notebook)
         self.car_frame = ctk.CTkFrame(self.notebook)
         self.report_frame = ctk.CTkFrame(self.notebook)
         self.monthly_frame = ctk.CTkFrame(self.notebook)
         self.settings_frame = ctk.CTkFrame(self.notebook)
 
-        # Затем настраиваем их (теперь monthly_frame будет создан до report_frame)
-        self.setup_add_frame()
-        self.setup_car_frame()
-        self.setup_monthly_frame()  # Сначала создаем monthly_frame
-        self.setup_report_frame()  # Затем report_frame
-        self.setup_settings_frame()
+        # Вкладка: (фрейм, заголовок, построение, обновление данных). Содержимое строится
+        # при первом показе и сразу заполняется; скрытая вкладка при изменении данных
+        # только помечается (dirty_tabs) и обновляется, когда ее откроют
+        self.tabs = {
+            "add": (self.add_frame, "➕ Добавить операцию", self.setup_add_frame, None),
+            "car": (self.car_frame, "🚗 Авто-сделки", self.setup_car_frame, None),
+            "report": (self.report_frame, "📊 Финансовый отчет", self.setup_report_frame, self.update_report),
+            "monthly": (self.monthly_frame, "📅 Расходы за месяц", self.setup_monthly_frame,
+                        self.update_monthly_report),
+            "settings": (self.settings_frame, "⚙️ Настройки", self.setup_settings_frame, self.update_capital_entry),
+        }
+        self.built_tabs = set()
+        self.dirty_tabs = set()
+        for frame, text, _, _ in self.tabs.values():
+            self.notebook.add(frame, text=text)
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        self.on_tab_changed()
+
+    def current_tab(self) -> str:
+        return list(self.tabs)[self.notebook.index("current")]
+
+    def on_tab_changed(self, event=None):
+        """Строит вкладку при первом показе или обновляет, если данные менялись, пока она была скрыта"""
+        name = self.current_tab()
+        _, _, setup, refresh = self.tabs[name]
+        if name not in self.built_tabs:
+            self.built_tabs.add(name)
+            self.dirty_tabs.discard(name)
+            setup()
+        elif name in self.dirty_tabs:
+            self.dirty_tabs.discard(name)
+            refresh()
+
+    def refresh_tab(self, name: str, refresh=None):
+        """Обновляет открытую вкладку (refresh - частичное обновление вместо полного);
+        скрытую только помечает, а непостроенную пропускает - она построится со свежими данными"""
+        if name not in self.built_tabs:
+            return
+        if name == self.current_tab():
+            (refresh or self.tabs[name][3])()
+        else:
+            self.dirty_tabs.add(name)
 
-        # Добавляем вкладки после настройки
-        self.notebook.add(self.add_frame, text="➕ Добавить операцию")
-        self.notebook.add(self.car_frame, text="🚗 Авто-сделки")
-        self.notebook.add(self.report_frame, text="📊 Финансовый отчет")
-        self.notebook.add(self.monthly_frame, text="📅 Расходы за месяц")
-        self.notebook.add(self.settings_frame, text="⚙️ Настройки")
+    def refresh_transaction_rows(self):
+        self.tree_view.refresh()
+        self.update_summary()
 
-        self.setup_context_menus()
+    def refresh_car_rows(self):
+        self.car_view.refresh()
+        self.update_summary()
 
     def setup_add_frame(self):
         self.add_frame.grid_columnconfigure(1, weight=1)
         ctk.CTkLabel(self.add_frame, text="Новая операция", font=self.large_font).grid(row=0, column=0, columnspan=2,
                                                                                        pady=(0, 20))
 
-        # Тип операции
+        # Значения списков берутся из справочников базы
         fields = [
-            ("Тип операции:", "combobox", ["Приход", "Расход"], "Приход"),
+            ("Тип операции:", "combobox", self.db.get_transaction_types(), "Приход"),
             ("Сумма:", "entry", None, "0.00"),
             ("Описание:", "entry", None, ""),
-            ("Тип оплаты:", "combobox", ["Наличные", "Безнал", "Другое"], "Наличные"),
-            ("Категория:", "combobox", [
-                "КЦ",
-                "Реклама",
-                "Вед.рекламы",
-                "Комиссия брок",
-                "Дилерство",
-                "Аренда",
-                "ЗП окладники",
-                "ЗП проценты",
-                "Другое"
-            ], "Другое")
+            ("Тип оплаты:", "combobox", self.db.get_payment_types(), "Наличные"),
+            ("Категория:", "combobox", self.db.get_categories(), "Другое")
         ]
 
         self.entries = {}
@@ -591,10 +636,7 @@ class MoneyTrackerApp:
         ctk.CTkLabel(inner_frame, text="Месяц:", font=self.xlarge_font).grid(
             row=0, column=2, padx=(0, 10), pady=5, sticky="w")
 
-        months = [
-            "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
-            "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
-        ]
+        months = MONTH_NAMES
         current_month = datetime.now().month - 1
         self.month_combo = ctk.CTkComboBox(inner_frame, values=months, width=150, height=40,
                                            dropdown_font=self.large_font, font=self.xlarge_font)
@@ -662,22 +704,38 @@ class MoneyTrackerApp:
         scrollbar_y2.grid(row=4, column=1, sticky="ns", pady=(0, 10))
 
         # Новая панель статистики по категориям (распределяем по горизонтали)
-        categories_frame = ctk.CTkFrame(self.monthly_frame)
-        categories_frame.grid(row=5, column=0, columnspan=2, sticky="we", padx=10, pady=10)
+        self.categories_frame = ctk.CTkFrame(self.monthly_frame)
+        self.categories_frame.grid(row=5, column=0, columnspan=2, sticky="we", padx=10, pady=10)
 
         # Настраиваем grid для равномерного распределения
         for i in range(5):  # 5 колонок
-            categories_frame.grid_columnconfigure(i, weight=1)
+            self.categories_frame.grid_columnconfigure(i, weight=1)
+
+        self.categories = []
+        self.category_labels = {}
+        self.build_category_panel()
+
+        # Настройка весов для растягивания
+        self.monthly_frame.grid_rowconfigure(2, weight=1)
+        self.monthly_frame.grid_rowconfigure(4, weight=2)
+
+        # Привязка события выбора дня
+        self.daily_tree.bind("<<TreeviewSelect>>", self.on_day_selected)
+
+        # Первоначальное обновление отчета
+        self.update_monthly_report()
+
+    def build_category_panel(self):
+        """(Пере)создает плитки статистики по категориям из справочника категорий"""
+        for child in self.categories_frame.winfo_children():
+            child.destroy()
 
         # Категории для статистики
-        self.categories = [
-            "Аренда", "Дилерство", "Наличные", "Безнал", "КЦ",
-            "ЗП окладники", "ЗП проценты", "Реклама", "Вед.рекламы", "Комиссия брок"
-        ]
+        self.categories = self.db.get_categories()
 
         self.category_labels = {}
         for i, category in enumerate(self.categories):
-            frame = ctk.CTkFrame(categories_frame, height=60)
+            frame = ctk.CTkFrame(self.categories_frame, height=60)
             frame.grid(row=i // 5, column=i % 5, padx=5, pady=5, sticky="nsew")
             frame.grid_propagate(False)
 
@@ -687,16 +745,25 @@ class MoneyTrackerApp:
                                                           font=self.large_font)
             self.category_labels[category].pack()
 
-        # Настройка весов для растягивания
-        self.monthly_frame.grid_rowconfigure(2, weight=1)
-        self.monthly_frame.grid_rowconfigure(4, weight=2)
-
-        # Привязка события выбора дня
-        self.daily_tree.bind("<<TreeviewSelect>>", self.on_day_selected)
-
-        # Первоначальное обновление отчета
-        self.update_monthly_report()
+    def refresh_lookup_values(self):
+        """Подтягивает новые значения справочников (например, после импорта) в списки и панель"""
+        if "add" in self.built_tabs:
+            self.entries["Тип операции:"].configure(values=self.db.get_transaction_types())
+            self.entries["Тип оплаты:"].configure(values=self.db.get_payment_types())
+            self.entries["Категория:"].configure(values=self.db.get_categories())
+        if "report" in self.built_tabs:
+            for name, values in (("type", self.db.get_transaction_types()),
+                                 ("category", self.db.get_categories()),
+                                 ("payment_type", self.db.get_payment_types())):
+                self.filter_widgets[name].configure(values=[FILTER_ANY] + values)
+        if self.db.get_categories() != self.categories:
+            if "monthly" in self.built_tabs:
+                self.build_category_panel()
+                self.refresh_tab("monthly")
+            else:
+                self.categories = self.db.get_categories()
 
+    @timed("ui.update_monthly_report")
     def update_monthly_report(self, event=None):
         """Обновляет отчет о расходах за месяц"""
         # Очищаем таблицы
@@ -713,181 +780,48 @@ class MoneyTrackerApp:
         except (ValueError, AttributeError):
             return
 
-        # Группируем операции по дням
-        daily_data = {}
-
-        # Словарь для статистики по категориям
-        category_stats = {category: 0 for category in self.categories}
-
-        # Собираем ВСЕ операции для отображения
-        for transaction in self.transactions:
-            try:
-                # Парсим дату
-                date_str = transaction["date"].split()[0]
-                day, month, year = map(int, date_str.split('.'))
-
-                if year == selected_year and month == month_number:
-                    if date_str not in daily_data:
-                        daily_data[date_str] = {
-                            'all_income': 0,  # Все приходы
-                            'all_expense': 0,  # Все расходы
-                            'transactions': []  # Все транзакции
-                        }
-
-                    amount = abs(transaction["amount"])
-
-                    # Всегда добавляем транзакцию в список для детализации
-                    daily_data[date_str]['transactions'].append(transaction)
-
-                    # Учитываем ВСЕ операции для отображения
-                    if transaction["type"] == "Приход":
-                        daily_data[date_str]['all_income'] += amount
-                    else:
-                        daily_data[date_str]['all_expense'] += amount
-
-                    # Собираем статистику по всем категориям (и приход и расход)
-                    category = transaction["category"]
-                    if category in category_stats:
-                        if transaction["type"] == "Расход":
-                            category_stats[category] += amount
-                        else:
-                            category_stats[category] -= amount  # Приход уменьшает расход по категории
-
-            except (ValueError, IndexError):
-                continue
+        # Сводка месяца считается векторно по колонкам модели, без запросов к базе
+        summary = self.model.columns.monthly_summary(selected_year, month_number)
 
         # Заполняем таблицу ежедневной сводки (показываем ВСЕ операции)
-        for date_str in sorted(daily_data.keys(), reverse=True):
-            data = daily_data[date_str]
+        for data in reversed(summary['days']):
             # Для отображения в таблице используем все операции
-            balance = data['all_income'] - data['all_expense']  # Баланс по всем операциям
-            transactions_count = len(data['transactions'])  # Все операции включая исключенные
+            balance = data['income'] - data['expense']  # Баланс по всем операциям
 
             self.daily_tree.insert(
                 "",
                 "end",
                 values=(
-                    date_str,
-                    f"{data['all_income']:,.2f}",  # Все приходы
-                    f"{data['all_expense']:,.2f}",  # Все расходы
+                    iso_to_display_day(data['day']),
+                    f"{data['income']:,.2f}",  # Все приходы
+                    f"{data['expense']:,.2f}",  # Все расходы
                     f"{balance:,.2f}",  # Баланс по всем операциям
-                    transactions_count
+                    data['count']  # Все операции включая исключенные
                 )
             )
 
         # Обновляем статистику по категориям
-        for category, amount in category_stats.items():
+        for category in self.categories:
+            amount = summary['categories'].get(category, 0)
             self.category_labels[category].configure(text=f"{abs(amount):,.2f} ₽")
 
     def get_monthly_report_data(self) -> Dict:
         """Собирает данные для месячного отчета"""
-        try:
-            selected_year = int(self.year_combo.get())
-            selected_month = self.month_combo.get()
-            month_number = self.get_month_number(selected_month)
-        except (ValueError, AttributeError):
-            return {}
-
-        daily_data = {}
-        category_stats = {category: 0 for category in self.categories}
-        all_daily_details = []
-
-        total_income = 0
-        total_expense = 0
-
-        # Собираем данные
-        for transaction in self.transactions:
+        if "monthly" not in self.built_tabs:
+            # Вкладка месяца еще не открывалась - в ней был бы выбран текущий месяц
+            selected_year, month_number = datetime.now().year, datetime.now().month
+            selected_month = MONTH_NAMES[month_number - 1]
+        else:
             try:
-                date_str = transaction["date"].split()[0]
-                day, month, year = map(int, date_str.split('.'))
-
-                if year == selected_year and month == month_number:
-                    if date_str not in daily_data:
-                        daily_data[date_str] = {
-                            'all_income': 0,
-                            'all_expense': 0,
-                            'transactions': []
-                        }
-
-                    amount = abs(transaction["amount"])
-                    daily_data[date_str]['transactions'].append(transaction)
-
-                    if transaction["type"] == "Приход":
-                        daily_data[date_str]['all_income'] += amount
-                        total_income += amount
-                    else:
-                        daily_data[date_str]['all_expense'] += amount
-                        total_expense += amount
-
-                    # Статистика по категориям
-                    category = transaction["category"]
-                    if category in category_stats:
-                        if transaction["type"] == "Расход":
-                            category_stats[category] += amount
-                        else:
-                            category_stats[category] -= amount
-
-                    # Добавляем в детализацию
-                    all_daily_details.append({
-                        'Дата': transaction["date"],
-                        'День': date_str,
-                        'Тип': transaction["type"],
-                        'Описание': transaction["description"],
-                        'Категория': transaction["category"],
-                        'Тип_оплаты': transaction.get("payment_type", "Наличные"),
-                        'Сумма': abs(transaction['amount']),
-                        'Сумма_руб': f"{abs(transaction['amount']):,.2f} ₽"
-                    })
-
-            except (ValueError, IndexError):
-                continue
-
-        # Формируем ежедневную сводку
-        daily_summary = []
-        for date_str in sorted(daily_data.keys()):
-            data = daily_data[date_str]
-            balance = data['all_income'] - data['all_expense']
-            transactions_count = len(data['transactions'])
-
-            daily_summary.append({
-                'Дата': date_str,
-                'Приход': data['all_income'],
-                'Расход': data['all_expense'],
-                'Баланс': balance,
-                'Количество_операций': transactions_count,
-                'Приход_руб': f"{data['all_income']:,.2f} ₽",
-                'Расход_руб': f"{data['all_expense']:,.2f} ₽",
-                'Баланс_руб': f"{balance:,.2f} ₽"
-            })
-
-        # Информация о месяце
-        month_info = {
-            'Год': selected_year,
-            'Месяц': selected_month,
-            'Всего_дней_с_операциями': len(daily_summary),
-            'Общий_приход': total_income,
-            'Общий_расход': total_expense,
-            'Итоговый_баланс': total_income - total_expense,
-            'Общий_приход_руб': f"{total_income:,.2f} ₽",
-            'Общий_расход_руб': f"{total_expense:,.2f} ₽",
-            'Итоговый_баланс_руб': f"{total_income - total_expense:,.2f} ₽"
-        }
+                selected_year = int(self.year_combo.get())
+                selected_month = self.month_combo.get()
+                month_number = self.get_month_number(selected_month)
+            except (ValueError, AttributeError):
+                return {}
 
-        # Преобразуем статистику по категориям в удобный формат
-        formatted_category_stats = {}
-        for category, amount in category_stats.items():
-            formatted_category_stats[category] = {
-                'Сумма': abs(amount),
-                'Сумма_руб': f"{abs(amount):,.2f} ₽",
-                'Тип': 'Расход' if amount > 0 else 'Приход'
-            }
-
-        return {
-            'daily_summary': daily_summary,
-            'daily_details': all_daily_details,
-            'category_stats': formatted_category_stats,
-            'month_info': month_info
-        }
+        summary = self.model.columns.monthly_summary(selected_year, month_number)
+        transactions = self.db.get_transactions_for_month(selected_year, month_number)
+        return build_monthly_report(summary, transactions, selected_year, selected_month, self.categories)
 
     def export_monthly_report(self):
         """Экспорт только месячного отчета"""
@@ -899,53 +833,22 @@ class MoneyTrackerApp:
         if not path:
             return
 
-        try:
-            monthly_data = self.get_monthly_report_data()
-
-            if monthly_data:
-                with pd.ExcelWriter(path, engine="openpyxl") as writer:
-                    # Ежедневная сводка
-                    if 'daily_summary' in monthly_data and monthly_data['daily_summary']:
-                        pd.DataFrame(monthly_data['daily_summary']).to_excel(
-                            writer,
-                            sheet_name="Ежедневная_сводка",
-                            index=False
-                        )
-
-                    # Детализация операций
-                    if 'daily_details' in monthly_data and monthly_data['daily_details']:
-                        pd.DataFrame(monthly_data['daily_details']).to_excel(
-                            writer,
-                            sheet_name="Детализация_операций",
-                            index=False
-                        )
-
-                    # Статистика по категориям
-                    if 'category_stats' in monthly_data and monthly_data['category_stats']:
-                        stats_df = pd.DataFrame(list(monthly_data['category_stats'].items()),
-                                                columns=['Категория', 'Сумма'])
-                        stats_df.to_excel(
-                            writer,
-                            sheet_name="Статистика_по_категориям",
-                            index=False
-                        )
-
-                    # Общая информация
-                    if 'month_info' in monthly_data:
-                        pd.DataFrame([monthly_data['month_info']]).to_excel(
-                            writer,
-                            sheet_name="Общая_информация",
-                            index=False
-                        )
-
-                messagebox.showinfo("Успех", "Месячный отчет успешно экспортирован в Excel")
-            else:
-                messagebox.showwarning("Предупреждение", "Нет данных для экспорта за выбранный месяц")
-
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при экспорте месячного отчета: {str(e)}")
+        # Данные месяца собираются сразу (запросы по одному месяцу), файл пишется в фоне
+        monthly_data = self.get_monthly_report_data()
+        if not monthly_data:
+            messagebox.showwarning("Предупреждение", "Нет данных для экспорта за выбранный месяц")
+            return
 
+        def on_error(e):
+            if not isinstance(e, OperationCancelled):
+                messagebox.showerror("Ошибка", f"Ошибка при экспорте месячного отчета: {str(e)}")
 
+        self.worker.submit(
+            "Экспорт месячного отчета",
+            lambda db, progress: write_monthly_report(path, monthly_data),
+            on_done=lambda result: messagebox.showinfo("Успех", "Месячный отчет успешно экспортирован в Excel"),
+            on_error=on_error
+        )
 
     def on_day_selected(self, event):
         """Обработчик выбора дня в таблице - показывает ВСЕ операции выбранного дня"""
@@ -960,65 +863,71 @@ class MoneyTrackerApp:
         for item in self.detail_tree.get_children():
             self.detail_tree.delete(item)
 
-        # Получаем выбранные год и месяц
         try:
-            selected_year = int(self.year_combo.get())
-            selected_month = self.month_combo.get()
-            month_number = self.get_month_number(selected_month)
-        except (ValueError, AttributeError):
+            day, month, year = map(int, date_str.split('.'))
+            day_transactions = self.db.get_transactions_for_day(year, month, day)
+        except ValueError:
             return
 
         # Заполняем детальную таблицу ВСЕМИ операциями за выбранный день
-        for transaction in self.transactions:
-            try:
-                transaction_date = transaction["date"].split()[0]
-                day, month, year = map(int, transaction_date.split('.'))
-
-                if (year == selected_year and month == month_number and
-                        transaction_date == date_str):
-                    self.detail_tree.insert(
-                        "",
-                        "end",
-                        values=(
-                            transaction["date"],
-                            transaction["type"],
-                            transaction["description"],
-                            transaction["category"],
-                            f"{abs(transaction['amount']):,.2f} ₽"
-                        )
-                    )
-
-            except (ValueError, IndexError):
-                continue
-
-    def refresh_data(self):
-        """Обновляет все данные из базы и перерисовывает отчеты"""
-        try:
-            # Загружаем свежие данные из базы
-            self.transactions = self.db.get_all_transactions()
-            self.car_deals = self.db.get_all_car_deals()
-            self.initial_capital = self.db.get_initial_capital()
+        for transaction in day_transactions:
+            self.detail_tree.insert(
+                "",
+                "end",
+                values=(
+                    transaction["date"],
+                    transaction["type"],
+                    transaction["description"],
+                    transaction["category"],
+                    f"{abs(transaction['amount']):,.2f} ₽"
+                )
+            )
 
-            # Обновляем все отчеты
-            self.update_report()
-            if hasattr(self, 'daily_tree'):
-                self.update_monthly_report()
+    def refresh_data(self, on_done=None):
+        """Перечитывает все данные из базы в фоне и перерисовывает отчеты"""
+        def apply(data):
+            self.apply_loaded_data(data)
+            if on_done:
+                on_done()
+
+        self.worker.submit(
+            "Обновление данных",
+            lambda db, progress: TrackerModel.fetch(db),
+            on_done=apply,
+            on_error=lambda e: print(f"Ошибка при обновлении данных: {e}")
+        )
+
+    @timed("ui.apply_loaded_data")
+    def apply_loaded_data(self, data: Dict):
+        """Подставляет в модель данные, прочитанные фоновым потоком, и перерисовывает отчеты"""
+        try:
+            self.model.load(data)
+            self.refresh_lookup_values()
 
-            # Обновляем поле капитала в настройках
-            if hasattr(self, 'capital_entry'):
-                self.capital_entry.delete(0, tk.END)
-                self.capital_entry.insert(0, str(self.initial_capital))
+            # Перерисовывается только открытая вкладка, остальные - при показе
+            for name in ("report", "monthly", "settings"):
+                self.refresh_tab(name)
 
         except Exception as e:
             print(f"Ошибка при обновлении данных: {e}")
 
+    def update_capital_entry(self):
+        """Поле капитала в настройках - по текущему значению модели"""
+        self.capital_entry.delete(0, tk.END)
+        self.capital_entry.insert(0, str(self.initial_capital))
+
+    def is_selected_month(self, transaction: TransactionRecord) -> bool:
+        """Попадает ли операция в месяц, выбранный на вкладке месячного отчета"""
+        try:
+            prefix = f"{int(self.year_combo.get()):04d}-{self.get_month_number(self.month_combo.get()):02d}"
+        except (ValueError, AttributeError):
+            return False
+        return (transaction.date_iso or "").startswith(prefix)
+
     def get_month_number(self, month_name):
-        months = {
-            "Январь": 1, "Февраль": 2, "Март": 3, "Апрель": 4,
-            "Май": 5, "Июнь": 6, "Июль": 7, "Август": 8,
-            "Сентябрь": 9, "Октябрь": 10, "Ноябрь": 11, "Декабрь": 12
-        }
-        return months.get(month_name, datetime.now().month)
+        if month_name in MONTH_NAMES:
+            return MONTH_NAMES.index(month_name) + 1
+        return datetime.now().month
 
     def parse_date(self, date_str):
         try:
@@ -1046,6 +955,58 @@ class MoneyTrackerApp:
             "#6": {"name": "payment_type", "text": "Тип оплаты", "width": 120, "anchor": "center"}  # Новая колонка
         }
 
+        # Поиск по описаниям операций и авто-сделкам: результаты обновляются по мере ввода
+        search_frame = ctk.CTkFrame(self.report_frame)
+        search_frame.grid(row=0, column=0, columnspan=2, sticky="we", padx=10, pady=(10, 5))
+        search_frame.grid_columnconfigure(0, weight=1)
+        self.search_entry = ctk.CTkEntry(search_frame, font=self.large_font,
+                                         placeholder_text="🔍 Поиск: описание, марка, VIN, комментарий")
+        self.search_entry.grid(row=0, column=0, sticky="we", padx=5, pady=5)
+        self.search_entry.bind("<KeyRelease>", self.schedule_search)
+
+        search_columns = {
+            "#1": {"text": "Где", "width": 100},
+            "#2": {"text": "Дата / год", "width": 180},
+            "#3": {"text": "Найдено", "width": 500},
+            "#4": {"text": "Сумма", "width": 150},
+        }
+        self.search_results = ttk.Treeview(search_frame, columns=list(search_columns.keys()),
+                                           show="headings", height=6)
+        for col, params in search_columns.items():
+            self.search_results.heading(col, text=params["text"])
+            self.search_results.column(col, width=params["width"], anchor="center")
+        self.search_results.grid(row=1, column=0, sticky="we", padx=5, pady=(0, 5))
+        self.search_results.grid_remove()
+        self.search_results.bind("<Double-1>", self.show_search_result)
+        self._search_job = None
+        self._search_hits = {}
+
+        # Фильтры таблицы операций: отбор выполняет база (TransactionFilter -> SQL)
+        filter_frame = ctk.CTkFrame(search_frame, fg_color="transparent")
+        filter_frame.grid(row=2, column=0, sticky="we", padx=5, pady=(0, 5))
+        self.transaction_filter = TransactionFilter()
+        self.filter_widgets = {}
+        for label, name in (("С:", "date_from"), ("По:", "date_to")):
+            ctk.CTkLabel(filter_frame, text=label).pack(side="left", padx=(5, 2))
+            entry = ctk.CTkEntry(filter_frame, width=110, placeholder_text="дд.мм.гггг")
+            entry.pack(side="left")
+            entry.bind("<Return>", self.apply_transaction_filter)
+            entry.bind("<FocusOut>", self.apply_transaction_filter)
+            self.filter_widgets[name] = entry
+        for name, values in (("type", self.db.get_transaction_types()),
+                             ("category", self.db.get_categories()),
+                             ("payment_type", self.db.get_payment_types()),
+                             ("exclude_from_total", list(EXCLUSION_FILTER_VALUES))):
+            combo = ctk.CTkComboBox(filter_frame, width=150, values=[FILTER_ANY] + values,
+                                    command=self.apply_transaction_filter)
+            combo.set(FILTER_ANY)
+            combo.pack(side="left", padx=5)
+            self.filter_widgets[name] = combo
+        ctk.CTkButton(filter_frame, text="Сбросить", width=90,
+                      command=self.reset_transaction_filter).pack(side="left", padx=5)
+        self.filter_label = ctk.CTkLabel(filter_frame, text="", font=self.large_font)
+        self.filter_label.pack(side="left", padx=10)
+
         self.tree = ttk.Treeview(self.report_frame, columns=list(columns.keys()), show="headings")
         for col, params in columns.items():
             self.tree.heading(col, text=params["text"])
@@ -1075,21 +1036,35 @@ class MoneyTrackerApp:
         scrollbar.grid(row=1, column=1, sticky="ns")
         car_scrollbar.grid(row=3, column=1, sticky="ns")
 
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        self.car_tree.configure(yscrollcommand=car_scrollbar.set)
-        scrollbar.configure(command=self.tree.yview)
-        car_scrollbar.configure(command=self.car_tree.yview)
+        # Виртуальный режим: в деревьях только видимые строки, страницы берутся из базы
+        self.tree_view = VirtualTreeview(
+            self.tree, scrollbar,
+            fetch_page=lambda offset, limit: self.db.get_transactions_page(
+                offset, limit, self.transaction_filter),
+            count_rows=self.count_report_transactions,
+            make_iid=lambda tr: f"tr_{tr['id']}",
+            make_values=self._transaction_values,
+            fetch_after=lambda after, limit, direction: self.db.iter_transactions(
+                after, limit, direction, self.transaction_filter),
+            row_key=transaction_key
+        )
+        self.car_view = VirtualTreeview(
+            self.car_tree, car_scrollbar,
+            fetch_page=self.db.get_car_deals_page,
+            count_rows=lambda: len(self.model.car_deals),
+            make_iid=lambda deal: f"car_{deal['id']}",
+            make_values=self._car_deal_values,
+            fetch_after=self.db.iter_car_deals,
+            row_key=car_deal_key
+        )
 
         self.summary_panel = ctk.CTkFrame(self.report_frame)
         self.summary_panel.grid(row=4, column=0, columnspan=2, sticky="we", padx=10, pady=10)
 
         summary_items = [
-            ("initial_capital", "Стартовый капитал:", f"{self.initial_capital:,.2f} ₽", self.xlarge_font),
-            ("total_income", "Общий приход:", "0.00 ₽", self.xlarge_font),
-            ("total_expense", "Общий расход:", "0.00 ₽", self.xlarge_font),
-            ("additional_investment", "Доп. вложения:", "0.00 ₽", self.xlarge_font),
-            ("car_profit", "Прибыль с авто:", "0.00 ₽", self.xxlarge_font),
-            ("total_profit", "Общая прибыль:", "0.00 ₽", self.xxlarge_font)
+            (name, f"{label}:", f"{self.initial_capital:,.2f} ₽" if name == "initial_capital" else "0.00 ₽",
+             self.xxlarge_font if name in ("car_profit", "total_profit") else self.xlarge_font)
+            for name, label in SUMMARY_LABELS.items()
         ]
 
         self.summary_labels = {}
@@ -1110,7 +1085,109 @@ class MoneyTrackerApp:
                        lambda event: self.on_tree_double_click(event, self.tree, self.transactions, key_order))
         self.car_tree.bind("<Double-1>",
                            lambda event: self.on_tree_double_click(event, self.car_tree, self.car_deals, car_key_order))
+        self.setup_context_menus()
+
 
+    def read_transaction_filter(self) -> TransactionFilter:
+        """Собирает TransactionFilter из полей над таблицей операций"""
+        def choice(name):
+            value = self.filter_widgets[name].get()
+            return [] if value == FILTER_ANY else [value]
+
+        bounds = {}
+        for name in ("date_from", "date_to"):
+            text = self.filter_widgets[name].get().strip()
+            iso = to_iso_date(text) if text else None
+            if text and iso is None:
+                self.show_toast(f"Дата '{text}' не распознана", toast_type="error")
+            bounds[name] = iso
+        # "По" включает весь указанный день
+        if bounds["date_to"] is not None:
+            day = datetime.strptime(bounds["date_to"][:10], "%Y-%m-%d").date()
+            bounds["date_to"] = (day + timedelta(days=1)).isoformat()
+        if bounds["date_from"] is not None:
+            bounds["date_from"] = bounds["date_from"][:10]
+
+        return TransactionFilter(
+            date_from=bounds["date_from"], date_to=bounds["date_to"],
+            types=choice("type"), categories=choice("category"), payment_types=choice("payment_type"),
+            exclude_from_total=EXCLUSION_FILTER_VALUES.get(self.filter_widgets["exclude_from_total"].get())
+        )
+
+    @timed("ui.apply_transaction_filter")
+    def apply_transaction_filter(self, event=None):
+        flt = self.read_transaction_filter()
+        if flt == self.transaction_filter:
+            return
+        self.transaction_filter = flt
+        self.tree_view.first = 0
+        self.tree_view.refresh()
+        self.update_filter_label()
+
+    def reset_transaction_filter(self):
+        for name in ("date_from", "date_to"):
+            self.filter_widgets[name].delete(0, "end")
+        for name in ("type", "category", "payment_type", "exclude_from_total"):
+            self.filter_widgets[name].set(FILTER_ANY)
+        self.apply_transaction_filter()
+
+    def count_report_transactions(self) -> int:
+        if self.transaction_filter.is_empty():
+            return len(self.model.transactions)
+        return self.db.count_transactions(self.transaction_filter)
+
+    def update_filter_label(self):
+        """Число и суммы отобранных операций (считаются в SQL по тем же индексам)"""
+        if self.transaction_filter.is_empty():
+            self.filter_label.configure(text="")
+            return
+        summary = self.db.get_filtered_summary(self.transaction_filter)
+        self.filter_label.configure(text=f"Найдено: {summary['count']} · приход {summary['income']:,.2f} ₽"
+                                         f" · расход {abs(summary['expense']):,.2f} ₽")
+
+    def schedule_search(self, event=None):
+        """Запускает поиск после паузы в наборе, а не на каждое нажатие клавиши"""
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(SEARCH_DELAY_MS, self.run_search)
+
+    @timed("ui.run_search")
+    def run_search(self):
+        self._search_job = None
+        text = self.search_entry.get().strip()
+        self.search_results.delete(*self.search_results.get_children())
+        self._search_hits = {}
+        if not text:
+            self.search_results.grid_remove()
+            return
+
+        for tr in self.db.search_transactions(text):
+            item_id = f"tr_{tr.id}"
+            self._search_hits[item_id] = tr
+            self.search_results.insert("", "end", iid=item_id, values=(
+                "Операция", tr.date, tr.description, f"{tr.amount:,.2f} ₽"))
+        for deal in self.db.search_car_deals(text):
+            item_id = f"car_{deal.id}"
+            self._search_hits[item_id] = deal
+            found = " ".join(str(value) for value in (deal.brand, deal.vin, deal.comment) if value)
+            self.search_results.insert("", "end", iid=item_id, values=(
+                "Авто", deal.year, found, f"{deal.header or 0:,.2f} ₽"))
+        self.search_results.grid()
+
+    def show_search_result(self, event=None):
+        """Прокручивает таблицу отчета к найденной строке и выделяет ее"""
+        selection = self.search_results.selection()
+        if not selection or selection[0] not in self._search_hits:
+            return
+        item_id = selection[0]
+        row = self._search_hits[item_id]
+        if item_id.startswith("tr_"):
+            # Позиция считается по полному списку, поэтому фильтр снимается
+            if not self.transaction_filter.is_empty():
+                self.reset_transaction_filter()
+            self.tree_view.select(self.model.transaction_position(row), item_id)
+        else:
+            self.car_view.select(self.model.car_deal_position(row), item_id)
 
     def setup_settings_frame(self):
         ctk.CTkLabel(self.settings_frame, text="Стартовый капитал:", font=self.large_font).pack(pady=(20, 5))
@@ -1123,7 +1200,7 @@ class MoneyTrackerApp:
                 self.initial_capital = float(self.capital_entry.get())
                 self.db.update_initial_capital(self.initial_capital)
                 self.show_toast("💾 Капитал обновлен")
-                self.update_report()
+                self.refresh_tab("report", self.update_summary)
             except ValueError:
                 messagebox.showerror("Ошибка", "Введите число.")
 
@@ -1132,6 +1209,102 @@ class MoneyTrackerApp:
             pady=10)  # ← ЭТО правильный вызов
         ctk.CTkButton(self.settings_frame, text="📤 Экспорт в Excel", command=self.export_to_excel).pack(pady=10)
 
+        # Ход фоновых операций (импорт, экспорт, обновление данных)
+        self.job_label = ctk.CTkLabel(self.settings_frame, text="", font=self.large_font)
+        self.job_label.pack(pady=(20, 5))
+        self.job_progress = ctk.CTkProgressBar(self.settings_frame, width=400)
+        self.job_progress.set(0)
+        self.job_progress.pack(pady=5)
+        self.cancel_button = ctk.CTkButton(self.settings_frame, text="⛔ Отмена", command=self.worker.cancel,
+                                           fg_color="#f44336", hover_color="#da190b", state="disabled")
+        self.cancel_button.pack(pady=10)
+
+        self.worker.on_progress = self.on_job_progress
+        self.worker.on_state = self.on_job_state
+
+        # Фактические настройки SQLite (профиль подключения)
+        settings = self.db.get_effective_settings()
+        settings_text = ", ".join(f"{key}={value}" for key, value in settings.items())
+        ctk.CTkLabel(self.settings_frame, text=f"База: {settings_text}", wraplength=600,
+                     text_color="gray").pack(pady=(20, 5))
+
+        # Диагностика: время вызовов базы и фаз обновления окна
+        self.timings_var = ctk.BooleanVar(value=INSTRUMENTATION.enabled)
+        ctk.CTkCheckBox(self.settings_frame, text="Замерять время операций", variable=self.timings_var,
+                        command=self.toggle_timings).pack(pady=(20, 5))
+        self.query_trace_var = ctk.BooleanVar(value=self.db.conn.tracer is not None)
+        ctk.CTkCheckBox(self.settings_frame, text=f"Трассировать SQL (медленные - от {QUERY_TRACER.threshold * 1000:g} мс)",
+                        variable=self.query_trace_var, command=self.toggle_query_trace).pack(pady=5)
+        self.timings_text = ctk.CTkTextbox(self.settings_frame, width=700, height=200, font=("Courier New", 12))
+        self.timings_text.pack(pady=5)
+        timings_buttons = ctk.CTkFrame(self.settings_frame, fg_color="transparent")
+        timings_buttons.pack(pady=5)
+        ctk.CTkButton(timings_buttons, text="🔄 Обновить", command=self.show_timings).pack(side="left", padx=5)
+        ctk.CTkButton(timings_buttons, text="🧹 Сбросить", command=self.reset_timings).pack(side="left", padx=5)
+        ctk.CTkButton(timings_buttons, text="💾 Сохранить JSON", command=self.save_timings).pack(side="left", padx=5)
+        self.show_timings()
+
+    def toggle_timings(self):
+        INSTRUMENTATION.enabled = self.timings_var.get()
+        self.show_timings()
+
+    def toggle_query_trace(self):
+        if self.query_trace_var.get():
+            self.db.enable_query_tracer()
+        else:
+            self.db.disable_query_tracer()
+        self.show_timings()
+
+    def show_timings(self):
+        """Таблица замеров (вызовы, сумма, среднее, p50, p95, максимум в мс) и сводка SQL"""
+        lines = [f"{'операция':<36} {'вызовов':>8} {'всего':>10} {'сред.':>8} {'p50':>8} {'p95':>8} {'макс.':>8}"]
+        for name, stats in INSTRUMENTATION.snapshot().items():
+            lines.append(f"{name:<36} {stats['count']:>8} {stats['total'] * 1000:>10.1f} "
+                         f"{stats['mean'] * 1000:>8.2f} {stats['p50'] * 1000:>8.2f} "
+                         f"{stats['p95'] * 1000:>8.2f} {stats['max'] * 1000:>8.2f}")
+        if len(lines) == 1:
+            lines.append("замеров нет" if INSTRUMENTATION.enabled else "замеры выключены")
+        if QUERY_TRACER.report():
+            lines += ["", "SQL:", QUERY_TRACER.format_report()]
+        self.timings_text.configure(state="normal")
+        self.timings_text.delete("1.0", "end")
+        self.timings_text.insert("1.0", "\n".join(lines))
+        self.timings_text.configure(state="disabled")
+
+    def reset_timings(self):
+        INSTRUMENTATION.reset()
+        QUERY_TRACER.reset()
+        self.show_timings()
+
+    def save_timings(self):
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")])
+        if not path:
+            return
+        try:
+            data = json.loads(INSTRUMENTATION.dump())
+            data["sql"] = QUERY_TRACER.to_dict()
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(data, file, ensure_ascii=False, indent=2)
+            self.show_toast("💾 Замеры сохранены")
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить замеры: {e}")
+
+    def on_job_progress(self, title, done, total, message):
+        self.job_label.configure(text=message or title)
+        if total:
+            self.job_progress.configure(mode="determinate")
+            self.job_progress.set(min(1.0, done / total))
+
+    def on_job_state(self, busy, title):
+        if busy:
+            self.job_label.configure(text=f"⏳ {title}...")
+            self.job_progress.set(0)
+            self.cancel_button.configure(state="normal")
+        else:
+            self.job_label.configure(text="")
+            self.job_progress.set(0)
+            self.cancel_button.configure(state="disabled")
+
     def on_tree_double_click(self, event, tree, data_list, key_order):
         """Обработчик двойного клика по дереву"""
         item = tree.identify_row(event.y)
@@ -1167,30 +1340,24 @@ class MoneyTrackerApp:
             def save_edit(event=None):
                 try:
                     new_val = entry.get()
-                    values = list(tree.item(item, "values"))
-                    values[col_index] = new_val
-                    tree.item(item, values=values)
                     entry.destroy()
 
-                    # Получаем iid элемента
-                    iid = tree.item(item, "text")
-
-                    if not iid:
-                        return
-
-                    # Определяем тип данных (транзакции или авто-сделки)
-                    if iid.startswith("tr_"):
-                        index = int(iid.split("_")[1])
+                    # iid строки содержит id записи в базе: "tr_<id>" или "car_<id>"
+                    if item.startswith("tr_"):
                         data_type = "transaction"
-                    elif iid.startswith("car_"):
-                        index = int(iid.split("_")[1])
+                    elif item.startswith("car_"):
                         data_type = "car_deal"
                     else:
                         return
+                    record_id = int(item.split("_")[1])
 
-                    if index < len(data_list) and col_index < len(key_order):
+                    if col_index < len(key_order):
                         key = key_order[col_index]
-                        cleaned = new_val.replace(",", "").replace(" ", "").strip()
+                        if key == "date":
+                            # Пробел отделяет время от даты - его не убираем
+                            cleaned = new_val.strip()
+                        else:
+                            cleaned = new_val.replace(",", "").replace(" ", "").strip()
 
                         try:
                             # Преобразуем числовые поля
@@ -1202,58 +1369,54 @@ class MoneyTrackerApp:
 
                         # Сохраняем изменения в базе данных
                         if data_type == "transaction":
-                            transaction_id = data_list[index]["id"]
+                            current = self.model.transactions_by_id[record_id]
                             updates = {key: cleaned}
 
                             # Особенная обработка для суммы
                             if key == "amount":
-                                current_type = data_list[index]["type"]
-                                if current_type == "Расход":
+                                if current["type"] == "Расход":
                                     updates["amount"] = -abs(float(cleaned))
                                 else:
                                     updates["amount"] = abs(float(cleaned))
 
-                            # Обновляем в базе данных
-                            success = self.db.update_transaction(transaction_id, updates)
-                            if success:
-                                print(f"Транзакция {transaction_id} обновлена: {updates}")
+                            # Обновляем в базе данных и только эту строку в интерфейсе
+                            if self.apply_transaction_update(record_id, updates):
+                                print(f"Транзакция {record_id} обновлена: {updates}")
+                            elif key == "date":
+                                self.show_toast(f"Дата '{cleaned}' не распознана", toast_type="error")
 
                         elif data_type == "car_deal":
-                            deal_id = data_list[index]["id"]
+                            current = self.model.car_deals_by_id[record_id]
                             updates = {}
 
                             # Особенная обработка для авто-сделок
                             if key == "price":
                                 price = float(cleaned)
-                                cost = float(data_list[index].get("cost", 0))
-                                expenses = float(data_list[index].get("expenses", 0))
+                                cost = float(current.get("cost", 0))
+                                expenses = float(current.get("expenses", 0))
                                 header = price - cost - expenses
                                 updates = {"price": price, "header": header}
 
                             elif key == "cost":
                                 cost = float(cleaned)
-                                price = float(data_list[index].get("price", 0))
-                                expenses = float(data_list[index].get("expenses", 0))
+                                price = float(current.get("price", 0))
+                                expenses = float(current.get("expenses", 0))
                                 header = price - cost - expenses
                                 updates = {"cost": cost, "header": header}
 
                             elif key == "expenses":
                                 expenses = float(cleaned)
-                                price = float(data_list[index].get("price", 0))
-                                cost = float(data_list[index].get("cost", 0))
+                                price = float(current.get("price", 0))
+                                cost = float(current.get("cost", 0))
                                 header = price - cost - expenses
                                 updates = {"expenses": expenses, "header": header}
 
                             else:
                                 updates = {key: cleaned}
 
-                            # Обновляем в базе данных
-                            success = self.db.update_car_deal(deal_id, updates)
-                            if success:
-                                print(f"Авто-сделка {deal_id} обновлена: {updates}")
-
-                    # Полностью перезагружаем все данные из базы
-                    self.refresh_data()
+                            # Обновляем в базе данных и только эту строку в интерфейсе
+                            if self.apply_car_deal_update(record_id, updates):
+                                print(f"Авто-сделка {record_id} обновлена: {updates}")
 
                 except Exception as e:
                     print(f"Ошибка при сохранении редактирования: {e}")
@@ -1313,10 +1476,18 @@ class MoneyTrackerApp:
                 "exclude_from_total": exclude_from_total
             }
 
-            self.db.add_transaction(transaction)
+            result = self.model.add_transaction(transaction)
+            if result is None:
+                messagebox.showwarning("Предупреждение", "Такая операция за сегодня уже есть, она не добавлена.")
+                return
 
-            # Обновляем данные и все отчеты
-            self.refresh_data()
+            # Обновляем видимое окно таблицы, итоги и месяц, если он открыт
+            row = result[1]
+            if row.category not in self.categories:
+                self.refresh_lookup_values()
+            self.refresh_tab("report", self.refresh_transaction_rows)
+            if self.is_selected_month(row):
+                self.refresh_tab("monthly")
 
             # Сбрасываем форму
             self.entries["Сумма:"].delete(0, tk.END)
@@ -1359,292 +1530,124 @@ class MoneyTrackerApp:
                 "comment": comment
             }
 
-            self.db.add_car_deal(car_deal)
+            self.model.add_car_deal(car_deal)
 
-            # Обновляем данные и все отчеты
-            self.refresh_data()
+            # Обновляем видимое окно таблицы и итоги
+            self.refresh_tab("report", self.refresh_car_rows)
 
             self.show_toast("🚗 Авто-сделка добавлена")
 
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при добавлении: {str(e)}")
 
-    def update_report(self):
-        # Очищаем таблицы
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        for item in self.car_tree.get_children():
-            self.car_tree.delete(item)
-
-        # Заполняем таблицу транзакций
-        for i, tr in enumerate(self.transactions):
-            item_id = f"tr_{i}"
-            self.tree.insert(
-                "",
-                "end",
-                iid=item_id,
-                text=item_id,  # Важно: устанавливаем text такой же как iid
-                values=(
-                    tr["date"],
-                    tr["type"],
-                    f"{abs(tr['amount']):,.2f}",
-                    tr["description"],
-                    tr["category"],
-                    tr.get("payment_type", "Наличные")
-                )
-            )
+    def _transaction_values(self, tr: TransactionRecord) -> tuple:
+        return (
+            tr.date,
+            tr.type,
+            f"{abs(tr.amount):,.2f}",
+            tr.description,
+            tr.category,
+            tr.payment_type or "Наличные"
+        )
 
-        # Заполняем таблицу авто-сделок
-        for i, deal in enumerate(self.car_deals):
-            item_id = f"car_{i}"
-            self.car_tree.insert(
-                "", "end",
-                iid=item_id,
-                text=item_id,  # Важно: устанавливаем text такой же как iid
-                values=(
-                    deal.get("brand", ""),
-                    deal.get("year", ""),
-                    deal.get("vin", ""),
-                    f"{deal.get('price', 0):,.2f}",
-                    f"{deal.get('cost', 0):,.2f}",
-                    f"{deal.get('expenses', 0):,.2f}",
-                    f"{deal.get('header', 0):,.2f}",
-                    deal.get("comment", "")
-                )
-            )
+    def _car_deal_values(self, deal: CarDealRecord) -> tuple:
+        return (
+            deal.brand,
+            deal.year,
+            deal.vin,
+            f"{deal.price or 0:,.2f}",
+            f"{deal.cost or 0:,.2f}",
+            f"{deal.expenses or 0:,.2f}",
+            f"{deal.header or 0:,.2f}",
+            deal.comment or ""
+        )
 
-        self.update_summary()
+    @timed("ui.update_report")
+    def update_report(self):
+        # Таблицы перерисовывают только видимое окно строк
+        self.tree_view.refresh()
+        self.car_view.refresh()
 
-    def update_summary(self):
-        # Исключаемые категории (не учитываются в общем приходе/расходе)
-        excluded_categories = ["ЗП окладники", "ЗП проценты", "Комиссия брок"]
+        self.update_summary()
 
-        # Фильтруем транзакции, исключая указанные категории И операции с флагом exclude_from_total
-        filtered_transactions = [
-            t for t in self.transactions
-            if t["category"] not in excluded_categories and not t.get("exclude_from_total", False)
-        ]
+    def apply_transaction_update(self, transaction_id: int, updates: Dict) -> bool:
+        """Сохраняет правку операции и перерисовывает только ее строку"""
+        old_row = self.model.transactions_by_id.get(transaction_id)
+        item_id = f"tr_{transaction_id}"
+        result = self.model.update_transaction(transaction_id, updates)
+        if result is None:
+            # Возвращаем в таблицу сохраненные значения
+            if old_row is not None and self.tree.exists(item_id):
+                self.tree.item(item_id, values=self._transaction_values(old_row))
+            return False
 
-        # ВАЖНО: используем abs() для суммы, но сохраняем знак для расчета
-        total_income = sum(t["amount"] for t in filtered_transactions if t["type"] == "Приход")
-        total_expense = abs(sum(t["amount"] for t in filtered_transactions if t["type"] == "Расход"))
+        old_index, new_index, row = result
+        self.refresh_tab("report", self.refresh_transaction_rows)
+        if self.is_selected_month(old_row) or self.is_selected_month(row):
+            self.refresh_tab("monthly")
+        return True
+
+    def apply_car_deal_update(self, deal_id: int, updates: Dict) -> bool:
+        """Сохраняет правку авто-сделки и перерисовывает только ее строку"""
+        old_row = self.model.car_deals_by_id.get(deal_id)
+        item_id = f"car_{deal_id}"
+        result = self.model.update_car_deal(deal_id, updates)
+        if result is None:
+            if old_row is not None and self.car_tree.exists(item_id):
+                self.car_tree.item(item_id, values=self._car_deal_values(old_row))
+            return False
 
-        additional_investment = max(0, total_expense - self.initial_capital)
-        car_profit = sum(deal.get("header", 0) for deal in self.car_deals)
-        total_profit = car_profit + total_income - additional_investment
+        self.refresh_tab("report", self.refresh_car_rows)
+        return True
 
-        self.summary_labels["initial_capital"].configure(text=f"{self.initial_capital:,.2f} ₽")
-        self.summary_labels["total_income"].configure(text=f"{total_income:,.2f} ₽")
-        self.summary_labels["total_expense"].configure(text=f"{total_expense:,.2f} ₽")
-        self.summary_labels["additional_investment"].configure(text=f"{additional_investment:,.2f} ₽")
-        self.summary_labels["car_profit"].configure(text=f"{car_profit:,.2f} ₽")
-        self.summary_labels["total_profit"].configure(text=f"{total_profit:,.2f} ₽")
+    @timed("ui.update_summary")
+    def update_summary(self):
+        # Итоги - одна строка таблицы totals, ее ведут триггеры базы
+        # (без категорий из excluded_categories и операций с флагом exclude_from_total)
+        summary = compute_summary(self.db.get_totals(), self.initial_capital)
+        for name, value in summary.items():
+            self.summary_labels[name].configure(text=f"{value:,.2f} ₽")
+        self.update_filter_label()
 
     def import_from_excel(self):
         path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx *.xls")])
         if not path:
             return
 
-        try:
-            imported_count = {
-                'transactions': 0,
-                'car_deals': 0
-            }
+        # .xlsx читаем потоково; старый .xls поддерживается только через pandas
+        chunk_size = IMPORT_CHUNK_SIZE if path.lower().endswith(".xlsx") else None
 
-            with pd.ExcelFile(path) as xls:
-                sheet_names = xls.sheet_names
-
-                # Импорт транзакций
-                transaction_sheets = ['Транзакции', 'Transactions']
-                for sheet_name in transaction_sheets:
-                    if sheet_name in sheet_names:
-                        df = pd.read_excel(xls, sheet_name=sheet_name)
-                        print(f"Найдено {len(df)} транзакций в листе {sheet_name}")
-
-                        for index, row in df.iterrows():
-                            try:
-                                # Отладочная информация
-                                print(f"Обрабатываем строку {index}: {dict(row)}")
-
-                                # Обрабатываем разные форматы названий колонок
-                                date_value = row.get("date", row.get("Дата", ""))
-                                if pd.isna(date_value):
-                                    date_value = datetime.now().strftime("%d.%m.%Y %H:%M")
-                                else:
-                                    # Конвертируем дату из Excel в правильный формат
-                                    if isinstance(date_value, datetime):
-                                        date_value = date_value.strftime("%d.%m.%Y %H:%M")
-                                    elif isinstance(date_value, str):
-                                        # Если это строка, оставляем как есть
-                                        pass
-                                    else:
-                                        # Для других типов (например, timestamp)
-                                        date_value = datetime.now().strftime("%d.%m.%Y %H:%M")
-
-                                trans_type = row.get("type", row.get("Тип", "Приход"))
-                                if pd.isna(trans_type):
-                                    trans_type = "Приход"
-
-                                amount = float(row.get("amount", row.get("Сумма", 0)))
-                                if pd.isna(amount):
-                                    amount = 0
-
-                                description = str(row.get("description", row.get("Описание", "")))
-                                if pd.isna(description):
-                                    description = ""
-
-                                category = row.get("category", row.get("Категория", "Другое"))
-                                if pd.isna(category):
-                                    category = "Другое"
-
-                                payment_type = row.get("payment_type", row.get("Тип_оплаты", "Наличные"))
-                                if pd.isna(payment_type):
-                                    payment_type = "Наличные"
-
-                                # Корректируем amount в зависимости от типа
-                                if trans_type == "Расход":
-                                    amount = -abs(amount)
-                                else:
-                                    amount = abs(amount)
-
-                                transaction = {
-                                    "date": str(date_value),
-                                    "type": str(trans_type),
-                                    "amount": amount,
-                                    "description": str(description).strip(),
-                                    "category": str(category),
-                                    "payment_type": str(payment_type)
-                                }
-
-                                print(f"Создана транзакция: {transaction}")
-
-                                if not self.db.exists_transaction(transaction):
-                                    self.db.add_transaction(transaction)
-                                    imported_count['transactions'] += 1
-                                    print(f"Транзакция добавлена: {imported_count['transactions']}")
-                                else:
-                                    print("Транзакция уже существует, пропускаем")
-
-                            except Exception as e:
-                                print(f"Ошибка при импорте транзакции в строке {index}: {e}")
-                                import traceback
-                                traceback.print_exc()
-
-                # Импорт авто-сделок
-                car_sheets = ['Авто-сделки', 'CarDeals']
-                for sheet_name in car_sheets:
-                    if sheet_name in sheet_names:
-                        df = pd.read_excel(xls, sheet_name=sheet_name)
-                        print(f"Найдено {len(df)} авто-сделок в листе {sheet_name}")
-
-                        for index, row in df.iterrows():
-                            try:
-                                brand = str(row.get("brand", row.get("Марка", ""))).strip()
-                                if pd.isna(brand) or not brand:
-                                    continue
-
-                                year = str(row.get("year", row.get("Год", ""))).strip()
-                                if pd.isna(year):
-                                    year = ""
-
-                                vin = str(row.get("vin", row.get("VIN", ""))).strip()
-                                if pd.isna(vin):
-                                    vin = ""
-
-                                price = float(row.get("price", row.get("Цена_продажи", row.get("Цена", 0))))
-                                if pd.isna(price):
-                                    price = 0
-
-                                cost = float(row.get("cost", row.get("Закупочная_стоимость", row.get("Стоимость", 0))))
-                                if pd.isna(cost):
-                                    cost = 0
-
-                                expenses = float(row.get("expenses", row.get("Расходы", 0)))
-                                if pd.isna(expenses):
-                                    expenses = 0
-
-                                profit = float(
-                                    row.get("profit", row.get("Прибыль", row.get("header", price - cost - expenses))))
-                                if pd.isna(profit):
-                                    profit = price - cost - expenses
-
-                                comment = str(row.get("comment", row.get("Комментарий", "")))
-                                if pd.isna(comment):
-                                    comment = ""
-
-                                car_deal = {
-                                    "brand": brand,
-                                    "year": year,
-                                    "vin": vin,
-                                    "price": price,
-                                    "cost": cost,
-                                    "expenses": expenses,
-                                    "header": profit,
-                                    "comment": comment
-                                }
-
-                                print(f"Создана авто-сделка: {car_deal}")
-
-                                if not self.db.exists_car_deal(car_deal):
-                                    self.db.add_car_deal(car_deal)
-                                    imported_count['car_deals'] += 1
-                                    print(f"Авто-сделка добавлена: {imported_count['car_deals']}")
-                                else:
-                                    print("Авто-сделка уже существует, пропускаем")
-
-                            except Exception as e:
-                                print(f"Ошибка при импорте авто-сделки в строке {index}: {e}")
-                                import traceback
-                                traceback.print_exc()
-
-                # Импорт настроек
-                settings_sheets = ['Настройки', 'Settings']
-                for sheet_name in settings_sheets:
-                    if sheet_name in sheet_names:
-                        df = pd.read_excel(xls, sheet_name=sheet_name)
-                        capital_columns = ['initial_capital', 'Стартовый_капитал']
-
-                        for col in capital_columns:
-                            if col in df.columns:
-                                try:
-                                    capital_value = df.iloc[0][col]
-                                    if not pd.isna(capital_value):
-                                        capital = float(capital_value)
-                                        self.db.update_initial_capital(capital)
-                                        self.initial_capital = capital
-                                        print(f"Установлен стартовый капитал: {capital}")
-                                        break
-                                except Exception as e:
-                                    print(f"Ошибка при импорте настроек: {e}")
-
-            # Обновляем данные из базы
-            self.transactions = self.db.get_all_transactions()
-            self.car_deals = self.db.get_all_car_deals()
-            self.initial_capital = self.db.get_initial_capital()
-
-            # Обновление поля капитала
-            self.capital_entry.delete(0, tk.END)
-            self.capital_entry.insert(0, str(self.initial_capital))
-
-            # Полностью обновляем отчёты
-            self.update_report()
-            self.update_monthly_report()
+        def job(db, progress):
+            imported_count = db.import_from_excel(path, chunk_size=chunk_size, progress=progress)
+            # Свежие данные читаем там же, в фоне
+            return imported_count, TrackerModel.fetch(db)
+
+        def on_done(result):
+            imported_count, data = result
+            # Обновляем модель, отчёты и поле капитала
+            self.apply_loaded_data(data)
 
             # Формируем многострочное сообщение для тоста
             message_lines = [
                 "📥 Импорт завершен",
-                f"Транзакций: +{imported_count['transactions']}",
-                f"Авто-сделок: +{imported_count['car_deals']}",
+                f"Транзакций: +{imported_count['transactions']}"
+                f" (дубликатов пропущено: {imported_count['skipped_transactions']})",
+                f"Авто-сделок: +{imported_count['car_deals']}"
+                f" (дубликатов пропущено: {imported_count['skipped_car_deals']})",
                 f"Капитал: {self.initial_capital:,.2f}₽"
             ]
             self.show_toast("\n".join(message_lines), 4000)  # Показываем чуть дольше
 
-        except Exception as e:
+        def on_error(e):
+            if isinstance(e, OperationCancelled):
+                # Уже записанные куски остались в базе - показываем их
+                self.refresh_data(lambda: self.show_toast("⛔ Импорт отменен"))
+                return
             print(f"Общая ошибка импорта: {e}")
-            import traceback
-            traceback.print_exc()
             self.show_toast(f"❌ Ошибка импорта: {str(e)}", toast_type="error")
 
+        self.worker.submit("Импорт из Excel", job, on_done=on_done, on_error=on_error)
+
     def export_to_excel(self):
         path = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
@@ -1654,20 +1657,27 @@ class MoneyTrackerApp:
         if not path:
             return
 
-        try:
-            # Получаем данные месячного отчета
-            monthly_data = self.get_monthly_report_data()
-
-            if self.db.export_to_excel(path, monthly_data):
-                sheets = ["Транзакции", "Авто-сделки", "Настройки"]
-                if monthly_data:
-                    sheets.extend(["Месяц_Ежедневно", "Месяц_Операции", "Месяц_Категории", "Месяц_Инфо"])
+        # Получаем данные месячного отчета (запросы по одному месяцу), файл пишется в фоне
+        monthly_data = self.get_monthly_report_data()
 
+        def on_done(success):
+            if success:
                 self.show_toast("📊 Полный отчет экспортирован в Excel", 3500)
             else:
                 messagebox.showerror("Ошибка", "Не удалось экспортировать данные")
-        except Exception as e:
-            self.show_toast(f"❌ Ошибка экспорта: {str(e)}", toast_type="error")
+
+        def on_error(e):
+            if isinstance(e, OperationCancelled):
+                self.show_toast("⛔ Экспорт отменен")
+            else:
+                self.show_toast(f"❌ Ошибка экспорта: {str(e)}", toast_type="error")
+
+        self.worker.submit(
+            "Экспорт в Excel",
+            lambda db, progress: db.export_to_excel(path, monthly_data, progress=progress),
+            on_done=on_done,
+            on_error=on_error
+        )
 
     def setup_context_menus(self):
         # Контекстное меню для таблицы транзакций
@@ -1706,16 +1716,15 @@ class MoneyTrackerApp:
         if not self.ask_confirmation("Подтверждение", "Вы уверены, что хотите удалить эту транзакцию?"):
             return
 
-        index = int(item.split("_")[1])
-        transaction_id = self.transactions[index]["id"]
-
-        # Удаляем из базы данных
-        cursor = self.db.conn.cursor()
-        cursor.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
-        self.db.conn.commit()
+        transaction_id = int(item.split("_")[1])
 
-        # Обновляем данные и все отчеты
-        self.refresh_data()
+        # Удаляем из базы данных и убираем только эту строку
+        result = self.model.delete_transaction(transaction_id)
+        if result is None:
+            return
+        self.refresh_tab("report", self.refresh_transaction_rows)
+        if self.is_selected_month(result[1]):
+            self.refresh_tab("monthly")
 
         self.show_toast("🗑️ Транзакция удалена")
 
@@ -1731,20 +1740,16 @@ class MoneyTrackerApp:
         if not self.ask_confirmation("Подтверждение", "Вы уверены, что хотите удалить эту авто-сделку?"):
             return
 
-        index = int(item.split("_")[1])
-        deal_id = self.car_deals[index]["id"]
+        deal_id = int(item.split("_")[1])
 
-        # Удаляем из базы данных
-        cursor = self.db.conn.cursor()
-        cursor.execute("DELETE FROM car_deals WHERE id = ?", (deal_id,))
-        self.db.conn.commit()
-
-        # Обновляем данные и все отчеты
-        self.refresh_data()
+        # Удаляем из базы данных и убираем только эту строку
+        if self.model.delete_car_deal(deal_id) is None:
+            return
+        self.refresh_tab("report", self.refresh_car_rows)
 
         self.show_toast("🚗 Авто-сделка удалена")
 
 if __name__ == "__main__":
     root = ctk.CTk()
     app = MoneyTrackerApp(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
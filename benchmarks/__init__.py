@@ -0,0 +1,12 @@
+"""Воспроизводимые замеры DatabaseManager и расчетов отчетов.
+
+Запуск из корня проекта:
+    python -m benchmarks run --sizes 10000 100000 -o results.json
+    python -m benchmarks run --sizes 10000 --baseline baseline.json
+    python -m benchmarks compare results.json baseline.json --threshold 0.25
+    python -m benchmarks startup --runs 5 -o startup.json
+
+Окно приложения не создается: замеры идут через DatabaseManager, ColumnarStore
+и функции compute_summary/build_monthly_report из money_core. Исключение - startup:
+он запускает отдельные процессы python и при наличии дисплея открывает окно.
+"""
@@ -0,0 +1,252 @@
+"""Генератор правдоподобных данных MoneyTracker для нагрузочных проверок.
+
+    python -m benchmarks.generate data.db --transactions 2000000 --car-deals 50000 --seed 7
+    python -m benchmarks.generate data.xlsx --transactions 100000 --years 3
+
+.db/.sqlite - база в схеме DatabaseManager, .xlsx - книга с листами и колонками
+export_to_excel (ее можно загрузить обычным импортом). Данные строятся кусками
+по --chunk строк и пишутся пачками, поэтому память не зависит от объема.
+"""
+import argparse
+import os
+import sys
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from money_core import (DatabaseManager, TRANSACTION_EXPORT_COLUMNS, CAR_DEAL_EXPORT_COLUMNS,
+                        normalize_car_deals_frame)
+
+# Категория: (доля операций, доля приходов, мин. и макс. сумма, описания)
+CATEGORY_PROFILES = {
+    "КЦ": (0.14, 0.6, 1_000, 60_000,
+           ["Оплата лидов КЦ", "Звонки колл-центра", "Обзвон базы", "Бонус КЦ"]),
+    "Реклама": (0.14, 0.0, 2_000, 90_000,
+                ["Авито продвижение", "Яндекс Директ", "Дром поднятие", "Таргет ВК", "Печать листовок"]),
+    "Вед.рекламы": (0.04, 0.0, 10_000, 70_000, ["Ведение рекламы", "Настройка кампаний"]),
+    "Комиссия брок": (0.10, 0.9, 5_000, 150_000,
+                      ["Комиссия по кредиту", "Комиссия страховка КАСКО", "Комиссия ОСАГО"]),
+    "Дилерство": (0.14, 0.8, 20_000, 600_000,
+                  ["Дилерское вознаграждение", "Бонус за объем", "Возврат дилеру"]),
+    "Аренда": (0.05, 0.0, 30_000, 250_000, ["Аренда площадки", "Аренда офиса", "Коммунальные платежи"]),
+    "ЗП окладники": (0.07, 0.0, 30_000, 120_000, ["Зарплата менеджера", "Зарплата администратора", "Аванс"]),
+    "ЗП проценты": (0.07, 0.0, 5_000, 150_000, ["Процент с продаж", "Премия за сделку"]),
+    "Другое": (0.25, 0.25, 100, 25_000,
+               ["Канцелярия", "Бензин", "Мойка", "Хозтовары", "Такси", "Возврат долга", "Связь и интернет"]),
+}
+PAYMENT_TYPES = {"Безнал": 0.6, "Наличные": 0.35, "Другое": 0.05}
+# Доля операций с флагом "исключить из общего расхода"
+EXCLUDED_SHARE = 0.02
+
+# Марка: (WMI - первые три знака VIN, цена нового авто)
+CAR_BRANDS = {
+    "Lada": ("XTA", 900_000), "Kia": ("XWE", 1_900_000), "Hyundai": ("Z94", 1_800_000),
+    "Renault": ("X7L", 1_300_000), "Skoda": ("TMB", 2_100_000), "Volkswagen": ("WVW", 2_400_000),
+    "Toyota": ("JTD", 2_900_000), "BMW": ("WBA", 4_500_000),
+}
+CAR_COMMENTS = ["", "", "", "Трейд-ин", "Кредит", "Битая дверь", "Один владелец", "После ДТП", "Срочный выкуп"]
+# Знаки VIN: латиница без I, O, Q и цифры
+VIN_ALPHABET = np.array(list("ABCDEFGHJKLMNPRSTUVWXYZ0123456789"))
+
+EXCEL_MAX_ROWS = 1_048_575
+DEFAULT_CHUNK = 50_000
+
+
+def transaction_chunks(count: int, seed: int = 0, start: str = "2019-01-01", years: int = 5,
+                       chunk: int = DEFAULT_CHUNK) -> Iterator[pd.DataFrame]:
+    """Операции кусками в колонках листа "Транзакции" (как в export_to_excel) плюс date_iso.
+
+    Даты идут по дням подряд от start на years лет, время - рабочее; тип, сумма и
+    описание зависят от категории (CATEGORY_PROFILES).
+    """
+    rng = np.random.default_rng(seed)
+    first_day = pd.Timestamp(start)
+    days = max(1, (first_day + pd.DateOffset(years=years) - first_day).days)
+    # Строки дат собираются из готовых строк дня и минуты: strftime на каждую строку в разы дольше
+    calendar = first_day + pd.to_timedelta(np.arange(days), unit="D")
+    display_days = np.array(calendar.strftime("%d.%m.%Y "), dtype=object)
+    iso_days = np.array(calendar.strftime("%Y-%m-%d "), dtype=object)
+    clock = np.array([f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(24 * 60)], dtype=object)
+    names = list(CATEGORY_PROFILES)
+    weights = np.array([profile[0] for profile in CATEGORY_PROFILES.values()])
+    payment_names = list(PAYMENT_TYPES)
+    payment_weights = np.array(list(PAYMENT_TYPES.values()))
+
+    for offset in range(0, count, chunk):
+        size = min(chunk, count - offset)
+        index = np.arange(offset, offset + size)
+        day = index * days // count
+        minute = rng.integers(9 * 60, 20 * 60, size)
+
+        categories = rng.choice(len(names), size, p=weights / weights.sum())
+        types = np.empty(size, dtype=object)
+        amounts = np.empty(size)
+        descriptions = np.empty(size, dtype=object)
+        for code, name in enumerate(names):
+            mask = categories == code
+            rows = int(mask.sum())
+            if not rows:
+                continue
+            _, income_share, low, high, texts = CATEGORY_PROFILES[name]
+            income = rng.random(rows) < income_share
+            # Суммы распределены лог-равномерно: мелких операций больше, чем крупных
+            values = np.round(np.exp(rng.uniform(np.log(low), np.log(high), rows)))
+            types[mask] = np.where(income, "Приход", "Расход")
+            amounts[mask] = np.where(income, values, -values)
+            descriptions[mask] = np.array(texts, dtype=object)[rng.integers(0, len(texts), rows)]
+
+        yield pd.DataFrame({
+            "id": index + 1,
+            "Дата": display_days[day] + clock[minute],
+            "Тип": types,
+            "Сумма": amounts,
+            "Описание": descriptions,
+            "Категория": np.array(names, dtype=object)[categories],
+            "Тип_оплаты": rng.choice(payment_names, size, p=payment_weights / payment_weights.sum()),
+            "Исключено_из_расхода": rng.random(size) < EXCLUDED_SHARE,
+            "date_iso": iso_days[day] + clock[minute] + ":00",
+        })
+
+
+def car_deal_chunks(count: int, seed: int = 0, chunk: int = DEFAULT_CHUNK) -> Iterator[pd.DataFrame]:
+    """Авто-сделки кусками в колонках листа "Авто-сделки": VIN по марке, цена с учетом возраста"""
+    rng = np.random.default_rng(seed + 1)
+    brands = list(CAR_BRANDS)
+    wmi = np.array([CAR_BRANDS[brand][0] for brand in brands], dtype=object)
+    new_price = np.array([CAR_BRANDS[brand][1] for brand in brands])
+
+    for offset in range(0, count, chunk):
+        size = min(chunk, count - offset)
+        brand = rng.integers(0, len(brands), size)
+        year = 2024 - np.minimum(rng.geometric(0.15, size) - 1, 19)
+        serial = VIN_ALPHABET[rng.integers(0, len(VIN_ALPHABET), (size, 14))]
+        vins = wmi[brand] + np.array(["".join(row) for row in serial], dtype=object)
+        # Минус ~9% стоимости за год возраста, разброс +-15%
+        cost = np.round(new_price[brand] * 0.91 ** (2024 - year) * rng.uniform(0.85, 1.15, size), -3)
+        price = np.round(cost * rng.uniform(1.02, 1.18, size), -3)
+        expenses = np.round(rng.uniform(0, 80_000, size), -2)
+
+        yield pd.DataFrame({
+            "id": np.arange(offset, offset + size) + 1,
+            "Марка": np.array(brands, dtype=object)[brand],
+            "Год": year.astype(str),
+            "VIN": vins,
+            "Комментарий": rng.choice(CAR_COMMENTS, size),
+            "Цена_продажи": price,
+            "Закупочная_стоимость": cost,
+            "Расходы": expenses,
+            "Прибыль": price - cost - expenses,
+        })
+
+
+def _normalized_transactions(frame: pd.DataFrame) -> pd.DataFrame:
+    """Кусок генератора в колонках normalize_transactions_frame: даты уже разобраны, суммы со знаком"""
+    return pd.DataFrame({
+        "date": frame["Дата"],
+        "date_iso": frame["date_iso"],
+        "type": frame["Тип"],
+        "amount": frame["Сумма"].astype(float),
+        "description": frame["Описание"],
+        "category": frame["Категория"],
+        "payment_type": frame["Тип_оплаты"],
+        "exclude_from_total": frame["Исключено_из_расхода"].astype(int),
+    })
+
+
+def fill_database(db: DatabaseManager, transactions: int, car_deals: int, seed: int = 0,
+                  start: str = "2019-01-01", years: int = 5, chunk: int = DEFAULT_CHUNK, log=None):
+    """Дописывает сгенерированные данные в базу; каждый кусок - одна транзакция (профиль bulk-load)"""
+    with db.profile("bulk-load"):
+        written = 0
+        for frame in transaction_chunks(transactions, seed, start, years, chunk):
+            db.insert_transactions_frame(_normalized_transactions(frame))
+            written += len(frame)
+            if log:
+                log(f"Операции: {written} из {transactions}")
+        written = 0
+        for frame in car_deal_chunks(car_deals, seed, chunk):
+            db.insert_car_deals_frame(normalize_car_deals_frame(frame))
+            written += len(frame)
+            if log:
+                log(f"Авто-сделки: {written} из {car_deals}")
+
+
+def write_workbook(path: str, transactions: int, car_deals: int, seed: int = 0, start: str = "2019-01-01",
+                   years: int = 5, chunk: int = DEFAULT_CHUNK, initial_capital: float = 0.0, log=None):
+    """Пишет книгу с листами "Транзакции", "Авто-сделки" и "Настройки", как export_to_excel"""
+    if max(transactions, car_deals) > EXCEL_MAX_ROWS:
+        raise ValueError(f"В лист Excel помещается не больше {EXCEL_MAX_ROWS} строк")
+    workbook = Workbook(write_only=True)
+    for sheet_name, columns, chunks, total in (
+        ("Транзакции", TRANSACTION_EXPORT_COLUMNS, transaction_chunks(transactions, seed, start, years, chunk),
+         transactions),
+        ("Авто-сделки", CAR_DEAL_EXPORT_COLUMNS, car_deal_chunks(car_deals, seed, chunk), car_deals),
+    ):
+        if not total:
+            continue
+        sheet = workbook.create_sheet(sheet_name)
+        headers = [header for header, _ in columns]
+        sheet.append(headers)
+        written = 0
+        for frame in chunks:
+            for row in frame[headers].itertuples(index=False, name=None):
+                sheet.append([value.item() if isinstance(value, np.generic) else value for value in row])
+            written += len(frame)
+            if log:
+                log(f"{sheet_name}: {written} из {total}")
+    settings = workbook.create_sheet("Настройки")
+    settings.append(["Стартовый_капитал"])
+    settings.append([initial_capital])
+    workbook.save(path)
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.generate", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", help="файл .db/.sqlite или .xlsx")
+    parser.add_argument("--transactions", type=int, default=100_000, help="число операций")
+    parser.add_argument("--car-deals", type=int, default=5_000, help="число авто-сделок")
+    parser.add_argument("--seed", type=int, default=0, help="зерно генератора (одно зерно - одни данные)")
+    parser.add_argument("--start", default="2019-01-01", help="первый день операций (ГГГГ-ММ-ДД)")
+    parser.add_argument("--years", type=int, default=5, help="сколько лет покрывают операции")
+    parser.add_argument("--capital", type=float, default=500_000, help="стартовый капитал")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="строк в одной пачке записи")
+    parser.add_argument("--force", action="store_true", help="перезаписать существующий файл")
+    args = parser.parse_args(argv)
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    extension = os.path.splitext(args.output)[1].lower()
+    if extension not in (".db", ".sqlite", ".sqlite3", ".xlsx"):
+        print(f"Неизвестный формат файла: {args.output} (нужен .db, .sqlite или .xlsx)", file=sys.stderr)
+        return 2
+    if os.path.exists(args.output):
+        if not args.force:
+            print(f"Файл {args.output} уже существует (--force для перезаписи)", file=sys.stderr)
+            return 2
+        os.remove(args.output)
+
+    options = dict(seed=args.seed, start=args.start, years=args.years, chunk=args.chunk, log=log)
+    try:
+        if extension == ".xlsx":
+            write_workbook(args.output, args.transactions, args.car_deals, initial_capital=args.capital,
+                           **options)
+        else:
+            db = DatabaseManager(args.output, profile="bulk-load")
+            try:
+                fill_database(db, args.transactions, args.car_deals, **options)
+                db.update_initial_capital(args.capital)
+                log(f"Записано операций: {db.count_transactions()}, авто-сделок: {db.count_car_deals()}")
+            finally:
+                db.close()
+    except ValueError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
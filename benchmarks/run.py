@@ -0,0 +1,233 @@
+"""Набор замеров: заполнение базы, запросы DatabaseManager, Excel и расчеты отчетов."""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from money_core import (DatabaseManager, ColumnarStore, EXCLUDED_CATEGORIES,
+                        compute_summary, build_monthly_report)
+from benchmarks.generate import fill_database
+from benchmarks.startup import measure_startup, check_budget
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+# Число вызовов в замерах построчных операций
+CALLS = 1000
+# Excel-круг (экспорт + импорт) дорогой - по умолчанию только для баз до этого размера
+EXCEL_MAX_ROWS = 100_000
+# Месяц для замеров месячной сводки: генератор по умолчанию покрывает 2019-2023 годы
+REPORT_YEAR, REPORT_MONTH = 2021, 6
+# Разница меньше этой (секунды) считается шумом и не попадает в регрессии
+MIN_SIGNIFICANT = 0.002
+
+
+def car_deals_for(transactions: int) -> int:
+    """Число авто-сделок для базы с данным числом операций (от 10 до 100 тысяч)"""
+    return min(100_000, max(10_000, transactions // 10))
+
+
+def measure(func: Callable, repeat: int, teardown: Optional[Callable] = None) -> Dict:
+    """Время func() в секундах: минимум и медиана по repeat запускам"""
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        result = func()
+        times.append(perf_counter() - start)
+        if teardown is not None:
+            teardown(result)
+    return {"min": min(times), "median": statistics.median(times), "runs": repeat}
+
+
+def run_size(size: int, workdir: str, repeat: int = 3, excel_max: int = EXCEL_MAX_ROWS,
+             seed: int = 0, log=print, car_deals: Optional[int] = None) -> Dict[str, Dict]:
+    """Все замеры для базы из size операций; возвращает {имя замера: время}"""
+    deals = car_deals_for(size) if car_deals is None else car_deals
+    db = DatabaseManager(os.path.join(workdir, f"bench_{size}.db"))
+    results = {}
+    try:
+        log(f"[{size}] заполнение: {size} операций, {deals} авто-сделок")
+        results["seed"] = measure(lambda: fill_database(db, size, deals, seed), 1)
+
+        def add_transactions():
+            return [db.add_transaction({
+                "date": f"{1 + i % 28:02d}.03.2024 12:00", "type": "Расход", "amount": -(i + 1),
+                "description": f"Замер добавления {i}", "category": "Другое", "payment_type": "Безнал",
+            }) for i in range(CALLS)]
+
+        def remove_added(ids):
+            db.conn.executemany("DELETE FROM transactions WHERE id = ?", [(i,) for i in ids])
+            db.conn.commit()
+
+        results[f"add_transaction_x{CALLS}"] = measure(add_transactions, repeat, remove_added)
+        results["get_all_transactions"] = measure(db.get_all_transactions, repeat)
+        results["get_all_car_deals"] = measure(db.get_all_car_deals, repeat)
+
+        sample = [row.to_dict() for row in db.iter_transactions(limit=CALLS)]
+        results[f"exists_transaction_x{CALLS}"] = measure(
+            lambda: [db.exists_transaction(row) for row in sample], repeat)
+
+        results["monthly_summary_sql"] = measure(
+            lambda: db.get_monthly_summary(REPORT_YEAR, REPORT_MONTH), repeat)
+        columns = ColumnarStore.from_records(db.get_all_transactions())
+        results["columnar_build"] = measure(lambda: ColumnarStore.from_records(db.get_all_transactions()), 1)
+        results["monthly_summary_columnar"] = measure(
+            lambda: columns.monthly_summary(REPORT_YEAR, REPORT_MONTH), repeat)
+        results["totals_columnar"] = measure(lambda: columns.totals(EXCLUDED_CATEGORIES), repeat)
+
+        summary = columns.monthly_summary(REPORT_YEAR, REPORT_MONTH)
+        month = db.get_transactions_for_month(REPORT_YEAR, REPORT_MONTH)
+        categories = db.get_categories()
+        results["monthly_report"] = measure(
+            lambda: build_monthly_report(summary, month, REPORT_YEAR, "Июнь", categories), repeat)
+        results["summary_panel"] = measure(
+            lambda: compute_summary(db.get_totals(), db.get_initial_capital()), repeat)
+        results["rebuild_totals"] = measure(db.rebuild_totals, repeat)
+
+        if size <= excel_max:
+            book = os.path.join(workdir, f"bench_{size}.xlsx")
+            results["excel_export"] = measure(lambda: db.export_to_excel(book), 1)
+            target = DatabaseManager(os.path.join(workdir, f"bench_{size}_import.db"))
+            try:
+                results["excel_import"] = measure(lambda: target.import_from_excel(book), 1)
+            finally:
+                target.close()
+    finally:
+        db.close()
+
+    for name, stats in results.items():
+        log(f"[{size}] {name}: {stats['median']:.4f} с")
+    return results
+
+
+def _meta(repeat: int, seed: int) -> Dict:
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "seed": seed,
+    }
+
+
+def run_suite(sizes: List[int], repeat: int = 3, excel_max: int = EXCEL_MAX_ROWS, seed: int = 0,
+              log=print) -> Dict:
+    """Замеры для каждого размера в отдельной временной базе; результат готов для json.dump"""
+    report = {"meta": _meta(repeat, seed), "results": {}}
+    with tempfile.TemporaryDirectory(prefix="moneytracker_bench_") as workdir:
+        for size in sizes:
+            report["results"][str(size)] = run_size(size, workdir, repeat, excel_max, seed, log)
+    return report
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = 0.25) -> List[Dict]:
+    """Сравнивает медианы с эталоном. status: regression, faster, ok, new (нет в эталоне)"""
+    rows = []
+    for size, benchmarks in current["results"].items():
+        for name, stats in benchmarks.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            row = {"size": size, "name": name, "current": stats["median"], "baseline": None,
+                   "ratio": None, "status": "new"}
+            if base is not None:
+                row["baseline"] = base["median"]
+                row["ratio"] = stats["median"] / base["median"] if base["median"] else None
+                difference = stats["median"] - base["median"]
+                if abs(difference) < MIN_SIGNIFICANT or row["ratio"] is None:
+                    row["status"] = "ok"
+                elif row["ratio"] > 1 + threshold:
+                    row["status"] = "regression"
+                elif row["ratio"] < 1 - threshold:
+                    row["status"] = "faster"
+                else:
+                    row["status"] = "ok"
+            rows.append(row)
+    return rows
+
+
+def print_comparison(rows: List[Dict]):
+    print(f"{'размер':>9} {'замер':<28} {'эталон, с':>11} {'сейчас, с':>11} {'x':>6}  статус")
+    for row in rows:
+        baseline = f"{row['baseline']:.4f}" if row["baseline"] is not None else "-"
+        ratio = f"{row['ratio']:.2f}" if row["ratio"] is not None else "-"
+        mark = "  <-- РЕГРЕССИЯ" if row["status"] == "regression" else ""
+        print(f"{row['size']:>9} {row['name']:<28} {baseline:>11} {row['current']:>11.4f} {ratio:>6}  "
+              f"{row['status']}{mark}")
+
+
+def _load(path: str) -> Dict:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="выполнить замеры")
+    run.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="числа операций в базе")
+    run.add_argument("--repeat", type=int, default=3, help="повторов каждого замера (берется медиана)")
+    run.add_argument("--excel-max", type=int, default=EXCEL_MAX_ROWS,
+                     help="Excel-экспорт и импорт только для баз до этого размера")
+    run.add_argument("--seed", type=int, default=0, help="зерно генератора данных")
+    run.add_argument("-o", "--output", help="файл для результатов JSON (по умолчанию - stdout)")
+    run.add_argument("--baseline", help="сравнить с эталонным JSON после замеров")
+    run.add_argument("--threshold", type=float, default=0.25, help="допустимое замедление (0.25 = 25%%)")
+
+    startup = commands.add_parser("startup", help="время импорта и до первого окна; проверка бюджета")
+    startup.add_argument("--runs", type=int, default=5, help="запусков процесса (берется медиана)")
+    startup.add_argument("--no-window", action="store_true", help="не замерять первое окно")
+    startup.add_argument("-o", "--output", help="файл для результатов JSON (формат как у run)")
+    startup.add_argument("--baseline", help="сравнить с эталонным JSON после замеров")
+    startup.add_argument("--threshold", type=float, default=0.25, help="допустимое замедление (0.25 = 25%%)")
+
+    check = commands.add_parser("compare", help="сравнить два файла результатов")
+    check.add_argument("current")
+    check.add_argument("baseline")
+    check.add_argument("--threshold", type=float, default=0.25, help="допустимое замедление (0.25 = 25%%)")
+
+    args = parser.parse_args(argv)
+    if args.command == "startup":
+        results = measure_startup(args.runs, not args.no_window,
+                                  log=lambda message: print(message, file=sys.stderr))
+        report = {"meta": _meta(args.runs, 0), "results": {"startup": results}}
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        problems = check_budget(report["results"]["startup"])
+        for problem in problems:
+            print(f"БЮДЖЕТ ЗАПУСКА: {problem}")
+        failed = bool(problems)
+        if args.baseline:
+            rows = compare(report, _load(args.baseline), args.threshold)
+            print_comparison(rows)
+            failed = failed or any(row["status"] == "regression" for row in rows)
+        return 1 if failed else 0
+    if args.command == "run":
+        report = run_suite(args.sizes, args.repeat, args.excel_max, args.seed,
+                           log=lambda message: print(message, file=sys.stderr))
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as file:
+                file.write(text)
+        elif not args.baseline:
+            print(text)
+        if not args.baseline:
+            return 0
+        current, baseline = report, _load(args.baseline)
+    else:
+        current, baseline = _load(args.current), _load(args.baseline)
+
+    rows = compare(current, baseline, args.threshold)
+    print_comparison(rows)
+    return 1 if any(row["status"] == "regression" for row in rows) else 0
@@ -0,0 +1,124 @@
+"""Замер запуска: время импорта модулей (-X importtime) и время до первого окна.
+
+Каждый запуск - отдельный процесс python, поэтому меряется холодный старт
+интерпретатора с уже скомпилированным байткодом (как у собранного установщика):
+первый прогон только прогревает __pycache__ и в результат не идет.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули, время импорта которых меряется
+STARTUP_MODULES = ["money_core", "money_cli", "MoneyTracker"]
+# Бюджет, мс (медиана): превышение - код возврата 1. Запас над замером (36, 57 и 144 мс)
+# оставлен только на разброс машин: лишний тяжелый модуль при импорте его превысит
+STARTUP_BUDGET_MS = {
+    "import money_core": 75,
+    "import money_cli": 100,
+    "import MoneyTracker": 250,
+    "first_window": 2500,
+}
+# Эти модули не должны загружаться при импорте: pandas и openpyxl - только при работе
+# с Excel, numpy - только в ColumnarStore модели окна
+DEFERRED_MODULES = ["pandas", "openpyxl", "numpy"]
+
+FIRST_WINDOW_CODE = """
+import customtkinter as ctk
+import MoneyTracker
+root = ctk.CTk()
+app = MoneyTracker.MoneyTrackerApp(root)
+root.update()
+print("ready", flush=True)
+root.destroy()
+"""
+
+
+def _child_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def parse_importtime(stderr: str) -> Dict[str, Dict[str, int]]:
+    """Строки 'import time: self | cumulative | name' -> {модуль: {self, cumulative}} в мкс"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        modules[parts[2].strip()] = {"self": int(parts[0]), "cumulative": int(parts[1])}
+    return modules
+
+
+def import_time(module: str) -> Dict:
+    """Один импорт module в новом процессе: время импорта, топ тяжелых модулей и что загружено"""
+    code = f"import sys, {module}; print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True,
+                            text=True, env=_child_env(), cwd=ROOT, check=True)
+    modules = parse_importtime(result.stderr)
+    heaviest = sorted(((name, stats["cumulative"]) for name, stats in modules.items() if name != module),
+                      key=lambda item: item[1], reverse=True)
+    return {
+        "seconds": modules[module]["cumulative"] / 1e6,
+        "heaviest": heaviest[:5],
+        "deferred_loaded": [name for name in result.stdout.strip().split(",") if name],
+    }
+
+
+def first_window_time() -> Optional[float]:
+    """Секунды от запуска процесса до первой отрисовки окна; None, если нет дисплея"""
+    with tempfile.TemporaryDirectory(prefix="moneytracker_startup_") as workdir:
+        start = perf_counter()
+        result = subprocess.run([sys.executable, "-c", FIRST_WINDOW_CODE], capture_output=True, text=True,
+                                env=_child_env(), cwd=workdir)
+        elapsed = perf_counter() - start
+    if result.returncode != 0 or "ready" not in result.stdout:
+        return None
+    return elapsed
+
+
+def measure_startup(runs: int = 5, window: bool = True, log=print) -> Dict[str, Dict]:
+    """Медианы по runs запускам: {"import <модуль>": ..., "first_window": ...}"""
+    results = {}
+    for module in STARTUP_MODULES:
+        import_time(module)  # прогрев __pycache__
+        samples = [import_time(module) for _ in range(runs)]
+        times = [sample["seconds"] for sample in samples]
+        results[f"import {module}"] = {
+            "min": min(times), "median": statistics.median(times), "runs": runs,
+            "heaviest": samples[-1]["heaviest"], "deferred_loaded": samples[-1]["deferred_loaded"],
+        }
+        log(f"import {module}: {results[f'import {module}']['median'] * 1000:.0f} мс")
+
+    if window:
+        if first_window_time() is None:
+            log("first_window: нет дисплея, замер пропущен")
+        else:
+            times = [first_window_time() for _ in range(runs)]
+            results["first_window"] = {"min": min(times), "median": statistics.median(times), "runs": runs}
+            log(f"first_window: {results['first_window']['median'] * 1000:.0f} мс")
+    return results
+
+
+def check_budget(results: Dict[str, Dict], budget_ms: Dict[str, float] = None) -> List[str]:
+    """Нарушения бюджета: медиана сверх бюджета и тяжелые модули, загруженные при импорте"""
+    budget_ms = STARTUP_BUDGET_MS if budget_ms is None else budget_ms
+    problems = []
+    for name, stats in results.items():
+        limit = budget_ms.get(name)
+        if limit is not None and stats["median"] * 1000 > limit:
+            heaviest = ", ".join(f"{module} {micros / 1000:.0f} мс" for module, micros in stats.get("heaviest", []))
+            problems.append(f"{name}: {stats['median'] * 1000:.0f} мс при бюджете {limit:.0f} мс"
+                            + (f" (тяжелее всего: {heaviest})" if heaviest else ""))
+        if stats.get("deferred_loaded"):
+            problems.append(f"{name}: при импорте загружены {', '.join(stats['deferred_loaded'])}")
+    return problems
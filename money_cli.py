@@ -0,0 +1,154 @@
+"""Командная строка MoneyTracker без окна: импорт, экспорт, отчеты и обслуживание базы.
+
+Запуск из корня проекта:
+    python -m money_cli --db money_tracker.db import data.xlsx
+    python -m money_cli --db money_tracker.db export full.xlsx --year 2025 --month 3
+    python -m money_cli monthly-report --year 2025 --month 3 -o march.xlsx
+    python -m money_cli summary --json
+    python -m money_cli vacuum
+
+tkinter и customtkinter не импортируются - работает на сервере без дисплея.
+Коды возврата: 0 - успех, 1 - операция не удалась, 2 - неверные аргументы или нет базы.
+"""
+import argparse
+import json
+import os
+import sys
+from typing import List, Optional
+
+from money_core import (DatabaseManager, IMPORT_CHUNK_SIZE, MONTH_NAMES, SUMMARY_LABELS,
+                        build_monthly_report, compute_summary, write_monthly_report)
+
+DEFAULT_DB = "money_tracker.db"
+
+
+def _print_json(data):
+    print(json.dumps(data, ensure_ascii=False, indent=2, default=str))
+
+
+def _stderr_progress(done, total=None, message=""):
+    print(message or f"{done} из {total}", file=sys.stderr)
+
+
+def monthly_report_data(db: DatabaseManager, year: int, month: int) -> dict:
+    """Данные месячного отчета, как на вкладке "Месячный отчет" (сводка считается в SQL)"""
+    return build_monthly_report(db.get_monthly_summary(year, month), db.get_transactions_for_month(year, month),
+                                year, MONTH_NAMES[month - 1], db.get_categories())
+
+
+def cmd_import(db: DatabaseManager, args) -> int:
+    # .xlsx читаем потоково, как окно приложения; старый .xls - только через pandas
+    chunk_size = args.chunk or (IMPORT_CHUNK_SIZE if args.file.lower().endswith(".xlsx") else None)
+    result = db.import_from_excel(args.file, chunk_size=chunk_size,
+                                  progress=_stderr_progress if args.progress else None)
+    if args.json:
+        _print_json(result)
+    else:
+        print(f"Транзакций: +{result['transactions']} (дубликатов пропущено: {result['skipped_transactions']})")
+        print(f"Авто-сделок: +{result['car_deals']} (дубликатов пропущено: {result['skipped_car_deals']})")
+        if result['initial_capital'] is not None:
+            print(f"Капитал: {result['initial_capital']:,.2f} ₽")
+    return 0
+
+
+def cmd_export(db: DatabaseManager, args) -> int:
+    if bool(args.year) != bool(args.month):
+        print("--year и --month задаются вместе", file=sys.stderr)
+        return 2
+    monthly_data = monthly_report_data(db, args.year, args.month) if args.year and args.month else None
+    if not db.export_to_excel(args.file, monthly_data, progress=_stderr_progress if args.progress else None):
+        return 1
+    print(f"Сохранено: {args.file}")
+    return 0
+
+
+def cmd_monthly_report(db: DatabaseManager, args) -> int:
+    data = monthly_report_data(db, args.year, args.month)
+    if args.output:
+        write_monthly_report(args.output, data)
+        print(f"Сохранено: {args.output}")
+    elif args.json:
+        _print_json(data)
+    else:
+        info = data['month_info']
+        print(f"{info['Месяц']} {info['Год']}: дней с операциями - {info['Всего_дней_с_операциями']}")
+        print(f"Приход: {info['Общий_приход_руб']}, расход: {info['Общий_расход_руб']}, "
+              f"баланс: {info['Итоговый_баланс_руб']}")
+        for category, stats in data['category_stats'].items():
+            if stats['Сумма']:
+                print(f"  {category:<24} {stats['Тип']:<7} {stats['Сумма_руб']:>20}")
+    return 0
+
+
+def cmd_summary(db: DatabaseManager, args) -> int:
+    summary = compute_summary(db.get_totals(), db.get_initial_capital())
+    counts = {"transactions": db.count_transactions(), "car_deals": db.count_car_deals()}
+    if args.json:
+        _print_json({**summary, **counts})
+        return 0
+    for name, value in summary.items():
+        print(f"{SUMMARY_LABELS[name] + ':':<20} {value:>20,.2f} ₽")
+    print(f"Транзакций: {counts['transactions']}, авто-сделок: {counts['car_deals']}")
+    return 0
+
+
+def cmd_vacuum(db: DatabaseManager, args) -> int:
+    sizes = db.vacuum()
+    print(f"Размер базы: {sizes['before'] / 1024:,.0f} КБ -> {sizes['after'] / 1024:,.0f} КБ")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m money_cli", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"файл базы (по умолчанию {DEFAULT_DB})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("import", help="импорт из Excel (дубликаты пропускаются)")
+    command.add_argument("file")
+    command.add_argument("--chunk", type=int, help="строк в куске потокового импорта .xlsx")
+    command.add_argument("--progress", action="store_true", help="ход импорта в stderr")
+    command.add_argument("--json", action="store_true", help="результат в JSON")
+    command.set_defaults(handler=cmd_import, creates_db=True)
+
+    command = commands.add_parser("export", help="полный экспорт в Excel")
+    command.add_argument("file")
+    command.add_argument("--year", type=int, help="добавить листы месячного отчета за этот год...")
+    command.add_argument("--month", type=int, choices=range(1, 13), metavar="1-12", help="...и месяц")
+    command.add_argument("--progress", action="store_true", help="ход экспорта в stderr")
+    command.set_defaults(handler=cmd_export)
+
+    command = commands.add_parser("monthly-report", help="месячный отчет: в консоль, JSON или Excel")
+    command.add_argument("--year", type=int, required=True)
+    command.add_argument("--month", type=int, required=True, choices=range(1, 13), metavar="1-12")
+    command.add_argument("-o", "--output", help="сохранить отчет в книгу Excel")
+    command.add_argument("--json", action="store_true", help="вывести данные отчета в JSON")
+    command.set_defaults(handler=cmd_monthly_report)
+
+    command = commands.add_parser("summary", help="итоги панели сводки")
+    command.add_argument("--json", action="store_true", help="вывести в JSON")
+    command.set_defaults(handler=cmd_summary)
+
+    command = commands.add_parser("vacuum", help="сжать базу и обновить статистику запросов")
+    command.set_defaults(handler=cmd_vacuum)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if not getattr(args, "creates_db", False) and not os.path.exists(args.db):
+        print(f"База не найдена: {args.db}", file=sys.stderr)
+        return 2
+
+    db = DatabaseManager(args.db)
+    try:
+        return args.handler(db, args)
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2712 @@
+"""Данные MoneyTracker без интерфейса: база SQLite, импорт и экспорт Excel, отчеты.
+
+Модуль не импортирует tkinter и customtkinter: его используют окно приложения
+(MoneyTracker.py), командная строка (money_cli.py) и замеры (benchmarks).
+"""
+from __future__ import annotations
+
+from datetime import datetime, date, timedelta
+import functools
+import hashlib
+import inspect
+import itertools
+import json
+import math
+import os
+import re
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+import sqlite3
+import threading
+from typing import TYPE_CHECKING, List, Dict, Optional
+
+# pandas и openpyxl нужны только импорту, экспорту и отчетам в Excel, numpy - только
+# ColumnarStore: они импортируются внутри функций, чтобы не замедлять запуск окна
+# и командной строки
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+# Формат даты, в котором операции показываются пользователю
+DISPLAY_DATE_FORMAT = "%d.%m.%Y %H:%M"
+# Канонический формат для хранения: строки сортируются так же, как время
+ISO_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Форматы, которые встречаются в старых базах и в Excel-файлах
+INPUT_DATE_FORMATS = (
+    "%d.%m.%Y %H:%M",
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%Y",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d",
+)
+
+
+def to_iso_date(value) -> Optional[str]:
+    """Приводит дату операции к ISO-строке "YYYY-MM-DD HH:MM:SS" (None, если не распознана)"""
+    if isinstance(value, datetime):
+        return value.strftime(ISO_DATE_FORMAT)
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    for fmt in INPUT_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime(ISO_DATE_FORMAT)
+        except ValueError:
+            continue
+    return None
+
+
+def month_bounds(year: int, month: int):
+    """Возвращает полуинтервал [начало, конец) месяца в ISO-формате"""
+    start = f"{year:04d}-{month:02d}-01"
+    if month == 12:
+        end = f"{year + 1:04d}-01-01"
+    else:
+        end = f"{year:04d}-{month + 1:02d}-01"
+    return start, end
+
+
+def iso_to_display_day(iso_value: str) -> str:
+    """'2025-01-31 ...' -> '31.01.2025'"""
+    return f"{iso_value[8:10]}.{iso_value[5:7]}.{iso_value[0:4]}"
+
+
+class Instrumentation:
+    """Счетчики и время вызовов горячих путей: методы DatabaseManager и фазы обновления окна.
+
+    По умолчанию выключено - обертки @timed тогда только проверяют флаг enabled.
+    Включается галочкой в "Настройках" или переменной окружения MONEYTRACKER_TIMINGS=1.
+    count, total и max считаются за все время, p50/p95 - по RECENT_SAMPLES последним вызовам.
+    """
+
+    RECENT_SAMPLES = 1024
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = {"count": 0, "total": 0.0, "max": 0.0,
+                                             "recent": deque(maxlen=self.RECENT_SAMPLES)}
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["recent"].append(seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """with INSTRUMENTATION.timer("фаза"): ... - замер произвольного участка кода"""
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """{имя: {count, total, mean, p50, p95, max}} - время в секундах, по убыванию total"""
+        with self._lock:
+            items = [(name, dict(stats, recent=sorted(stats["recent"]))) for name, stats in self._stats.items()]
+        result = {}
+        for name, stats in sorted(items, key=lambda item: item[1]["total"], reverse=True):
+            recent = stats["recent"]
+            result[name] = {
+                "count": stats["count"],
+                "total": stats["total"],
+                "mean": stats["total"] / stats["count"],
+                "p50": _percentile(recent, 0.50),
+                "p95": _percentile(recent, 0.95),
+                "max": stats["max"],
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def dump(self, path: Optional[str] = None) -> str:
+        """Снимок в JSON; если задан path - еще и записывает его в файл"""
+        text = json.dumps({"created": datetime.now().isoformat(timespec="seconds"),
+                           "enabled": self.enabled, "timings": self.snapshot()},
+                          ensure_ascii=False, indent=2)
+        if path:
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(text)
+        return text
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+INSTRUMENTATION = Instrumentation(enabled=os.environ.get("MONEYTRACKER_TIMINGS") == "1")
+
+
+def timed(name: str):
+    """Декоратор: время каждого вызова попадает в INSTRUMENTATION под именем name"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION.enabled:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                INSTRUMENTATION.record(name, perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def instrument_methods(prefix: str):
+    """Декоратор класса: @timed("prefix.метод") на все методы класса.
+
+    Пропускаются служебные методы и генераторы (в том числе @contextmanager): их вызов
+    только создает объект, а работа идет позже - ее замеряют методы, которые они вызывают.
+    """
+    def decorate(cls):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("__") or not inspect.isfunction(value):
+                continue
+            if inspect.isgeneratorfunction(getattr(value, "__wrapped__", value)):
+                continue
+            setattr(cls, attr, timed(f"{prefix}.{attr}")(value))
+        return cls
+    return decorate
+
+
+# Соответствие колонок Excel (русские заголовки экспорта) внутренним именам
+TRANSACTION_COLUMN_ALIASES = {
+    "Дата": "date",
+    "Тип": "type",
+    "Сумма": "amount",
+    "Описание": "description",
+    "Категория": "category",
+    "Тип_оплаты": "payment_type",
+    "Исключено_из_расхода": "exclude_from_total",
+}
+
+CAR_DEAL_COLUMN_ALIASES = {
+    "Марка": "brand",
+    "Год": "year",
+    "VIN": "vin",
+    "Цена_продажи": "price",
+    "Цена": "price",
+    "Закупочная_стоимость": "cost",
+    "Стоимость": "cost",
+    "Расходы": "expenses",
+    "profit": "header",
+    "Прибыль": "header",
+    "Комментарий": "comment",
+}
+
+# Размер куска для потокового импорта больших книг
+IMPORT_CHUNK_SIZE = 5000
+
+TRANSACTION_SHEETS = ['Транзакции', 'Transactions']
+CAR_DEAL_SHEETS = ['Авто-сделки', 'CarDeals']
+SETTINGS_SHEETS = ['Настройки', 'Settings']
+CAPITAL_COLUMNS = ['initial_capital', 'Стартовый_капитал']
+
+
+def _apply_column_aliases(df: pd.DataFrame, aliases: Dict) -> pd.DataFrame:
+    """Переименовывает колонки по словарю; английское имя, если оно уже есть, имеет приоритет"""
+    renames = {}
+    for alias, name in aliases.items():
+        if alias in df.columns and name not in df.columns and name not in renames.values():
+            renames[alias] = name
+    return df.rename(columns=renames)
+
+
+def _text_column(df: pd.DataFrame, name: str, default: str) -> pd.Series:
+    import pandas as pd
+    if name not in df.columns:
+        return pd.Series(default, index=df.index, dtype=object)
+    return df[name].where(df[name].notna(), default).astype(str)
+
+
+def _number_column(df: pd.DataFrame, name: str) -> pd.Series:
+    import pandas as pd
+    if name not in df.columns:
+        return pd.Series(float("nan"), index=df.index)
+    return pd.to_numeric(df[name], errors="coerce")
+
+
+# Написания флага "Исключено_из_расхода" в книгах, заполненных вручную (без регистра)
+TRUE_FLAG_VALUES = {"true", "1", "да", "д", "yes", "y", "истина", "+"}
+
+
+def _flag_column(df: pd.DataFrame, name: str) -> pd.Series:
+    """Флаг 0/1: bool, ненулевое число или написание из TRUE_FLAG_VALUES - 1, все прочее - 0.
+
+    astype(bool) не годится: любая непустая строка, в том числе "False", "0" и "Нет", дает True.
+    """
+    import pandas as pd
+    if name not in df.columns:
+        return pd.Series(0, index=df.index)
+    values = df[name].astype(object)
+    numeric = pd.to_numeric(values, errors="coerce").fillna(0).ne(0)
+    text = values.map(lambda value: str(value).strip().lower(), na_action="ignore")
+    return (numeric | text.isin(TRUE_FLAG_VALUES)).astype(int)
+
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    """Разбирает колонку дат целиком, перебирая известные форматы"""
+    import pandas as pd
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    text = values.where(values.notna()).astype(object).map(str, na_action="ignore")
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    for fmt in INPUT_DATE_FORMATS:
+        missing = parsed.isna() & text.notna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(text[missing], format=fmt, errors="coerce")
+    return parsed
+
+
+def normalize_transactions_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Приводит лист транзакций к колонкам таблицы transactions (по колонкам, без цикла по строкам)"""
+    import pandas as pd
+    df = _apply_column_aliases(df, TRANSACTION_COLUMN_ALIASES)
+    now = datetime.now().strftime(DISPLAY_DATE_FORMAT)
+
+    raw_dates = df["date"] if "date" in df.columns else pd.Series(None, index=df.index, dtype=object)
+    parsed = _parse_dates(raw_dates)
+    # Строки оставляем как есть, значения дат Excel приводим к формату отображения
+    is_text = raw_dates.map(type) == str
+    dates = raw_dates.where(is_text, parsed.dt.strftime(DISPLAY_DATE_FORMAT))
+    dates = dates.where(dates.notna(), now)
+    dates_iso = parsed.dt.strftime(ISO_DATE_FORMAT)
+    dates_iso = dates_iso.where(parsed.notna(), None)
+    # Пустая дата означает "сейчас" - так же, как при ручном добавлении
+    dates_iso = dates_iso.where(raw_dates.notna(), to_iso_date(now))
+
+    types = _text_column(df, "type", "Приход")
+    amounts = _number_column(df, "amount").fillna(0).abs()
+    amounts = amounts.where(types != "Расход", -amounts)
+
+    return pd.DataFrame({
+        "date": dates.astype(str),
+        "date_iso": dates_iso,
+        "type": types,
+        "amount": amounts.astype(float),
+        "description": _text_column(df, "description", "").str.strip(),
+        "category": _text_column(df, "category", "Другое"),
+        "payment_type": _text_column(df, "payment_type", "Наличные"),
+        "exclude_from_total": _flag_column(df, "exclude_from_total"),
+    })
+
+
+def normalize_car_deals_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Приводит лист авто-сделок к колонкам таблицы car_deals; строки без марки отбрасываются"""
+    import pandas as pd
+    df = _apply_column_aliases(df, CAR_DEAL_COLUMN_ALIASES)
+
+    years = df["year"] if "year" in df.columns else pd.Series("", index=df.index, dtype=object)
+    numeric_years = pd.to_numeric(years, errors="coerce")
+    # Год из Excel часто приходит числом (2021.0) - возвращаем ему вид "2021"
+    whole_years = numeric_years.notna() & (numeric_years % 1 == 0)
+    years = years.where(years.notna(), "").astype(object)
+    years[whole_years] = numeric_years[whole_years].astype("int64").astype(str)
+
+    price = _number_column(df, "price").fillna(0)
+    cost = _number_column(df, "cost").fillna(0)
+    expenses = _number_column(df, "expenses").fillna(0)
+    header = _number_column(df, "header")
+    header = header.where(header.notna(), price - cost - expenses)
+
+    result = pd.DataFrame({
+        "brand": _text_column(df, "brand", "").str.strip(),
+        "year": years.astype(str).str.strip(),
+        "vin": _text_column(df, "vin", "").str.strip(),
+        "comment": _text_column(df, "comment", ""),
+        "price": price.astype(float),
+        "cost": cost.astype(float),
+        "expenses": expenses.astype(float),
+        "header": header.astype(float),
+    })
+    return result[result["brand"] != ""]
+
+
+# Размер пачки строк, которую экспорт читает из курсора за раз
+EXPORT_BATCH_SIZE = 5000
+
+# Заголовки листов экспорта (те же, что ждет импорт) и преобразование значений
+TRANSACTION_EXPORT_COLUMNS = [
+    ("id", None),
+    ("Дата", None),
+    ("Тип", None),
+    ("Сумма", None),
+    ("Описание", None),
+    ("Категория", None),
+    ("Тип_оплаты", None),
+    ("Исключено_из_расхода", bool),
+]
+
+CAR_DEAL_EXPORT_COLUMNS = [
+    ("id", None),
+    ("Марка", None),
+    ("Год", None),
+    ("VIN", None),
+    ("Комментарий", None),
+    ("Цена_продажи", None),
+    ("Закупочная_стоимость", None),
+    ("Расходы", None),
+    ("Прибыль", None),
+]
+
+
+def _excel_value(value):
+    """Значение ячейки; вложенные структуры пишутся строкой, как это делал pandas"""
+    if isinstance(value, (dict, list, tuple)):
+        return str(value)
+    return value
+
+
+def _write_rows_sheet(workbook, sheet_name: str, rows: List[Dict]):
+    """Пишет список словарей в лист книги write_only (заголовки - ключи первой строки)"""
+    sheet = workbook.create_sheet(sheet_name)
+    headers = list(rows[0].keys())
+    sheet.append(headers)
+    for row in rows:
+        sheet.append([_excel_value(row.get(header)) for header in headers])
+
+
+# Подписи показателей compute_summary в порядке панели сводки
+SUMMARY_LABELS = {
+    'initial_capital': "Стартовый капитал",
+    'total_income': "Общий приход",
+    'total_expense': "Общий расход",
+    'additional_investment': "Доп. вложения",
+    'car_profit': "Прибыль с авто",
+    'total_profit': "Общая прибыль",
+}
+
+
+def compute_summary(totals: Dict, initial_capital: float) -> Dict:
+    """Показатели панели сводки из строки totals (DatabaseManager.get_totals).
+
+    Возвращает initial_capital, total_income, total_expense, additional_investment,
+    car_profit и total_profit; расход - по модулю, доп. вложения - расход сверх капитала.
+    """
+    total_income = totals['total_income']
+    total_expense = abs(totals['expense_sum'])
+    additional_investment = max(0, total_expense - initial_capital)
+    car_profit = totals['car_profit']
+    return {
+        'initial_capital': initial_capital,
+        'total_income': total_income,
+        'total_expense': total_expense,
+        'additional_investment': additional_investment,
+        'car_profit': car_profit,
+        'total_profit': car_profit + total_income - additional_investment,
+    }
+
+
+MONTH_NAMES = ["Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+               "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"]
+
+
+def build_monthly_report(summary: Dict, transactions: List[Dict], year: int, month_name: str,
+                         categories: List[str]) -> Dict:
+    """Данные месячного отчета для write_monthly_report.
+
+    summary - результат monthly_summary (ColumnarStore или DatabaseManager), transactions -
+    операции месяца. Виджеты не нужны, поэтому отчет можно собрать и без окна.
+    """
+    total_income = summary['total_income']
+    total_expense = summary['total_expense']
+
+    # Детализация операций за месяц
+    all_daily_details = []
+    for transaction in transactions:
+        all_daily_details.append({
+            'Дата': transaction['date'],
+            'День': iso_to_display_day(transaction['date_iso']),
+            'Тип': transaction['type'],
+            'Описание': transaction['description'],
+            'Категория': transaction['category'],
+            'Тип_оплаты': transaction['payment_type'] or "Наличные",
+            'Сумма': abs(transaction['amount']),
+            'Сумма_руб': f"{abs(transaction['amount']):,.2f} ₽"
+        })
+
+    # Формируем ежедневную сводку
+    daily_summary = []
+    for data in summary['days']:
+        balance = data['income'] - data['expense']
+
+        daily_summary.append({
+            'Дата': iso_to_display_day(data['day']),
+            'Приход': data['income'],
+            'Расход': data['expense'],
+            'Баланс': balance,
+            'Количество_операций': data['count'],
+            'Приход_руб': f"{data['income']:,.2f} ₽",
+            'Расход_руб': f"{data['expense']:,.2f} ₽",
+            'Баланс_руб': f"{balance:,.2f} ₽"
+        })
+
+    # Информация о месяце
+    month_info = {
+        'Год': year,
+        'Месяц': month_name,
+        'Всего_дней_с_операциями': len(daily_summary),
+        'Общий_приход': total_income,
+        'Общий_расход': total_expense,
+        'Итоговый_баланс': total_income - total_expense,
+        'Общий_приход_руб': f"{total_income:,.2f} ₽",
+        'Общий_расход_руб': f"{total_expense:,.2f} ₽",
+        'Итоговый_баланс_руб': f"{total_income - total_expense:,.2f} ₽"
+    }
+
+    # Преобразуем статистику по категориям в удобный формат
+    formatted_category_stats = {}
+    for category in categories:
+        amount = summary['categories'].get(category, 0)
+        formatted_category_stats[category] = {
+            'Сумма': abs(amount),
+            'Сумма_руб': f"{abs(amount):,.2f} ₽",
+            'Тип': 'Расход' if amount > 0 else 'Приход'
+        }
+
+    return {
+        'daily_summary': daily_summary,
+        'daily_details': all_daily_details,
+        'category_stats': formatted_category_stats,
+        'month_info': month_info
+    }
+
+
+def write_monthly_report(file_path: str, monthly_data: Dict):
+    """Сохраняет месячный отчет (результат build_monthly_report) в отдельную книгу Excel"""
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    # Ежедневная сводка
+    if 'daily_summary' in monthly_data and monthly_data['daily_summary']:
+        _write_rows_sheet(workbook, "Ежедневная_сводка", monthly_data['daily_summary'])
+    # Детализация операций
+    if 'daily_details' in monthly_data and monthly_data['daily_details']:
+        _write_rows_sheet(workbook, "Детализация_операций", monthly_data['daily_details'])
+    # Статистика по категориям
+    if 'category_stats' in monthly_data and monthly_data['category_stats']:
+        _write_rows_sheet(workbook, "Статистика_по_категориям", [
+            {'Категория': category, 'Сумма': stats}
+            for category, stats in monthly_data['category_stats'].items()
+        ])
+    # Общая информация
+    if 'month_info' in monthly_data:
+        _write_rows_sheet(workbook, "Общая_информация", [monthly_data['month_info']])
+    workbook.save(file_path)
+
+
+def iter_sheet_chunks(worksheet, chunk_size: int):
+    """Читает лист openpyxl (read_only) кусками по chunk_size строк в виде DataFrame.
+
+    Первая строка листа - заголовки. В памяти одновременно находится не больше
+    одного куска, поэтому расход памяти не зависит от размера файла.
+    """
+    import pandas as pd
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = [str(name) if name is not None else f"_{i}" for i, name in enumerate(header)]
+    width = len(columns)
+
+    chunk = []
+    for row in rows:
+        if all(value is None for value in row):
+            continue
+        row = tuple(row[:width]) + (None,) * (width - len(row))
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield pd.DataFrame.from_records(chunk, columns=columns)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame.from_records(chunk, columns=columns)
+
+
+def read_initial_capital(df: pd.DataFrame) -> Optional[float]:
+    """Стартовый капитал из листа настроек (None, если его там нет)"""
+    import pandas as pd
+    for col in CAPITAL_COLUMNS:
+        if col in df.columns and len(df) > 0:
+            value = pd.to_numeric(df.iloc[0][col], errors="coerce")
+            if not pd.isna(value):
+                return float(value)
+    return None
+
+
+FINGERPRINT_FIELDS = ("type", "amount", "description", "category", "payment_type")
+
+
+def transaction_fingerprint(transaction: Dict) -> str:
+    """Хэш содержимого операции: день, тип, сумма, описание, категория, тип оплаты"""
+    date_iso = transaction.get("date_iso") or to_iso_date(transaction["date"])
+    key = "\x1f".join((
+        date_iso[:10] if date_iso else str(transaction["date"]).strip(),
+        str(transaction["type"]),
+        f"{round(float(transaction['amount']), 2):.2f}",
+        str(transaction["description"]),
+        str(transaction["category"]),
+        str(transaction.get("payment_type", "Наличные")),
+    ))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def transaction_fingerprints(df: pd.DataFrame) -> pd.Series:
+    """То же, что transaction_fingerprint, но для нормализованного листа целиком"""
+    days = df["date_iso"].astype(object).str[:10]
+    days = days.where(days.notna(), df["date"].astype(str).str.strip())
+    keys = (days + "\x1f" + df["type"].astype(str) + "\x1f"
+            + df["amount"].astype(float).round(2).map("{:.2f}".format) + "\x1f"
+            + df["description"].astype(str) + "\x1f" + df["category"].astype(str) + "\x1f"
+            + df["payment_type"].astype(str))
+    return keys.map(lambda key: hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+
+def _car_deal_keys(df: pd.DataFrame) -> pd.Series:
+    return (df["brand"].astype(str) + "\x1f" + df["year"].astype(str) + "\x1f" + df["vin"].astype(str)
+            + "\x1f" + df["price"].fillna(0).astype(float).round(2).map("{:.2f}".format) + "\x1f"
+            + df["cost"].fillna(0).astype(float).round(2).map("{:.2f}".format))
+
+
+# Категории, которые не учитываются в общем приходе/расходе (начальное значение
+# флага categories.excluded)
+EXCLUDED_CATEGORIES = ["ЗП окладники", "ЗП проценты", "Комиссия брок"]
+
+# Справочники: колонка операции -> (таблица, начальные значения в порядке показа).
+# В transactions хранится <колонка>_id, имена отдает представление transactions_view
+LOOKUP_TABLES = {
+    "type": ("transaction_types", ["Приход", "Расход"]),
+    "category": ("categories", ["КЦ", "Реклама", "Вед.рекламы", "Комиссия брок", "Дилерство", "Аренда",
+                                "ЗП окладники", "ЗП проценты", "Другое"]),
+    "payment_type": ("payment_types", ["Наличные", "Безнал", "Другое"]),
+}
+
+# Вклад строки в итоги; {row} - NEW или OLD внутри триггера. Справочники читаются
+# поиском по первичному ключу - это дешевле, чем подзапрос IN на каждую строку
+_COUNTED_TRANSACTION = """(COALESCE({row}.exclude_from_total, 0) = 0
+    AND (SELECT excluded FROM categories WHERE id = {row}.category_id) = 0)"""
+_TYPE_NAME = "(SELECT name FROM transaction_types WHERE id = {row}.type_id)"
+_INCOME_DELTA = ("CASE WHEN " + _TYPE_NAME + " = 'Приход' AND "
+                 + _COUNTED_TRANSACTION + " THEN {row}.amount ELSE 0 END")
+_EXPENSE_DELTA = ("CASE WHEN " + _TYPE_NAME + " = 'Расход' AND "
+                  + _COUNTED_TRANSACTION + " THEN {row}.amount ELSE 0 END")
+
+# Версия производных объектов схемы: триггеров, представлений и индексов фильтра.
+# Увеличивается при любом изменении их текста - тогда при открытии они пересоздаются
+# и версия записывается в PRAGMA user_version; открытие актуальной базы схему не переписывает
+SCHEMA_VERSION = 2
+
+TOTALS_TRIGGERS = {
+    "trg_transactions_totals_insert": """
+        AFTER INSERT ON transactions BEGIN
+            UPDATE totals SET total_income = total_income + {income_new},
+                              expense_sum = expense_sum + {expense_new};
+        END""",
+    "trg_transactions_totals_delete": """
+        AFTER DELETE ON transactions BEGIN
+            UPDATE totals SET total_income = total_income - {income_old},
+                              expense_sum = expense_sum - {expense_old};
+        END""",
+    "trg_transactions_totals_update": """
+        AFTER UPDATE OF type_id, amount, category_id, exclude_from_total ON transactions BEGIN
+            UPDATE totals SET total_income = total_income - {income_old} + {income_new},
+                              expense_sum = expense_sum - {expense_old} + {expense_new};
+        END""",
+    "trg_car_deals_totals_insert": """
+        AFTER INSERT ON car_deals BEGIN
+            UPDATE totals SET car_profit = car_profit + COALESCE(NEW.header, 0);
+        END""",
+    "trg_car_deals_totals_delete": """
+        AFTER DELETE ON car_deals BEGIN
+            UPDATE totals SET car_profit = car_profit - COALESCE(OLD.header, 0);
+        END""",
+    "trg_car_deals_totals_update": """
+        AFTER UPDATE OF header ON car_deals BEGIN
+            UPDATE totals SET car_profit = car_profit - COALESCE(OLD.header, 0) + COALESCE(NEW.header, 0);
+        END""",
+}
+
+# Полнотекстовый поиск: индекс FTS5 -> (таблица, колонки). Индексы с внешним
+# содержимым - текст хранится только в самой таблице, триггеры держат индекс в актуальном виде
+SEARCH_INDEXES = {
+    "transactions_fts": ("transactions", ["description"]),
+    "car_deals_fts": ("car_deals", ["brand", "vin", "comment"]),
+}
+
+# Результатов поиска на одну таблицу
+SEARCH_LIMIT = 50
+# Пауза в наборе (мс), после которой запускается поиск
+SEARCH_DELAY_MS = 250
+
+# Значение фильтра отчета "без условия" и варианты отбора по флагу exclude_from_total
+FILTER_ANY = "Все"
+EXCLUSION_FILTER_VALUES = {"Учитываемые": False, "Исключенные": True}
+
+
+def _search_triggers(index: str) -> Dict[str, str]:
+    """Триггеры, которые повторяют вставки, удаления и правки таблицы в индексе FTS5"""
+    table, columns = SEARCH_INDEXES[index]
+    names = ", ".join(columns)
+    new_values = ", ".join(f"NEW.{column}" for column in columns)
+    old_values = ", ".join(f"OLD.{column}" for column in columns)
+    delete = f"INSERT INTO {index} ({index}, rowid, {names}) VALUES ('delete', OLD.id, {old_values});"
+    insert = f"INSERT INTO {index} (rowid, {names}) VALUES (NEW.id, {new_values});"
+    return {
+        f"trg_{index}_insert": f"AFTER INSERT ON {table} BEGIN {insert} END",
+        f"trg_{index}_delete": f"AFTER DELETE ON {table} BEGIN {delete} END",
+        f"trg_{index}_update": f"AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END",
+    }
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Строка поиска -> запрос FTS5: каждое слово как префикс, все слова обязательны.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 (AND, NEAR, *, -) в тексте
+    пользователя не ломают запрос. Пустая строка -> None.
+    """
+    terms = [term.replace('"', '') for term in text.split()]
+    terms = [f'"{term}"*' for term in terms if term]
+    return " ".join(terms) or None
+
+
+class Record:
+    """Компактная строка таблицы: поля в __slots__ вместо словаря на каждую строку.
+
+    Поддерживает доступ как к словарю (row["amount"], get, keys, items, dict(row)),
+    чтобы старый код работал без изменений; в циклах по отчетам быстрее row.amount.
+    """
+
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.FIELDS, values):
+            setattr(self, name, value)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.FIELDS else default
+
+    def keys(self):
+        return self.FIELDS
+
+    def values(self):
+        return [getattr(self, name) for name in self.FIELDS]
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.FIELDS]
+
+    def to_dict(self) -> Dict:
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return type(self) is type(other) and self.values() == other.values()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class TransactionRecord(Record):
+    # Отпечаток в памяти не держим: он нужен только базе (см. get_duplicate_transactions)
+    FIELDS = ("id", "date", "type", "amount", "description", "category", "payment_type",
+              "exclude_from_total", "date_iso")
+    __slots__ = FIELDS
+
+    def __init__(self, id, date, type, amount, description, category, payment_type,
+                 exclude_from_total, date_iso):
+        self.id = id
+        self.date = date
+        self.type = type
+        self.amount = amount
+        self.description = description
+        self.category = category
+        self.payment_type = payment_type
+        self.exclude_from_total = exclude_from_total
+        self.date_iso = date_iso
+
+
+class CarDealRecord(Record):
+    FIELDS = ("id", "brand", "year", "vin", "comment", "price", "cost", "expenses", "header")
+    __slots__ = FIELDS
+
+    def __init__(self, id, brand, year, vin, comment, price, cost, expenses, header):
+        self.id = id
+        self.brand = brand
+        self.year = year
+        self.vin = vin
+        self.comment = comment
+        self.price = price
+        self.cost = cost
+        self.expenses = expenses
+        self.header = header
+
+
+# Повторяющиеся строки (тип, категория, способ оплаты, марка, год) хранятся в одном
+# экземпляре; setdefault работает и для None, и быстрее вызова функции на каждое поле
+_interned = {}
+_intern = _interned.setdefault
+
+
+def _transaction_records(rows) -> List[TransactionRecord]:
+    intern = _intern
+    return [TransactionRecord(row[0], row[1], intern(row[2], row[2]), row[3], row[4],
+                              intern(row[5], row[5]), intern(row[6], row[6]), bool(row[7]), row[8])
+            for row in rows]
+
+
+def _car_deal_records(rows) -> List[CarDealRecord]:
+    intern = _intern
+    return [CarDealRecord(row[0], intern(row[1], row[1]), intern(row[2], row[2]), row[3], row[4],
+                          row[5], row[6], row[7], row[8])
+            for row in rows]
+
+
+# Порядок колонок задан явно: в старых базах expenses добавлена в конец таблицы
+CAR_DEAL_SELECT = "SELECT id, brand, year, vin, comment, price, cost, expenses, header FROM car_deals"
+
+
+def transaction_key(row: TransactionRecord) -> tuple:
+    """Ключ транзакции для iter_transactions: позиция в порядке (date_iso, id)"""
+    return row.date_iso, row.id
+
+
+def car_deal_key(row: CarDealRecord) -> tuple:
+    """Ключ авто-сделки для iter_car_deals: позиция в порядке (year, id)"""
+    return row.year, row.id
+
+
+def _keyset_page(select, column: str, after: Optional[tuple], limit: int, direction: str) -> List[Dict]:
+    """Страница после ключа after = (значение column, id) при сортировке (column, id).
+
+    Строки без значения (NULL) SQLite ставит в конец при DESC и в начало при ASC,
+    а сравнение кортежей с NULL ложно, поэтому порядок делится на два участка -
+    NULL и не NULL - и каждый читается своим запросом по тому же индексу.
+    """
+    if direction not in ("asc", "desc"):
+        raise ValueError(f"Неизвестное направление: {direction}")
+    order, cmp = ("DESC", "<") if direction == "desc" else ("ASC", ">")
+    nulls = (f"{column} IS NULL", ())
+    values = (f"{column} IS NOT NULL", ())
+
+    if after is None:
+        segments = [values, nulls] if direction == "desc" else [nulls, values]
+    elif after[0] is None:
+        rest_of_nulls = (f"{column} IS NULL AND id {cmp} ?", (after[1],))
+        segments = [rest_of_nulls] if direction == "desc" else [rest_of_nulls, values]
+    else:
+        rest_of_values = (f"({column}, id) {cmp} (?, ?)", tuple(after))
+        segments = [rest_of_values, nulls] if direction == "desc" else [rest_of_values]
+
+    rows = []
+    for where, params in segments:
+        if len(rows) >= limit:
+            break
+        rows += select(f"WHERE {where}", params, limit - len(rows), order=order)
+    return rows
+
+
+def _keyset_batches(fetch, key, batch_size: int, direction: str):
+    after = None
+    while True:
+        batch = fetch(after=after, limit=batch_size, direction=direction)
+        if not batch:
+            return
+        yield batch
+        after = key(batch[-1])
+
+
+# Индексы (колонка, date_iso) для TransactionFilter: отбор по справочнику - поиск по диапазону,
+# при одном значении строки сразу идут в порядке даты (id в индексе есть всегда). Индексы
+# узкие: каждый дописывается при любой вставке, а массовый импорт и генератор пишут миллионы
+# строк. Флаг exclude_from_total почти не отсекает строки - он проверяется по таблице
+FILTER_INDEXES = {
+    "idx_transactions_type_date": "type_id",
+    "idx_transactions_category_date": "category_id",
+    "idx_transactions_payment_date": "payment_type_id",
+}
+# Прежние индексы фильтра, которые удаляются при смене SCHEMA_VERSION
+RETIRED_INDEXES = ["idx_transactions_excluded_date"]
+
+
+class TransactionFilter:
+    """Условия отбора операций для отчета; DatabaseManager.compile_filter переводит их в SQL.
+
+    date_from/date_to - полуинтервал [date_from, date_to) по date_iso ("2025-01-01");
+    types, categories, payment_types - допустимые имена из справочников (пусто - любые);
+    exclude_from_total - True/False для отбора по флагу, None - без условия.
+    """
+
+    def __init__(self, date_from: Optional[str] = None, date_to: Optional[str] = None, types=(),
+                 categories=(), payment_types=(), exclude_from_total: Optional[bool] = None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.types = list(types)
+        self.categories = list(categories)
+        self.payment_types = list(payment_types)
+        self.exclude_from_total = exclude_from_total
+
+    def is_empty(self) -> bool:
+        return (self.date_from is None and self.date_to is None and not self.types and not self.categories
+                and not self.payment_types and self.exclude_from_total is None)
+
+    def __eq__(self, other):
+        return isinstance(other, TransactionFilter) and self.__dict__ == other.__dict__
+
+    def __repr__(self):
+        return f"TransactionFilter({self.__dict__})"
+
+
+# Профили подключения SQLite. journal_mode задается только при открытии базы,
+# остальное можно временно переключить через DatabaseManager.profile()
+SQLITE_PROFILES = {
+    # Окно приложения: WAL без fsync на каждый commit, умеренный кэш
+    "interactive": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,          # ~16 МБ
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+        "query_only": 0,
+    },
+    # Импорт: без fsync, большой кэш; при сбое питания теряется только последний импорт
+    "bulk-load": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -131072,         # ~128 МБ
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 30000,
+        "query_only": 0,
+    },
+    # Отчеты и экспорт: только чтение, большой кэш и mmap
+    "reporting": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,          # ~64 МБ
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+        "query_only": 1,
+    },
+}
+
+_SYNCHRONOUS_NAMES = {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}
+_TEMP_STORE_NAMES = {0: "DEFAULT", 1: "FILE", 2: "MEMORY"}
+
+
+class OperationCancelled(Exception):
+    """Долгая операция прервана пользователем (бросается из обработчика прогресса)"""
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """Текст запроса для сводки: литералы -> ?, списки (?, ?, ...) -> (?...), пробелы схлопнуты"""
+    text = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    text = re.sub(r"(?<![\w.])-?\d+(?:\.\d+)?\b", "?", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?...)", text)
+
+
+def parameters_shape(parameters) -> str:
+    """Форма параметров без значений: (str, int×3, NoneType) или {name: str}"""
+    if not parameters:
+        return "()"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    groups = [(name, len(list(run))) for name, run in itertools.groupby(type(value).__name__ for value in parameters)]
+    return "(" + ", ".join(name if count == 1 else f"{name}×{count}" for name, count in groups) + ")"
+
+
+class QueryTracer:
+    """Трассировка SQL подключений DatabaseManager (включается явно, по умолчанию выключена).
+
+    Каждый запрос через курсор подключения замеряется (execute и fetch*) и сводится по
+    нормализованному тексту. Для каждого нового текста один раз снимается EXPLAIN QUERY PLAN,
+    поэтому полный просмотр таблицы виден в отчете, даже если на маленькой базе запрос быстрый.
+    Запросы дольше threshold_ms пишутся в журнал slow (форма параметров, время, план), а если
+    задан log(message) - еще и туда; по умолчанию трассировщик ничего не выводит.
+    Значения параметров не сохраняются.
+    """
+
+    SLOW_LOG_SIZE = 200
+    PLANNED = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+    def __init__(self, threshold_ms: float = 50.0, log=None):
+        self.threshold = threshold_ms / 1000
+        self.log = log
+        self.slow = deque(maxlen=self.SLOW_LOG_SIZE)
+        self._stats = {}
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def begin(self, conn, sql: str, parameters, many: bool = False) -> "_TracedExecution":
+        return _TracedExecution(self, conn, sql, parameters, many)
+
+    def end(self, execution: "_TracedExecution") -> "_TracedExecution":
+        execution.elapsed = perf_counter() - execution.start
+        # Все, что выполнилось сверх самих запросов: триггеры и служебные запросы FTS
+        execution.substatements = max(0, execution.conn.traced_statements - execution.first_statement
+                                      - execution.rows)
+        key = normalize_sql(execution.sql)
+        execution.key = key
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plans[key] = self.explain(execution.conn, execution.sql, execution.parameters)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {"sql": key, "count": 0, "rows": 0, "total": 0.0, "max": 0.0,
+                                            "slow": 0, "substatements": 0}
+            stats["count"] += 1
+            stats["rows"] += execution.rows
+            stats["total"] += execution.elapsed
+            stats["max"] = max(stats["max"], execution.elapsed)
+            stats["substatements"] += execution.substatements
+        self._check_slow(execution)
+        return execution
+
+    def add_fetch(self, execution: "_TracedExecution", seconds: float):
+        """Время выборки строк (fetchall и т.п.) добавляется к запросу, который их вернул"""
+        execution.elapsed += seconds
+        with self._lock:
+            stats = self._stats[execution.key]
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], execution.elapsed)
+        self._check_slow(execution)
+
+    def _check_slow(self, execution: "_TracedExecution"):
+        if execution.logged or execution.elapsed < self.threshold:
+            return
+        execution.logged = True
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "sql": execution.key,
+            "parameters": execution.shape(),
+            "ms": round(execution.elapsed * 1000, 3),
+            "substatements": execution.substatements,
+            "plan": self._plans.get(execution.key, []),
+        }
+        with self._lock:
+            self._stats[execution.key]["slow"] += 1
+            self.slow.append(entry)
+        if self.log:
+            plan = "; ".join(entry["plan"]) or "-"
+            self.log(f"Медленный запрос {entry['ms']:.1f} мс {entry['parameters']}: {entry['sql']}\n"
+                     f"    план: {plan}")
+
+    def explain(self, conn, sql: str, parameters) -> List[str]:
+        """EXPLAIN QUERY PLAN отдельным курсором без трассировки; [] для служебных команд"""
+        if not sql.lstrip().upper().startswith(self.PLANNED):
+            return []
+        try:
+            cursor = sqlite3.Cursor(conn)
+            rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters or ()).fetchall()
+        except (sqlite3.Error, ValueError) as e:
+            return [f"план недоступен: {e}"]
+        return [row[3] for row in rows]
+
+    @staticmethod
+    def plan_flags(plan: List[str]) -> List[str]:
+        """scan - полный просмотр таблицы или индекса, temp-b-tree - сортировка во временном дереве"""
+        flags = []
+        if any(line.startswith("SCAN ") and "VIRTUAL TABLE" not in line for line in plan):
+            flags.append("scan")
+        if any("TEMP B-TREE" in line for line in plan):
+            flags.append("temp-b-tree")
+        return flags
+
+    def report(self) -> List[Dict]:
+        """Сводка по нормализованным запросам, по убыванию общего времени"""
+        with self._lock:
+            rows = [dict(stats) for stats in self._stats.values()]
+        for row in rows:
+            row["mean"] = row["total"] / row["count"]
+            row["plan"] = self._plans.get(row["sql"], [])
+            row["flags"] = self.plan_flags(row["plan"])
+        return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+    def format_report(self, limit: int = 30) -> str:
+        lines = [f"{'вызовов':>8} {'всего, мс':>10} {'макс, мс':>9} {'медл.':>6}  флаги / запрос"]
+        for row in self.report()[:limit]:
+            flags = ",".join(row["flags"]) or "-"
+            lines.append(f"{row['count']:>8} {row['total'] * 1000:>10.1f} {row['max'] * 1000:>9.2f} "
+                         f"{row['slow']:>6}  [{flags}] {row['sql'][:200]}")
+            for line in row["plan"]:
+                lines.append(f"{'':>36}  {line}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            slow = list(self.slow)
+        return {"threshold_ms": self.threshold * 1000, "queries": self.report(), "slow": slow}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.slow.clear()
+        self._plans.clear()
+
+
+class _TracedExecution:
+    """Один трассируемый execute/executemany: время, число строк пачки и подзапросов"""
+
+    __slots__ = ("tracer", "conn", "sql", "parameters", "many", "rows", "start", "elapsed",
+                 "first_statement", "substatements", "key", "logged")
+
+    def __init__(self, tracer, conn, sql, parameters, many):
+        self.tracer = tracer
+        self.conn = conn
+        self.sql = sql
+        self.parameters = parameters
+        self.many = many
+        self.rows = 0 if many else 1
+        self.elapsed = 0.0
+        self.substatements = 0
+        self.key = None
+        self.logged = False
+        self.first_statement = conn.traced_statements
+        self.start = perf_counter()
+
+    def iterate(self, seq_of_parameters):
+        """Параметры executemany: считает строки и запоминает первую - для плана и формы"""
+        for parameters in seq_of_parameters:
+            if not self.rows:
+                self.parameters = parameters
+            self.rows += 1
+            yield parameters
+
+    def shape(self) -> str:
+        shape = parameters_shape(self.parameters)
+        return f"{self.rows}×{shape}" if self.many else shape
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Курсор подключения с включенной трассировкой: замеряет execute и fetch*"""
+
+    _execution = None
+
+    def execute(self, sql, parameters=()):
+        tracer = self.connection.tracer
+        if tracer is None:
+            return super().execute(sql, parameters)
+        execution = tracer.begin(self.connection, sql, parameters)
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._execution = tracer.end(execution)
+
+    def executemany(self, sql, seq_of_parameters):
+        tracer = self.connection.tracer
+        if tracer is None:
+            return super().executemany(sql, seq_of_parameters)
+        execution = tracer.begin(self.connection, sql, None, many=True)
+        try:
+            return super().executemany(sql, execution.iterate(seq_of_parameters))
+        finally:
+            self._execution = tracer.end(execution)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def _fetch(self, fetch, *args):
+        execution = self._execution
+        if execution is None:
+            return fetch(*args)
+        start = perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            execution.tracer.add_fetch(execution, perf_counter() - start)
+
+
+class TracedConnection(sqlite3.Connection):
+    """Подключение DatabaseManager. Пока tracer не задан (enable_query_tracer), курсоры
+    и execute - обычные sqlite3; с tracer все запросы идут через TracedCursor."""
+
+    tracer = None
+    traced_statements = 0
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = sqlite3.Cursor if self.tracer is None else TracedCursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if self.tracer is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self.tracer is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def count_statement(self, statement):
+        """set_trace_callback: каждый запуск запроса, включая триггеры и служебные запросы FTS"""
+        self.traced_statements += 1
+
+
+# Общий трассировщик: MONEYTRACKER_TRACE_MS=<порог> включает его для всех подключений
+QUERY_TRACER = QueryTracer(float(os.environ.get("MONEYTRACKER_TRACE_MS") or 50))
+
+
+@instrument_methods("db")
+class DatabaseManager:
+    def __init__(self, db_file="money_tracker.db", profile: str = "interactive"):
+        self.db_name = db_file
+        self.conn = sqlite3.connect(self.db_name, check_same_thread=False, factory=TracedConnection)
+        self.conn.row_factory = sqlite3.Row
+        self.profile_name = None
+        self._batch_depth = 0
+        self._lookup_ids = {}
+        if os.environ.get("MONEYTRACKER_TRACE_MS"):
+            self.enable_query_tracer()
+        self.apply_profile(profile)
+        try:
+            self.create_tables()
+        except Exception:
+            # Миграция откачена; база с недостроенной схемой не открывается
+            self.conn.close()
+            raise
+
+    # ---------------- Трассировка запросов ----------------
+    def enable_query_tracer(self, tracer: Optional[QueryTracer] = None) -> QueryTracer:
+        """Включает замер всех запросов подключения (по умолчанию - в общий QUERY_TRACER)"""
+        self.conn.tracer = tracer or QUERY_TRACER
+        self.conn.set_trace_callback(self.conn.count_statement)
+        return self.conn.tracer
+
+    def disable_query_tracer(self):
+        self.conn.tracer = None
+        self.conn.set_trace_callback(None)
+
+    # ---------------- Настройки подключения ----------------
+    def apply_profile(self, name: str, set_journal_mode: bool = True):
+        """Применяет профиль из SQLITE_PROFILES к текущему подключению"""
+        if name not in SQLITE_PROFILES:
+            raise ValueError(f"Неизвестный профиль базы: {name}")
+        # synchronous нельзя менять внутри транзакции - фиксируем начатую
+        if self.conn.in_transaction:
+            self.conn.commit()
+        for pragma, value in SQLITE_PROFILES[name].items():
+            if pragma == "journal_mode" and not set_journal_mode:
+                continue
+            self.conn.execute(f"PRAGMA {pragma} = {value}")
+        self.profile_name = name
+
+    @contextmanager
+    def profile(self, name: str):
+        """Временно переключает профиль (например, bulk-load на время импорта).
+
+        Внутри batch() профиль не меняется: synchronous нельзя переключить
+        посреди открытой транзакции.
+        """
+        previous = self.profile_name
+        if name == previous or self._batch_depth:
+            yield self
+            return
+        # Режим журнала внутри транзакции не меняется, поэтому переключаем остальное
+        self.apply_profile(name, set_journal_mode=False)
+        try:
+            yield self
+        finally:
+            self.apply_profile(previous, set_journal_mode=False)
+
+    def get_effective_settings(self) -> Dict:
+        """Фактические значения PRAGMA подключения - для проверки профиля на месте"""
+        def pragma(name):
+            # Для базы в памяти mmap_size не возвращает строку
+            row = self.conn.execute(f"PRAGMA {name}").fetchone()
+            return row[0] if row else None
+        return {
+            "profile": self.profile_name,
+            "journal_mode": str(pragma("journal_mode")).upper(),
+            "synchronous": _SYNCHRONOUS_NAMES.get(pragma("synchronous")),
+            "cache_size": pragma("cache_size"),
+            "mmap_size": pragma("mmap_size"),
+            "temp_store": _TEMP_STORE_NAMES.get(pragma("temp_store")),
+            "busy_timeout": pragma("busy_timeout"),
+            "query_only": pragma("query_only"),
+        }
+
+    # ---------------- Транзакции базы ----------------
+    @contextmanager
+    def batch(self):
+        """Единица работы: все вызовы внутри with db.batch() - одна транзакция.
+
+        Методы add_/update_/delete_ внутри пачки не делают свой commit; фиксация -
+        при выходе из внешнего batch(). Вложенные пачки - точки сохранения (SAVEPOINT):
+        исключение откатывает только свою пачку и пробрасывается дальше.
+        """
+        name = f"batch_{self._batch_depth}"
+        if self._batch_depth == 0 and self.conn.in_transaction:
+            self.conn.commit()
+        self.conn.execute(f"SAVEPOINT {name}")
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            self._lookup_ids.clear()
+            self.conn.execute(f"ROLLBACK TO {name}")
+            self.conn.execute(f"RELEASE {name}")
+            raise
+        self._batch_depth -= 1
+        self.conn.execute(f"RELEASE {name}")
+        if self._batch_depth == 0:
+            self.conn.commit()
+
+    def _commit(self):
+        """commit одиночной операции; внутри batch() фиксирует внешняя пачка"""
+        if not self._batch_depth:
+            self.conn.commit()
+
+    def _rollback(self):
+        """Откат при ошибке; внутри batch() откат делает пачка, получив исключение"""
+        if not self._batch_depth:
+            self.conn.rollback()
+            # Значения справочников, добавленные в откаченной транзакции, пропали
+            self._lookup_ids.clear()
+
+    def create_tables(self):
+        cursor = self.conn.cursor()
+        replace_derived = self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION
+
+        self.create_lookup_tables(replace_derived)
+
+        # Создаем таблицу транзакций: тип, категория и способ оплаты - ссылки на справочники
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                type_id INTEGER NOT NULL REFERENCES transaction_types(id),
+                amount REAL NOT NULL,
+                description TEXT NOT NULL,
+                category_id INTEGER NOT NULL REFERENCES categories(id),
+                payment_type_id INTEGER NOT NULL REFERENCES payment_types(id),
+                exclude_from_total INTEGER DEFAULT 0,
+                date_iso TEXT,
+                fingerprint TEXT
+            )
+        """)
+
+        # Старая база: тип, категория и способ оплаты хранятся текстом в каждой строке.
+        # Ошибки миграции не глотаются: открывать базу с полуперестроенной схемой нельзя
+        cursor.execute("PRAGMA table_info(transactions)")
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'category' in columns:
+            if 'exclude_from_total' not in columns:
+                cursor.execute("ALTER TABLE transactions ADD COLUMN exclude_from_total INTEGER DEFAULT 0")
+            # Сортируемая ISO-дата: старые базы хранят только "dd.mm.yyyy HH:MM"
+            if 'date_iso' not in columns:
+                cursor.execute("ALTER TABLE transactions ADD COLUMN date_iso TEXT")
+            # Отпечаток содержимого для дедупликации через уникальный индекс
+            if 'fingerprint' not in columns:
+                cursor.execute("ALTER TABLE transactions ADD COLUMN fingerprint TEXT")
+            self.migrate_transactions_to_lookups()
+
+        # На каждом открытии: дозаполняет и прерванную миграцию старой базы
+        self.migrate_transaction_dates()
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date_iso ON transactions(date_iso)")
+        cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_fingerprint ON transactions(fingerprint)"
+        )
+        # Составные индексы для фильтров отчета: равенство по справочнику + диапазон дат
+        if replace_derived:
+            for name in list(FILTER_INDEXES) + RETIRED_INDEXES:
+                cursor.execute(f"DROP INDEX IF EXISTS {name}")
+        for name, column in FILTER_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON transactions({column}, date_iso)")
+
+        # Представление со старыми именами колонок - для чтения и внешних скриптов
+        if replace_derived:
+            cursor.execute("DROP VIEW IF EXISTS transactions_view")
+        cursor.execute("""
+            CREATE VIEW IF NOT EXISTS transactions_view AS
+            SELECT t.id, t.date, ty.name AS type, t.amount, t.description, c.name AS category,
+                   p.name AS payment_type, t.exclude_from_total, t.date_iso, t.fingerprint,
+                   t.type_id, t.category_id, t.payment_type_id
+            FROM transactions t
+            JOIN transaction_types ty ON ty.id = t.type_id
+            JOIN categories c ON c.id = t.category_id
+            JOIN payment_types p ON p.id = t.payment_type_id
+        """)
+        # Как и даты - на каждом открытии, по строкам без отпечатка
+        self.migrate_transaction_fingerprints()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS car_deals (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                brand TEXT NOT NULL,
+                year TEXT NOT NULL,
+                vin TEXT NOT NULL,
+                comment TEXT,
+                price REAL DEFAULT 0,
+                cost REAL DEFAULT 0,
+                expenses REAL DEFAULT 0,
+                header REAL DEFAULT 0
+            )
+        """)
+
+        # Проверяем наличие столбца expenses и добавляем его, если нужно
+        try:
+            cursor.execute("SELECT expenses FROM car_deals LIMIT 1")
+        except sqlite3.OperationalError:
+            cursor.execute("ALTER TABLE car_deals ADD COLUMN expenses REAL DEFAULT 0")
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_car_deals_vin ON car_deals(vin)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_car_deals_year ON car_deals(year)")
+
+        self.create_search_indexes(replace_derived)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS settings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                initial_capital REAL NOT NULL DEFAULT 0
+            )
+        """)
+
+        cursor.execute("SELECT COUNT(*) FROM settings")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("INSERT INTO settings (initial_capital) VALUES (0)")
+
+        # Итоги для панели сводки: одна строка, которую поддерживают триггеры
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS totals (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_income REAL NOT NULL DEFAULT 0,
+                expense_sum REAL NOT NULL DEFAULT 0,
+                car_profit REAL NOT NULL DEFAULT 0
+            )
+        """)
+        deltas = {
+            "income_new": _INCOME_DELTA.format(row="NEW"), "income_old": _INCOME_DELTA.format(row="OLD"),
+            "expense_new": _EXPENSE_DELTA.format(row="NEW"), "expense_old": _EXPENSE_DELTA.format(row="OLD"),
+        }
+        for name, body in TOTALS_TRIGGERS.items():
+            self._create_trigger(name, body.format(**deltas), replace_derived)
+
+        cursor.execute("SELECT COUNT(*) FROM totals")
+        if cursor.fetchone()[0] == 0:
+            # Новая или старая база без итогов: считаем один раз по всем строкам
+            cursor.execute("INSERT INTO totals (id) VALUES (1)")
+            self.rebuild_totals()
+
+        if replace_derived:
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.commit()
+
+    def _schema_object_exists(self, kind: str, name: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?",
+                                 (kind, name)).fetchone() is not None
+
+    def _create_trigger(self, name: str, body: str, replace: bool = False):
+        """Создает триггер, если его нет (например, после пересборки таблицы);
+        replace - пересоздать, потому что сменилась SCHEMA_VERSION"""
+        if replace:
+            self.conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        elif self._schema_object_exists("trigger", name):
+            return
+        self.conn.execute(f"CREATE TRIGGER {name} {body}")
+
+    def rebuild_totals(self):
+        """Пересчитывает строку totals по всем данным (после смены исключенных категорий)"""
+        income = _INCOME_DELTA.format(row="transactions")
+        expense = _EXPENSE_DELTA.format(row="transactions")
+        self.conn.execute(f"""
+            UPDATE totals SET
+                total_income = (SELECT COALESCE(SUM({income}), 0) FROM transactions),
+                expense_sum = (SELECT COALESCE(SUM({expense}), 0) FROM transactions),
+                car_profit = (SELECT COALESCE(SUM(header), 0) FROM car_deals)
+        """)
+        self._commit()
+
+    def get_totals(self) -> Dict:
+        """Итоги для панели сводки: {total_income, expense_sum, car_profit}"""
+        row = self.conn.execute("SELECT total_income, expense_sum, car_profit FROM totals").fetchone()
+        return dict(row)
+
+    def get_excluded_categories(self) -> List[str]:
+        cursor = self.conn.execute("SELECT name FROM categories WHERE excluded = 1 ORDER BY name")
+        return [row[0] for row in cursor.fetchall()]
+
+    def set_excluded_categories(self, categories: List[str]):
+        """Заменяет список категорий, не входящих в итоги, и пересчитывает итоги"""
+        for name in categories:
+            self._lookup_id("category", name)
+        placeholders = ", ".join("?" for _ in categories)
+        self.conn.execute(f"UPDATE categories SET excluded = (name IN ({placeholders}))", list(categories))
+        self.rebuild_totals()
+
+    # ---------------- Справочники ----------------
+    def create_lookup_tables(self, add_defaults: bool = False):
+        """Справочники типов, категорий и способов оплаты с начальными значениями.
+
+        Начальные значения дописываются в новый справочник или при add_defaults
+        (сменилась SCHEMA_VERSION); актуальная база открывается без записи.
+        """
+        cursor = self.conn.cursor()
+        new_categories = not self._schema_object_exists("table", "categories")
+
+        for column, (table, defaults) in LOOKUP_TABLES.items():
+            if self._schema_object_exists("table", table) and not add_defaults:
+                continue
+            extra = ", excluded INTEGER NOT NULL DEFAULT 0" if column == "category" else ""
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    position INTEGER NOT NULL DEFAULT 0{extra}
+                )
+            """)
+            cursor.executemany(f"INSERT OR IGNORE INTO {table} (name, position) VALUES (?, ?)",
+                               [(name, position) for position, name in enumerate(defaults)])
+
+        if new_categories:
+            cursor.executemany("UPDATE categories SET excluded = 1 WHERE name = ?",
+                               [(name,) for name in EXCLUDED_CATEGORIES])
+        # Список исключенных категорий из прежней отдельной таблицы переходит во флаг
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'excluded_categories'")
+        if cursor.fetchone() is not None:
+            cursor.execute("UPDATE categories SET excluded = 0")
+            cursor.execute("""
+                INSERT OR IGNORE INTO categories (name, position)
+                SELECT name, 1000 FROM excluded_categories
+            """)
+            cursor.execute("UPDATE categories SET excluded = 1 WHERE name IN (SELECT name FROM excluded_categories)")
+            cursor.execute("DROP TABLE excluded_categories")
+        self.conn.commit()
+
+    def migrate_transactions_to_lookups(self):
+        """Однократно переводит текстовые type/category/payment_type на ссылки в справочники.
+
+        Таблица пересобирается в одной транзакции (SQLite не умеет менять тип колонки):
+        новые значения дописываются в справочники, строки копируются с теми же id.
+        При ошибке все откатывается к старой схеме, исключение пробрасывается.
+        """
+        with self.batch():
+            cursor = self.conn.cursor()
+            for column, (table, _) in LOOKUP_TABLES.items():
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO {table} (name, position)
+                    SELECT DISTINCT {column}, 1000 FROM transactions WHERE {column} IS NOT NULL
+                """)
+            sequence = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'transactions'").fetchone()
+
+            cursor.execute("""
+                CREATE TABLE transactions_new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT NOT NULL,
+                    type_id INTEGER NOT NULL REFERENCES transaction_types(id),
+                    amount REAL NOT NULL,
+                    description TEXT NOT NULL,
+                    category_id INTEGER NOT NULL REFERENCES categories(id),
+                    payment_type_id INTEGER NOT NULL REFERENCES payment_types(id),
+                    exclude_from_total INTEGER DEFAULT 0,
+                    date_iso TEXT,
+                    fingerprint TEXT
+                )
+            """)
+            cursor.execute("""
+                INSERT INTO transactions_new (id, date, type_id, amount, description, category_id,
+                                              payment_type_id, exclude_from_total, date_iso, fingerprint)
+                SELECT t.id, t.date, ty.id, t.amount, t.description, c.id, p.id,
+                       t.exclude_from_total, t.date_iso, t.fingerprint
+                FROM transactions t
+                JOIN transaction_types ty ON ty.name = t.type
+                JOIN categories c ON c.name = t.category
+                JOIN payment_types p ON p.name = COALESCE(t.payment_type, 'Наличные')
+            """)
+            cursor.execute("DROP TABLE transactions")
+            cursor.execute("ALTER TABLE transactions_new RENAME TO transactions")
+            if sequence is not None:
+                cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'transactions'",
+                               (sequence[0],))
+
+    def create_search_indexes(self, replace_triggers: bool = False):
+        """Создает индексы FTS5 из SEARCH_INDEXES и триггеры синхронизации.
+
+        Новый индекс для уже заполненной таблицы строится один раз командой 'rebuild'.
+        Если SQLite собран без FTS5, поиск отключается (search_enabled = False).
+        Триггеры, как и триггеры итогов, создаются, только если их нет или сменилась
+        SCHEMA_VERSION (replace_triggers).
+        """
+        cursor = self.conn.cursor()
+        self.search_enabled = True
+        for index, (table, columns) in SEARCH_INDEXES.items():
+            if not self._schema_object_exists("table", index):
+                try:
+                    cursor.execute(f"""
+                        CREATE VIRTUAL TABLE {index} USING fts5(
+                            {", ".join(columns)}, content='{table}', content_rowid='id',
+                            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                        )
+                    """)
+                except sqlite3.OperationalError as e:
+                    print(f"Полнотекстовый поиск недоступен: {e}")
+                    self.search_enabled = False
+                    return
+                cursor.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+
+            for name, body in _search_triggers(index).items():
+                self._create_trigger(name, body, replace_triggers)
+
+    @contextmanager
+    def bulk_search_index(self, table: str):
+        """Массовая вставка в table без построчного триггера FTS5; без commit.
+
+        FTS5 сбрасывает буфер на диск на каждом срабатывании триггера, поэтому для кусков
+        импорта триггер вставки снимается, а новые строки (id больше прежнего максимума -
+        AUTOINCREMENT) попадают в индекс одним INSERT ... SELECT. Все - в текущей транзакции,
+        так что откат вызывающего кода возвращает и триггер, и индекс.
+        """
+        index = next((name for name, (source, _) in SEARCH_INDEXES.items() if source == table), None)
+        if index is None or not self.search_enabled:
+            yield
+            return
+        names = ", ".join(SEARCH_INDEXES[index][1])
+        trigger = f"trg_{index}_insert"
+        last_id = self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        self.conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        try:
+            yield
+            self.conn.execute(f"INSERT INTO {index} (rowid, {names}) SELECT id, {names} FROM {table} WHERE id > ?",
+                              (last_id,))
+        finally:
+            self.conn.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger} {_search_triggers(index)[trigger]}")
+
+    def search_transactions(self, text: str, limit: int = SEARCH_LIMIT) -> List[TransactionRecord]:
+        """Транзакции, в описании которых есть все слова text (как префиксы), лучшие первыми"""
+        query = fts_query(text)
+        if query is None or not self.search_enabled:
+            return []
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        cursor.execute("""
+            SELECT v.id, v.date, v.type, v.amount, v.description, v.category, v.payment_type,
+                   v.exclude_from_total, v.date_iso
+            FROM (SELECT rowid, rank FROM transactions_fts WHERE transactions_fts MATCH ?
+                  ORDER BY rank LIMIT ?) AS f
+            JOIN transactions_view v ON v.id = f.rowid
+            ORDER BY f.rank
+        """, (query, limit))
+        return _transaction_records(cursor.fetchall())
+
+    def search_car_deals(self, text: str, limit: int = SEARCH_LIMIT) -> List[CarDealRecord]:
+        """Авто-сделки по марке, VIN и комментарию, лучшие первыми"""
+        query = fts_query(text)
+        if query is None or not self.search_enabled:
+            return []
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        cursor.execute("""
+            SELECT d.id, d.brand, d.year, d.vin, d.comment, d.price, d.cost, d.expenses, d.header
+            FROM (SELECT rowid, rank FROM car_deals_fts WHERE car_deals_fts MATCH ?
+                  ORDER BY rank LIMIT ?) AS f
+            JOIN car_deals d ON d.id = f.rowid
+            ORDER BY f.rank
+        """, (query, limit))
+        return _car_deal_records(cursor.fetchall())
+
+    def get_lookup_values(self, column: str) -> List[str]:
+        """Значения справочника в порядке показа (column - type, category или payment_type)"""
+        table = LOOKUP_TABLES[column][0]
+        cursor = self.conn.execute(f"SELECT name FROM {table} ORDER BY position, id")
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_categories(self) -> List[str]:
+        return self.get_lookup_values("category")
+
+    def get_payment_types(self) -> List[str]:
+        return self.get_lookup_values("payment_type")
+
+    def get_transaction_types(self) -> List[str]:
+        return self.get_lookup_values("type")
+
+    def _lookup_id(self, column: str, name: str) -> int:
+        """id значения в справочнике; новое значение дописывается в конец (без commit)"""
+        key = (column, name)
+        lookup_id = self._lookup_ids.get(key)
+        if lookup_id is None:
+            table = LOOKUP_TABLES[column][0]
+            row = self.conn.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                cursor = self.conn.execute(
+                    f"INSERT INTO {table} (name, position) "
+                    f"SELECT ?, COALESCE(MAX(position), 0) + 1 FROM {table}", (name,))
+                lookup_id = cursor.lastrowid
+            else:
+                lookup_id = row[0]
+            self._lookup_ids[key] = lookup_id
+        return lookup_id
+
+    def migrate_transaction_dates(self, batch_size: int = 5000):
+        """Заполняет date_iso у строк, где его нет, пачками по batch_size с commit после каждой.
+
+        Пустой date_iso - признак незаполненной строки, поэтому прерванное заполнение
+        продолжается при следующем открытии базы.
+        """
+        cursor = self.conn.cursor()
+        last_id = 0
+        while True:
+            cursor.execute(
+                "SELECT id, date FROM transactions WHERE date_iso IS NULL AND id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                "UPDATE transactions SET date_iso = ? WHERE id = ?",
+                [(to_iso_date(row[1]), row[0]) for row in rows]
+            )
+            self.conn.commit()
+            last_id = rows[-1][0]
+
+    def migrate_transaction_fingerprints(self, batch_size: int = 5000):
+        """Заполняет fingerprint у строк, где его нет, пачками с commit после каждой.
+
+        Как и migrate_transaction_dates, продолжает прерванное заполнение при следующем
+        открытии. Уже имеющиеся в базе дубликаты не сливаются: отпечаток остается у строки,
+        получившей его первой, остальным добавляется суффикс ":<id>", и они выводятся
+        в отчет (см. get_duplicate_transactions).
+        """
+        cursor = self.conn.cursor()
+        last_id = 0
+        duplicates = 0
+        while True:
+            cursor.execute("""
+                SELECT id, date, date_iso, type, amount, description, category, payment_type
+                FROM transactions_view WHERE fingerprint IS NULL AND id > ? ORDER BY id LIMIT ?
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            for row in rows:
+                fingerprint = transaction_fingerprint(dict(row))
+                # Проверка по уникальному индексу: строки пачки видят уже записанные отпечатки
+                if self.conn.execute("SELECT 1 FROM transactions WHERE fingerprint = ?",
+                                     (fingerprint,)).fetchone() is not None:
+                    fingerprint = f"{fingerprint}:{row['id']}"
+                    duplicates += 1
+                self.conn.execute("UPDATE transactions SET fingerprint = ? WHERE id = ?", (fingerprint, row["id"]))
+            self.conn.commit()
+            last_id = rows[-1]["id"]
+
+        if duplicates:
+            print(f"Найдено дубликатов операций: {duplicates} (оставлены без изменений, "
+                  f"см. get_duplicate_transactions)")
+
+    def get_duplicate_transactions(self) -> List[Dict]:
+        """Дубликаты, найденные при заполнении отпечатков; duplicate_of - id оригинала"""
+        where = "WHERE fingerprint LIKE '%:%'"
+        fingerprints = {row[0]: row[1] for row in self.conn.execute(f"SELECT id, fingerprint FROM transactions {where}")}
+        return [
+            dict(tr, fingerprint=fingerprints[tr.id],
+                 duplicate_of=self._fingerprint_owner(fingerprints[tr.id].split(':')[0]))
+            for tr in self._select_transactions(where)
+        ]
+
+    def _fingerprint_owner(self, fingerprint: str) -> Optional[int]:
+        row = self.conn.execute(
+            "SELECT id FROM transactions WHERE fingerprint = ?", (fingerprint,)
+        ).fetchone()
+        return row[0] if row else None
+
+    # ---------------- Транзакции ----------------
+    def add_transaction(self, transaction) -> Optional[int]:
+        """Добавляет операцию; возвращает ее id или None, если такая уже есть"""
+        date_iso = to_iso_date(transaction['date'])
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT OR IGNORE INTO transactions (date, date_iso, type_id, amount, description, category_id,
+                                                payment_type_id, exclude_from_total, fingerprint)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            transaction['date'],
+            date_iso,
+            self._lookup_id('type', transaction['type']),
+            transaction['amount'],
+            transaction['description'],
+            self._lookup_id('category', transaction['category']),
+            self._lookup_id('payment_type', transaction.get('payment_type', 'Наличные')),
+            int(transaction.get('exclude_from_total', False)),
+            transaction_fingerprint(dict(transaction, date_iso=date_iso))
+        ))
+        self._commit()
+        return cursor.lastrowid if cursor.rowcount > 0 else None
+
+    def _select_transactions(self, where: str = "", params=(), limit: Optional[int] = None,
+                             offset: int = 0, order: str = "DESC") -> List[TransactionRecord]:
+        cursor = self.conn.cursor()
+        # Кортежи вместо sqlite3.Row: строка сразу превращается в TransactionRecord
+        cursor.row_factory = None
+        page = ""
+        if limit is not None:
+            page = "LIMIT ? OFFSET ?"
+            params = tuple(params) + (limit, offset)
+        cursor.execute(f'''
+            SELECT id, date, type, amount, description, category, payment_type, exclude_from_total, date_iso
+            FROM transactions_view {where} ORDER BY date_iso {order}, id {order} {page}
+        ''', params)
+        return _transaction_records(cursor.fetchall())
+
+    def get_all_transactions(self) -> List[TransactionRecord]:
+        return self._select_transactions()
+
+    def get_transactions_page(self, offset: int, limit: int,
+                              flt: Optional[TransactionFilter] = None) -> List[TransactionRecord]:
+        """Страница транзакций в порядке get_all_transactions (для виртуальной таблицы)"""
+        return self._filtered_select(flt)(limit=limit, offset=offset)
+
+    def compile_filter(self, flt: TransactionFilter):
+        """TransactionFilter -> (условие для WHERE, параметры).
+
+        Условие ссылается только на колонки transactions (их же отдает transactions_view),
+        так что отбор по справочнику или дате идет по индексу из FILTER_INDEXES или
+        idx_transactions_date_iso (один флаг exclude_from_total - просмотр таблицы).
+        Справочные имена заранее переводятся в id: при одном значении "колонка = ?"
+        индекс (колонка, date_iso) сразу отдает строки в порядке даты, без сортировки.
+        """
+        conditions, params = [], []
+        for column, names in (("type", flt.types), ("category", flt.categories),
+                              ("payment_type", flt.payment_types)):
+            if not names:
+                continue
+            table = LOOKUP_TABLES[column][0]
+            marks = ", ".join("?" * len(names))
+            ids = [row[0] for row in self.conn.execute(
+                f"SELECT id FROM {table} WHERE name IN ({marks})", list(names))]
+            if not ids:
+                return "0", ()
+            if len(ids) == 1:
+                conditions.append(f"{column}_id = ?")
+            else:
+                conditions.append(f"{column}_id IN ({', '.join('?' * len(ids))})")
+            params.extend(ids)
+        if flt.exclude_from_total is not None:
+            conditions.append("exclude_from_total = ?")
+            params.append(int(flt.exclude_from_total))
+        if flt.date_from is not None:
+            conditions.append("date_iso >= ?")
+            params.append(flt.date_from)
+        if flt.date_to is not None:
+            conditions.append("date_iso < ?")
+            params.append(flt.date_to)
+        return " AND ".join(conditions) or "1", tuple(params)
+
+    def _filtered_select(self, flt: Optional[TransactionFilter]):
+        """_select_transactions с дополнительным условием фильтра (для страниц и keyset)"""
+        if flt is None or flt.is_empty():
+            return self._select_transactions
+        clause, filter_params = self.compile_filter(flt)
+
+        def select(where: str = "", params=(), limit: Optional[int] = None, offset: int = 0, order: str = "DESC"):
+            where = f"{where} AND {clause}" if where else f"WHERE {clause}"
+            return self._select_transactions(where, tuple(params) + filter_params, limit, offset, order)
+        return select
+
+    def get_filtered_summary(self, flt: Optional[TransactionFilter] = None) -> Dict:
+        """Число, приход и расход отобранных операций: {'count', 'income', 'expense'}"""
+        clause, params = self.compile_filter(flt or TransactionFilter())
+        row = self.conn.execute(f"""
+            SELECT COUNT(*),
+                   COALESCE(SUM(CASE WHEN type_id = (SELECT id FROM transaction_types WHERE name = 'Приход')
+                                THEN amount ELSE 0 END), 0),
+                   COALESCE(SUM(CASE WHEN type_id = (SELECT id FROM transaction_types WHERE name = 'Расход')
+                                THEN amount ELSE 0 END), 0)
+            FROM transactions WHERE {clause}
+        """, params).fetchone()
+        return {'count': row[0], 'income': row[1], 'expense': row[2]}
+
+    def iter_transactions(self, after: Optional[tuple] = None, limit: int = 100,
+                          direction: str = "desc", flt: Optional[TransactionFilter] = None) -> List[TransactionRecord]:
+        """Следующие limit транзакций после ключа after = (date_iso, id).
+
+        Keyset-пагинация по индексу idx_transactions_date_iso вместо OFFSET: цена
+        страницы не зависит от того, насколько далеко она от начала. direction="desc" -
+        порядок get_all_transactions (новые сверху), "asc" - обратный. Ключ строки -
+        transaction_key(row); after=None - с начала. flt - необязательный TransactionFilter.
+        """
+        return _keyset_page(self._filtered_select(flt), "date_iso", after, limit, direction)
+
+    def iter_transaction_batches(self, batch_size: int = EXPORT_BATCH_SIZE, direction: str = "desc"):
+        """Генератор: все транзакции пачками по batch_size строк (keyset, без OFFSET)"""
+        yield from _keyset_batches(self.iter_transactions, transaction_key, batch_size, direction)
+
+    def count_transactions(self, flt: Optional[TransactionFilter] = None) -> int:
+        if flt is None or flt.is_empty():
+            return self.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        clause, params = self.compile_filter(flt)
+        return self.conn.execute(f"SELECT COUNT(*) FROM transactions WHERE {clause}", params).fetchone()[0]
+
+    def get_transaction(self, transaction_id: int) -> Optional[TransactionRecord]:
+        rows = self._select_transactions("WHERE id = ?", (transaction_id,))
+        return rows[0] if rows else None
+
+    def delete_transaction(self, transaction_id: int) -> bool:
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
+        self._commit()
+        return cursor.rowcount > 0
+
+    def get_transactions_between(self, start: str, end: str) -> List[TransactionRecord]:
+        """Транзакции с start <= date_iso < end (поиск по индексу idx_transactions_date_iso)"""
+        return self._select_transactions("WHERE date_iso >= ? AND date_iso < ?", (start, end))
+
+    def get_transactions_for_month(self, year: int, month: int) -> List[TransactionRecord]:
+        return self.get_transactions_between(*month_bounds(year, month))
+
+    def get_transactions_for_day(self, year: int, month: int, day: int) -> List[TransactionRecord]:
+        start = date(year, month, day)
+        return self.get_transactions_between(start.isoformat(), (start + timedelta(days=1)).isoformat())
+
+    def get_monthly_summary(self, year: int, month: int) -> Dict:
+        """Сводка за месяц, посчитанная в SQL по диапазону индекса idx_transactions_date_iso.
+
+        Возвращает:
+            days        - список {'day', 'income', 'expense', 'count'} по возрастанию дня
+            categories  - {категория: расход минус приход}
+            total_income, total_expense, count - итоги месяца
+        """
+        start, end = month_bounds(year, month)
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT substr(date_iso, 1, 10) AS day,
+                   SUM(CASE WHEN type_id = (SELECT id FROM transaction_types WHERE name = 'Приход')
+                       THEN ABS(amount) ELSE 0 END),
+                   SUM(CASE WHEN type_id = (SELECT id FROM transaction_types WHERE name = 'Приход')
+                       THEN 0 ELSE ABS(amount) END),
+                   COUNT(*)
+            FROM transactions
+            WHERE date_iso >= ? AND date_iso < ?
+            GROUP BY day ORDER BY day
+        """, (start, end))
+        days = [
+            {'day': row[0], 'income': row[1], 'expense': row[2], 'count': row[3]}
+            for row in cursor.fetchall()
+        ]
+
+        cursor.execute("""
+            SELECT c.name, totals.amount
+            FROM (
+                SELECT category_id,
+                       SUM(CASE WHEN type_id = (SELECT id FROM transaction_types WHERE name = 'Расход')
+                           THEN ABS(amount) ELSE -ABS(amount) END) AS amount
+                FROM transactions
+                WHERE date_iso >= ? AND date_iso < ?
+                GROUP BY category_id
+            ) totals
+            JOIN categories c ON c.id = totals.category_id
+        """, (start, end))
+        categories = {row[0]: row[1] for row in cursor.fetchall()}
+
+        return {
+            'days': days,
+            'categories': categories,
+            'total_income': sum(d['income'] for d in days),
+            'total_expense': sum(d['expense'] for d in days),
+            'count': sum(d['count'] for d in days)
+        }
+
+    def update_transaction(self, transaction_id: int, updates: Dict) -> bool:
+        if not updates:
+            return False
+        try:
+            if 'date' in updates:
+                date_iso = to_iso_date(updates['date'])
+                if date_iso is None:
+                    # Без date_iso операция выпала бы из отчетов и фильтров по датам
+                    print(f"Дата '{updates['date']}' не распознана")
+                    return False
+                updates = dict(updates, date_iso=date_iso)
+            if any(key in updates for key in ('date',) + FINGERPRINT_FIELDS):
+                current = self.conn.execute(
+                    "SELECT date, date_iso, type, amount, description, category, payment_type "
+                    "FROM transactions_view WHERE id = ?", (transaction_id,)
+                ).fetchone()
+                if current is None:
+                    return False
+                updates = dict(updates, fingerprint=transaction_fingerprint(dict(dict(current), **updates)))
+            # Текстовые значения справочников сохраняются ссылками
+            updates = {
+                (f"{key}_id" if key in LOOKUP_TABLES else key):
+                    (self._lookup_id(key, value) if key in LOOKUP_TABLES else value)
+                for key, value in updates.items()
+            }
+            cursor = self.conn.cursor()
+            set_clause = ", ".join(f"{key} = ?" for key in updates.keys())
+            values = list(updates.values()) + [transaction_id]
+            cursor.execute(f"UPDATE transactions SET {set_clause} WHERE id = ?", values)
+            self._commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            print(f"Ошибка при обновлении транзакции: {e}")
+            return False
+
+    def exists_transaction(self, transaction: Dict) -> bool:
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT 1 FROM transactions WHERE fingerprint = ? LIMIT 1",
+            (transaction_fingerprint(transaction),)
+        )
+        return cursor.fetchone() is not None
+
+    # ---------------- Авто-сделки ----------------
+    def add_car_deal(self, car_deal: Dict) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT INTO car_deals (
+                brand, year, vin, comment, price, cost, expenses, header
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            car_deal["brand"],
+            car_deal["year"],
+            car_deal["vin"],
+            car_deal.get("comment", ""),
+            car_deal.get("price", 0),
+            car_deal.get("cost", 0),
+            car_deal.get("expenses", 0),
+            car_deal.get("header", 0)
+        ))
+        self._commit()
+        return cursor.lastrowid
+
+    def get_all_car_deals(self) -> List[CarDealRecord]:
+        return self._select_car_deals()
+
+    def get_car_deals_page(self, offset: int, limit: int) -> List[CarDealRecord]:
+        """Страница авто-сделок в порядке get_all_car_deals (для виртуальной таблицы)"""
+        return self._select_car_deals(limit=limit, offset=offset)
+
+    def _select_car_deals(self, where: str = "", params=(), limit: Optional[int] = None,
+                          offset: int = 0, order: str = "DESC") -> List[CarDealRecord]:
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(f"{CAR_DEAL_SELECT} {where} ORDER BY year {order}, id {order} LIMIT ? OFFSET ?",
+                       tuple(params) + (-1 if limit is None else limit, offset))
+        return _car_deal_records(cursor.fetchall())
+
+    def iter_car_deals(self, after: Optional[tuple] = None, limit: int = 100,
+                       direction: str = "desc") -> List[CarDealRecord]:
+        """Следующие limit авто-сделок после ключа after = (year, id), как iter_transactions"""
+        return _keyset_page(self._select_car_deals, "year", after, limit, direction)
+
+    def iter_car_deal_batches(self, batch_size: int = EXPORT_BATCH_SIZE, direction: str = "desc"):
+        """Генератор: все авто-сделки пачками по batch_size строк (keyset, без OFFSET)"""
+        yield from _keyset_batches(self.iter_car_deals, car_deal_key, batch_size, direction)
+
+    def count_car_deals(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM car_deals").fetchone()[0]
+
+    def get_car_deal(self, deal_id: int) -> Optional[CarDealRecord]:
+        rows = self._select_car_deals("WHERE id = ?", (deal_id,))
+        return rows[0] if rows else None
+
+    def delete_car_deal(self, deal_id: int) -> bool:
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM car_deals WHERE id = ?", (deal_id,))
+        self._commit()
+        return cursor.rowcount > 0
+
+    def update_car_deal(self, deal_id: int, updates: Dict) -> bool:
+        if not updates:
+            return False
+        try:
+            cursor = self.conn.cursor()
+            set_clause = ", ".join(f"{key} = ?" for key in updates.keys())
+            values = list(updates.values()) + [deal_id]
+            cursor.execute(f"UPDATE car_deals SET {set_clause} WHERE id = ?", values)
+            self._commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            print(f"Ошибка при обновлении авто-сделки: {e}")
+            return False
+
+    def exists_car_deal(self, car_deal: Dict) -> bool:
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM car_deals
+            WHERE brand = ? AND year = ? AND vin = ?
+            AND ABS(price - ?) < 0.01 AND ABS(cost - ?) < 0.01
+        """, (
+            car_deal["brand"],
+            car_deal["year"],
+            car_deal["vin"],
+            car_deal.get("price", 0),
+            car_deal.get("cost", 0)
+        ))
+        return cursor.fetchone()[0] > 0
+
+    # ---------------- Настройки ----------------
+    def get_initial_capital(self) -> float:
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT initial_capital FROM settings LIMIT 1")
+        result = cursor.fetchone()
+        return result[0] if result else 0.0
+
+    def update_initial_capital(self, amount: float) -> bool:
+        cursor = self.conn.cursor()
+        cursor.execute("UPDATE settings SET initial_capital = ?", (amount,))
+        self._commit()
+        return cursor.rowcount > 0
+
+    # ---------------- Экспорт / импорт ----------------
+    def export_to_excel(self, file_path: str, monthly_data: Dict = None, progress=None) -> bool:
+        """Полный экспорт в Excel.
+
+        Таблицы читаются курсором пачками по EXPORT_BATCH_SIZE строк и сразу пишутся
+        в книгу openpyxl в режиме write_only, поэтому память не растет с числом строк.
+        progress(done, total, message) вызывается после каждой пачки; если он бросит
+        OperationCancelled, файл не сохраняется. Читает в профиле "reporting".
+        """
+        try:
+            with self.profile("reporting"):
+                return self._export_to_excel(file_path, monthly_data, progress)
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            print(f"Ошибка при экспорте: {e}")
+            return False
+
+    def _export_to_excel(self, file_path: str, monthly_data: Optional[Dict], progress) -> bool:
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        try:
+            total = self.count_transactions() + self.count_car_deals()
+            written = [0]
+
+            def on_batch(rows: int):
+                written[0] += rows
+                if progress:
+                    progress(written[0], total, f"Экспорт: {written[0]} из {total} строк")
+
+            # Экспорт транзакций
+            self._write_query_sheet(workbook, "Транзакции", TRANSACTION_EXPORT_COLUMNS, """
+                SELECT id, date, type, amount, description, category, payment_type, exclude_from_total
+                FROM transactions_view ORDER BY date_iso DESC, id DESC
+            """, on_batch=on_batch)
+
+            # Экспорт авто-сделок
+            self._write_query_sheet(workbook, "Авто-сделки", CAR_DEAL_EXPORT_COLUMNS, """
+                SELECT id, brand, year, vin, comment, price, cost, expenses, header
+                FROM car_deals ORDER BY year DESC, id DESC
+            """, on_batch=on_batch)
+
+            # Экспорт настроек
+            _write_rows_sheet(workbook, "Настройки", [{"Стартовый_капитал": self.get_initial_capital()}])
+
+            # Экспорт месячного отчета
+            if monthly_data:
+                if 'daily_summary' in monthly_data and monthly_data['daily_summary']:
+                    _write_rows_sheet(workbook, "Месяц_Ежедневно", monthly_data['daily_summary'])
+                if 'daily_details' in monthly_data and monthly_data['daily_details']:
+                    _write_rows_sheet(workbook, "Месяц_Операции", monthly_data['daily_details'])
+                if 'category_stats' in monthly_data and monthly_data['category_stats']:
+                    _write_rows_sheet(workbook, "Месяц_Категории", [
+                        {'Категория': category, 'Сумма': stats}
+                        for category, stats in monthly_data['category_stats'].items()
+                    ])
+                if 'month_info' in monthly_data:
+                    _write_rows_sheet(workbook, "Месяц_Инфо", [monthly_data['month_info']])
+
+            workbook.save(file_path)
+            return True
+        except OperationCancelled:
+            # Закрываем временные файлы недописанных листов, сам файл не создается
+            for sheet in workbook.worksheets:
+                sheet.close()
+            raise
+
+    def _write_query_sheet(self, workbook, sheet_name: str, columns, query: str, params=(), on_batch=None):
+        """Пишет результат запроса в лист книги write_only; пустой результат - без листа"""
+        cursor = self.conn.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+        if not rows:
+            return
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append([header for header, _ in columns])
+        converters = [convert for _, convert in columns]
+        while rows:
+            for row in rows:
+                sheet.append([
+                    convert(value) if convert else value
+                    for convert, value in zip(converters, row)
+                ])
+            if on_batch:
+                on_batch(len(rows))
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+
+    def import_from_excel(self, file_path: str, chunk_size: Optional[int] = None, progress=None) -> Dict:
+        """Импорт листов "Транзакции", "Авто-сделки" и "Настройки" из Excel.
+
+        Листы нормализуются целиком средствами pandas и пишутся одним executemany
+        на лист в единой транзакции. Операции-дубликаты отсекаются уникальным индексом
+        по отпечатку (INSERT OR IGNORE). Возвращает количество добавленных и пропущенных строк.
+
+        Если задан chunk_size, файл .xlsx читается потоково (см. import_from_excel_streaming).
+        progress(done, total, message) вызывается после каждого листа (куска).
+        Запись идет в профиле "bulk-load", после импорта профиль возвращается.
+        """
+        if chunk_size:
+            return self.import_from_excel_streaming(file_path, chunk_size, progress)
+        with self.profile("bulk-load"):
+            return self._import_whole_workbook(file_path, progress)
+
+    def _import_whole_workbook(self, file_path: str, progress) -> Dict:
+        import pandas as pd
+        imported_count = {'transactions': 0, 'car_deals': 0, 'initial_capital': None,
+                          'skipped_transactions': 0, 'skipped_car_deals': 0}
+
+        with pd.ExcelFile(file_path) as xls:
+            sheet_names = xls.sheet_names
+            try:
+                for sheet_name in TRANSACTION_SHEETS:
+                    if sheet_name in sheet_names:
+                        frame = normalize_transactions_frame(pd.read_excel(xls, sheet_name=sheet_name))
+                        added = self._insert_transactions_frame(frame)
+                        imported_count['transactions'] += added
+                        imported_count['skipped_transactions'] += len(frame) - added
+                        if progress:
+                            progress(1, 3, f"Импорт: лист {sheet_name}")
+
+                for sheet_name in CAR_DEAL_SHEETS:
+                    if sheet_name in sheet_names:
+                        frame = normalize_car_deals_frame(pd.read_excel(xls, sheet_name=sheet_name))
+                        added = self._insert_car_deals_frame(frame)
+                        imported_count['car_deals'] += added
+                        imported_count['skipped_car_deals'] += len(frame) - added
+                        if progress:
+                            progress(2, 3, f"Импорт: лист {sheet_name}")
+
+                for sheet_name in SETTINGS_SHEETS:
+                    if sheet_name in sheet_names:
+                        capital = read_initial_capital(pd.read_excel(xls, sheet_name=sheet_name))
+                        if capital is not None:
+                            self.conn.execute("UPDATE settings SET initial_capital = ?", (capital,))
+                            imported_count['initial_capital'] = capital
+                            break
+
+                self._commit()
+            except Exception:
+                self._rollback()
+                raise
+
+        return imported_count
+
+    def import_from_excel_streaming(self, file_path: str, chunk_size: int = IMPORT_CHUNK_SIZE,
+                                    progress=None) -> Dict:
+        """Потоковый импорт .xlsx: строки читаются через openpyxl (read_only) кусками по chunk_size.
+
+        Каждый кусок нормализуется и записывается в своей транзакции, так что пиковая
+        память ограничена размером куска, а не файла. При ошибке откатывается только
+        текущий кусок; повторный запуск безопасен - дубликаты будут пропущены.
+        progress(done, total, message) вызывается после каждого куска; если он бросит
+        OperationCancelled, уже записанные куски остаются в базе. Профиль - "bulk-load".
+        """
+        with self.profile("bulk-load"):
+            return self._import_streaming(file_path, chunk_size, progress)
+
+    def _import_streaming(self, file_path: str, chunk_size: int, progress) -> Dict:
+        from openpyxl import load_workbook
+        imported_count = {'transactions': 0, 'car_deals': 0, 'initial_capital': None,
+                          'skipped_transactions': 0, 'skipped_car_deals': 0}
+
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            sheet_names = workbook.sheetnames
+            data_sheets = [name for name in TRANSACTION_SHEETS + CAR_DEAL_SHEETS if name in sheet_names]
+            # max_row берется из заголовка листа и может отсутствовать
+            total = sum(max((workbook[name].max_row or 1) - 1, 0) for name in data_sheets) or None
+            done = 0
+
+            for sheet_name in TRANSACTION_SHEETS:
+                if sheet_name in sheet_names:
+                    for chunk in iter_sheet_chunks(workbook[sheet_name], chunk_size):
+                        frame = normalize_transactions_frame(chunk)
+                        added = self.insert_transactions_frame(frame)
+                        imported_count['transactions'] += added
+                        imported_count['skipped_transactions'] += len(frame) - added
+                        done += len(chunk)
+                        if progress:
+                            progress(done, total, f"Импорт операций: {done} строк")
+
+            for sheet_name in CAR_DEAL_SHEETS:
+                if sheet_name in sheet_names:
+                    for chunk in iter_sheet_chunks(workbook[sheet_name], chunk_size):
+                        frame = normalize_car_deals_frame(chunk)
+                        added = self.insert_car_deals_frame(frame)
+                        imported_count['car_deals'] += added
+                        imported_count['skipped_car_deals'] += len(frame) - added
+                        done += len(chunk)
+                        if progress:
+                            progress(done, total, f"Импорт авто-сделок: {done} строк")
+
+            for sheet_name in SETTINGS_SHEETS:
+                if sheet_name in sheet_names:
+                    first_chunk = next(iter_sheet_chunks(workbook[sheet_name], 1), None)
+                    capital = read_initial_capital(first_chunk) if first_chunk is not None else None
+                    if capital is not None:
+                        self.update_initial_capital(capital)
+                        imported_count['initial_capital'] = capital
+                        break
+        finally:
+            workbook.close()
+
+        return imported_count
+
+    def insert_transactions_frame(self, frame: pd.DataFrame) -> int:
+        """Массовая запись транзакций в колонках normalize_transactions_frame одной транзакцией
+        (внутри batch() - в составе пачки). Дубликаты пропускаются; возвращает число добавленных"""
+        with self.batch():
+            return self._insert_transactions_frame(frame)
+
+    def insert_car_deals_frame(self, frame: pd.DataFrame) -> int:
+        """То же для авто-сделок в колонках normalize_car_deals_frame"""
+        with self.batch():
+            return self._insert_car_deals_frame(frame)
+
+    def _insert_transactions_frame(self, frame: pd.DataFrame) -> int:
+        """Добавляет нормализованные транзакции; дубликаты отсекает уникальный индекс. Без commit"""
+        if frame.empty:
+            return 0
+        frame = frame.assign(fingerprint=transaction_fingerprints(frame))
+        # Справочные значения переводятся в id один раз на уникальное значение куска
+        for column in LOOKUP_TABLES:
+            ids = {value: self._lookup_id(column, value) for value in frame[column].unique()}
+            frame[f"{column}_id"] = frame[column].map(ids)
+        cursor = self.conn.cursor()
+        with self.bulk_search_index("transactions"):
+            cursor.executemany("""
+                INSERT OR IGNORE INTO transactions (date, date_iso, type_id, amount, description, category_id,
+                                                    payment_type_id, exclude_from_total, fingerprint)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, frame[["date", "date_iso", "type_id", "amount", "description", "category_id", "payment_type_id",
+                        "exclude_from_total", "fingerprint"]].itertuples(index=False, name=None))
+        return cursor.rowcount
+
+    def _insert_car_deals_frame(self, frame: pd.DataFrame) -> int:
+        """Добавляет нормализованные авто-сделки, пропуская дубликаты; без commit"""
+        import pandas as pd
+        if frame.empty:
+            return 0
+        keys = _car_deal_keys(frame)
+        frame = frame[~keys.duplicated()]
+        keys = keys[frame.index]
+
+        # Сравниваем только со сделками с теми же VIN (индекс idx_car_deals_vin),
+        # чтобы потоковый импорт не перечитывал всю таблицу на каждом куске
+        existing = pd.DataFrame(
+            self.conn.execute(
+                "SELECT brand, year, vin, price, cost FROM car_deals "
+                "WHERE vin IN (SELECT value FROM json_each(?))",
+                (json.dumps(frame["vin"].unique().tolist()),)
+            ).fetchall(),
+            columns=["brand", "year", "vin", "price", "cost"]
+        )
+        if not existing.empty:
+            frame = frame[~keys.isin(set(_car_deal_keys(existing)))]
+
+        with self.bulk_search_index("car_deals"):
+            self.conn.executemany("""
+                INSERT INTO car_deals (brand, year, vin, comment, price, cost, expenses, header)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, frame[["brand", "year", "vin", "comment", "price", "cost", "expenses",
+                        "header"]].itertuples(index=False, name=None))
+        return len(frame)
+
+    # ---------------- Обслуживание ----------------
+    def vacuum(self) -> Dict:
+        """Слияние сегментов поисковых индексов, VACUUM и PRAGMA optimize.
+
+        VACUUM переписывает весь файл, поэтому его не делают внутри batch().
+        Возвращает размер базы в байтах до и после.
+        """
+        def size():
+            return (self.conn.execute("PRAGMA page_count").fetchone()[0]
+                    * self.conn.execute("PRAGMA page_size").fetchone()[0])
+
+        if self._batch_depth:
+            raise RuntimeError("vacuum() нельзя вызывать внутри batch()")
+        before = size()
+        if self.search_enabled:
+            for index in SEARCH_INDEXES:
+                self.conn.execute(f"INSERT INTO {index}({index}) VALUES ('optimize')")
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+        self.conn.execute("PRAGMA optimize")
+        return {"before": before, "after": size()}
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+
+def _transaction_sort_key(transaction: TransactionRecord):
+    return transaction.date_iso or "", transaction.id
+
+
+def _car_deal_sort_key(deal: CarDealRecord):
+    return str(deal.year or ""), deal.id
+
+
+def _desc_position(rows: List[Dict], key, key_func) -> int:
+    """Бинарный поиск позиции key в списке, отсортированном по убыванию key_func"""
+    lo, hi = 0, len(rows)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key_func(rows[mid]) > key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class ColumnarStore:
+    """Транзакции по колонкам в массивах numpy для векторных сводок.
+
+    Дата хранится номером дня (datetime64[D] как int64, NO_DAY - дата не распознана),
+    тип/категория/способ оплаты - маленькими целыми кодами из словарей codes.
+    Массивы растут удвоением; удаленная строка только помечается в alive, а правка
+    перезаписывает ее место. Загружается один раз (from_records), дальше
+    обновляется по одной операции вместе с TrackerModel.
+    """
+
+    NO_DAY = -2 ** 63  # np.iinfo(np.int64).min, он же NaT
+
+    def __init__(self, capacity: int = 1024):
+        import numpy as np
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.days = np.zeros(capacity, dtype=np.int64)
+        self.amounts = np.zeros(capacity, dtype=np.float64)
+        self.types = np.zeros(capacity, dtype=np.int16)
+        self.categories = np.zeros(capacity, dtype=np.int32)
+        self.payment_types = np.zeros(capacity, dtype=np.int16)
+        self.excluded = np.zeros(capacity, dtype=bool)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.positions = {}
+        self.codes = {'type': {}, 'category': {}, 'payment_type': {}}
+        self.labels = {'type': [], 'category': [], 'payment_type': []}
+
+    # ---------------- Загрузка ----------------
+    @classmethod
+    def from_records(cls, transactions: List[TransactionRecord]) -> "ColumnarStore":
+        store = cls(max(1024, len(transactions)))
+        n = len(transactions)
+        store.size = n
+        store.ids[:n] = [tr.id for tr in transactions]
+        store.days[:n] = _iso_days([tr.date_iso for tr in transactions])
+        store.amounts[:n] = [tr.amount for tr in transactions]
+        store.types[:n] = store._encode('type', [tr.type for tr in transactions])
+        store.categories[:n] = store._encode('category', [tr.category for tr in transactions])
+        store.payment_types[:n] = store._encode('payment_type', [tr.payment_type for tr in transactions])
+        store.excluded[:n] = [tr.exclude_from_total for tr in transactions]
+        store.alive[:n] = True
+        store.positions = {transaction_id: index for index, transaction_id in enumerate(store.ids[:n].tolist())}
+        return store
+
+    def _encode(self, column: str, values: List[str]) -> List[int]:
+        codes, labels = self.codes[column], self.labels[column]
+        result = []
+        for value in values:
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(labels)
+                labels.append(value)
+            result.append(code)
+        return result
+
+    def code(self, column: str, value: str) -> int:
+        """Код значения или -1, если такого значения в данных нет"""
+        return self.codes[column].get(value, -1)
+
+    # ---------------- Изменения по одной строке ----------------
+    def append(self, transaction: TransactionRecord):
+        if self.size == len(self.ids):
+            self._grow(2 * len(self.ids))
+        self._write(self.size, transaction)
+        self.positions[transaction.id] = self.size
+        self.size += 1
+
+    def update(self, transaction: TransactionRecord):
+        index = self.positions.get(transaction.id)
+        if index is None:
+            self.append(transaction)
+        else:
+            self._write(index, transaction)
+
+    def remove(self, transaction_id: int):
+        index = self.positions.pop(transaction_id, None)
+        if index is not None:
+            self.alive[index] = False
+
+    def _write(self, index: int, tr: TransactionRecord):
+        self.ids[index] = tr.id
+        self.days[index] = _iso_days([tr.date_iso])[0]
+        self.amounts[index] = tr.amount
+        self.types[index] = self._encode('type', [tr.type])[0]
+        self.categories[index] = self._encode('category', [tr.category])[0]
+        self.payment_types[index] = self._encode('payment_type', [tr.payment_type])[0]
+        self.excluded[index] = tr.exclude_from_total
+        self.alive[index] = True
+
+    def _grow(self, capacity: int):
+        import numpy as np
+        for name in ('ids', 'days', 'amounts', 'types', 'categories', 'payment_types', 'excluded', 'alive'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    # ---------------- Сводки ----------------
+    def totals(self, excluded_categories: List[str]) -> Dict:
+        """Приход и расход за всю историю по правилам таблицы totals (без исключенных)"""
+        import numpy as np
+        n = self.size
+        table = self.type_category_sums(self.alive[:n] & ~self.excluded[:n])
+        counted = np.ones(table.shape[1], dtype=bool)
+        counted[[self.code('category', name) for name in excluded_categories
+                 if self.code('category', name) >= 0]] = False
+
+        def type_sum(name):
+            code = self.code('type', name)
+            return float(table[code, counted].sum()) if code >= 0 else 0.0
+
+        return {'total_income': type_sum('Приход'), 'expense_sum': type_sum('Расход')}
+
+    def type_category_sums(self, mask: np.ndarray) -> np.ndarray:
+        """Суммы amount по парам (тип, категория) для строк mask - один проход bincount"""
+        import numpy as np
+        n = self.size
+        n_types, n_categories = len(self.labels['type']), len(self.labels['category'])
+        pairs = self.types[:n].astype(np.int64) * n_categories + self.categories[:n]
+        sums = np.bincount(pairs, weights=np.where(mask, self.amounts[:n], 0.0),
+                           minlength=n_types * n_categories)
+        return sums.reshape(n_types, n_categories)
+
+    def monthly_summary(self, year: int, month: int) -> Dict:
+        """То же, что DatabaseManager.get_monthly_summary, но масками и bincount по массивам"""
+        import numpy as np
+        start, end = (np.datetime64(bound, 'D').astype(np.int64) for bound in month_bounds(year, month))
+        n = self.size
+        days = self.days[:n]
+        in_month = self.alive[:n] & (days >= start) & (days < end)
+
+        day_index = days[in_month] - start
+        magnitude = np.abs(self.amounts[:n][in_month])
+        types = self.types[:n][in_month]
+        is_income = types == self.code('type', 'Приход')
+        length = int(end - start)
+        income = np.bincount(day_index, weights=np.where(is_income, magnitude, 0.0), minlength=length)
+        expense = np.bincount(day_index, weights=np.where(is_income, 0.0, magnitude), minlength=length)
+        counts = np.bincount(day_index, minlength=length)
+        days_out = [
+            {'day': str(np.datetime64(int(start + offset), 'D')), 'income': float(income[offset]),
+             'expense': float(expense[offset]), 'count': int(counts[offset])}
+            for offset in np.flatnonzero(counts)
+        ]
+
+        categories = self.categories[:n][in_month]
+        signed = np.where(types == self.code('type', 'Расход'), magnitude, -magnitude)
+        labels = self.labels['category']
+        by_category = np.bincount(categories, weights=signed, minlength=len(labels))
+        present = np.bincount(categories, minlength=len(labels))
+
+        return {
+            'days': days_out,
+            'categories': {labels[code]: float(by_category[code]) for code in np.flatnonzero(present)},
+            'total_income': float(income.sum()),
+            'total_expense': float(expense.sum()),
+            'count': int(counts.sum())
+        }
+
+
+def _iso_days(values: List[Optional[str]]) -> np.ndarray:
+    """ISO-даты в номера дней от 1970-01-01; None и мусор - ColumnarStore.NO_DAY"""
+    import numpy as np
+    days = np.array([value[:10] if value else "NaT" for value in values], dtype="datetime64[D]")
+    result = days.astype(np.int64)
+    result[np.isnat(days)] = ColumnarStore.NO_DAY
+    return result
+
+
+class TrackerModel:
+    """Данные в памяти для интерфейса, которые меняются по одной операции.
+
+    Списки transactions и car_deals отсортированы так же, как их возвращает база.
+    Итоги для панели сводки ведут триггеры базы, модель их только читает.
+    Методы add_/update_/delete_ пишут в базу и возвращают позиции измененной строки,
+    чтобы интерфейс обновил только ее.
+    """
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self.transactions = []
+        self.car_deals = []
+        self.transactions_by_id = {}
+        self.car_deals_by_id = {}
+        self.initial_capital = 0.0
+        self.columns = ColumnarStore()
+        self.reload()
+
+    def reload(self):
+        """Полностью перечитывает данные из базы (после импорта и т.п.)"""
+        self.load(self.fetch(self.db))
+
+    @staticmethod
+    def fetch(db: DatabaseManager) -> Dict:
+        """Читает все данные для модели; можно вызывать в фоновом потоке со своим соединением"""
+        transactions = db.get_all_transactions()
+        return {
+            'transactions': transactions,
+            'columns': ColumnarStore.from_records(transactions),
+            'car_deals': db.get_all_car_deals(),
+            'initial_capital': db.get_initial_capital()
+        }
+
+    @timed("model.load")
+    def load(self, data: Dict):
+        """Подменяет данные модели результатом fetch"""
+        self.transactions[:] = data['transactions']
+        self.car_deals[:] = data['car_deals']
+        self.transactions_by_id = {tr["id"]: tr for tr in self.transactions}
+        self.car_deals_by_id = {deal["id"]: deal for deal in self.car_deals}
+        self.initial_capital = data['initial_capital']
+        self.columns = data['columns']
+
+    @property
+    def totals(self) -> Dict:
+        return self.db.get_totals()
+
+    # ---------------- Транзакции ----------------
+    def add_transaction(self, transaction: Dict):
+        """Возвращает (позиция, строка) или None, если такая операция уже есть"""
+        transaction_id = self.db.add_transaction(transaction)
+        if transaction_id is None:
+            return None
+        row = self.db.get_transaction(transaction_id)
+        return self._insert_transaction(row), row
+
+    def update_transaction(self, transaction_id: int, updates: Dict):
+        """Возвращает (старая позиция, новая позиция, строка) или None при ошибке"""
+        old_row = self.transactions_by_id.get(transaction_id)
+        if old_row is None or not self.db.update_transaction(transaction_id, updates):
+            return None
+        old_index = self._remove_transaction(old_row)
+        row = self.db.get_transaction(transaction_id)
+        return old_index, self._insert_transaction(row), row
+
+    def delete_transaction(self, transaction_id: int):
+        """Возвращает (позиция, удаленная строка) или None"""
+        row = self.transactions_by_id.get(transaction_id)
+        if row is None or not self.db.delete_transaction(transaction_id):
+            return None
+        return self._remove_transaction(row), row
+
+    def transaction_position(self, row: TransactionRecord) -> int:
+        """Позиция операции в списке transactions (для новой строки - место вставки)"""
+        return _desc_position(self.transactions, _transaction_sort_key(row), _transaction_sort_key)
+
+    def _insert_transaction(self, row: TransactionRecord) -> int:
+        index = self.transaction_position(row)
+        self.transactions.insert(index, row)
+        self.transactions_by_id[row.id] = row
+        self.columns.update(row)
+        return index
+
+    def _remove_transaction(self, row: TransactionRecord) -> int:
+        index = self.transaction_position(row)
+        del self.transactions[index]
+        del self.transactions_by_id[row.id]
+        self.columns.remove(row.id)
+        return index
+
+    # ---------------- Авто-сделки ----------------
+    def add_car_deal(self, car_deal: Dict):
+        """Возвращает (позиция, строка)"""
+        row = self.db.get_car_deal(self.db.add_car_deal(car_deal))
+        return self._insert_car_deal(row), row
+
+    def update_car_deal(self, deal_id: int, updates: Dict):
+        """Возвращает (старая позиция, новая позиция, строка) или None при ошибке"""
+        old_row = self.car_deals_by_id.get(deal_id)
+        if old_row is None or not self.db.update_car_deal(deal_id, updates):
+            return None
+        old_index = self._remove_car_deal(old_row)
+        row = self.db.get_car_deal(deal_id)
+        return old_index, self._insert_car_deal(row), row
+
+    def delete_car_deal(self, deal_id: int):
+        """Возвращает (позиция, удаленная строка) или None"""
+        row = self.car_deals_by_id.get(deal_id)
+        if row is None or not self.db.delete_car_deal(deal_id):
+            return None
+        return self._remove_car_deal(row), row
+
+    def car_deal_position(self, row: CarDealRecord) -> int:
+        """Позиция авто-сделки в списке car_deals (для новой строки - место вставки)"""
+        return _desc_position(self.car_deals, _car_deal_sort_key(row), _car_deal_sort_key)
+
+    def _insert_car_deal(self, row: Dict) -> int:
+        index = self.car_deal_position(row)
+        self.car_deals.insert(index, row)
+        self.car_deals_by_id[row["id"]] = row
+        return index
+
+    def _remove_car_deal(self, row: Dict) -> int:
+        index = self.car_deal_position(row)
+        del self.car_deals[index]
+        del self.car_deals_by_id[row["id"]]
+        return index
@@ -1,9 +1,23 @@
 import os
+import sqlite3
 import tempfile
 import pytest
 import pandas as pd
 from datetime import datetime
-from MoneyTracker import DatabaseManager  # <-- замени на свой путь
+from money_core import (DatabaseManager, TrackerModel,  # <-- замени на свой путь
+                        OperationCancelled, transaction_key, car_deal_key,
+                        TransactionRecord, ColumnarStore, TransactionFilter,
+                        compute_summary, build_monthly_report, Instrumentation, INSTRUMENTATION,
+                        QueryTracer, normalize_sql, parameters_shape, SCHEMA_VERSION,
+                        normalize_transactions_frame, normalize_car_deals_frame)
+from MoneyTracker import VirtualTreeview, BackgroundWorker, MoneyTrackerApp
+from benchmarks.run import run_size, compare
+from benchmarks import generate, startup
+import money_cli
+import itertools
+import json
+import subprocess
+import sys
 
 @pytest.fixture
 def db():
@@ -41,6 +55,175 @@ def test_update_transaction(db):
     assert tr["amount"] == -600
     assert tr["description"] == "Продукты"
 
+def test_update_transaction_rejects_unparsed_date(db):
+    tr_id = db.add_transaction({
+        "date": "05.02.2025 10:00", "type": "Расход", "amount": -1, "description": "x", "category": "КЦ"
+    })
+    assert db.update_transaction(tr_id, {"date": "05.02.202511:00"}) is False
+    assert db.get_transaction(tr_id)["date_iso"] == "2025-02-05 10:00:00"
+
+    assert db.update_transaction(tr_id, {"date": "06.02.2025 11:00"}) is True
+    assert [tr["id"] for tr in db.get_transactions_for_month(2025, 2)] == [tr_id]
+    assert db.get_transaction(tr_id)["date_iso"] == "2025-02-06 11:00:00"
+
+def test_transactions_sorted_by_iso_date(db):
+    for date in ["05.02.2025 10:00", "20.01.2025 09:00", "31.01.2025 23:59", "01.02.2025 00:00"]:
+        db.add_transaction({
+            "date": date, "type": "Расход", "amount": -1, "description": date, "category": "КЦ"
+        })
+    dates = [tr["date"] for tr in db.get_all_transactions()]
+    assert dates == ["05.02.2025 10:00", "01.02.2025 00:00", "31.01.2025 23:59", "20.01.2025 09:00"]
+    assert db.get_all_transactions()[0]["date_iso"] == "2025-02-05 10:00:00"
+
+    january = db.get_transactions_for_month(2025, 1)
+    assert [tr["date"] for tr in january] == ["31.01.2025 23:59", "20.01.2025 09:00"]
+    assert len(db.get_transactions_for_day(2025, 2, 1)) == 1
+
+def test_month_query_uses_date_index(db):
+    plan = db.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM transactions WHERE date_iso >= ? AND date_iso < ?",
+        ("2025-01-01", "2025-02-01")
+    ).fetchall()
+    assert any("idx_transactions_date_iso" in row[-1] for row in plan)
+
+def test_migrates_legacy_dates(tmp_path):
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL, type TEXT NOT NULL, amount REAL NOT NULL,
+            description TEXT NOT NULL, category TEXT NOT NULL,
+            payment_type TEXT NOT NULL DEFAULT 'Наличные'
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO transactions (date, type, amount, description, category) VALUES (?, ?, ?, ?, ?)",
+        [("15.03.2024 12:30", "Приход", 100, "a", "КЦ"), ("02.04.2024 08:00", "Расход", -50, "b", "КЦ")]
+    )
+    conn.commit()
+    conn.close()
+
+    legacy = DatabaseManager(str(path))
+    try:
+        trs = legacy.get_all_transactions()
+        assert [tr["date_iso"] for tr in trs] == ["2024-04-02 08:00:00", "2024-03-15 12:30:00"]
+        assert trs[0]["exclude_from_total"] is False
+        assert len(legacy.get_transactions_for_month(2024, 3)) == 1
+    finally:
+        legacy.close()
+
+def test_interrupted_date_backfill_resumes_on_open(tmp_path):
+    path = str(tmp_path / "resume.db")
+    db = DatabaseManager(path)
+    for date in ["15.03.2024 12:30", "16.03.2024 09:00"]:
+        db.add_transaction({"date": date, "type": "Расход", "amount": -1, "description": date, "category": "КЦ"})
+    # Заполнение прервано: у части строк date_iso так и не появился
+    db.conn.execute("UPDATE transactions SET date_iso = NULL WHERE id = 2")
+    db.conn.commit()
+    db.close()
+
+    db = DatabaseManager(path)
+    try:
+        assert db.get_transaction(2)["date_iso"] == "2024-03-16 09:00:00"
+        assert len(db.get_transactions_for_month(2024, 3)) == 2
+    finally:
+        db.close()
+
+def test_monthly_summary(db):
+    rows = [
+        ("01.03.2025 10:00", "Приход", 1000, "КЦ"),
+        ("01.03.2025 12:00", "Расход", -300, "Аренда"),
+        ("15.03.2025 09:00", "Расход", -200, "Аренда"),
+        ("15.03.2025 18:00", "Приход", 50, "Аренда"),
+        ("01.04.2025 09:00", "Расход", -999, "Аренда"),
+    ]
+    for date, tr_type, amount, category in rows:
+        db.add_transaction({
+            "date": date, "type": tr_type, "amount": amount, "description": "x", "category": category
+        })
+
+    summary = db.get_monthly_summary(2025, 3)
+    assert summary["days"] == [
+        {"day": "2025-03-01", "income": 1000, "expense": 300, "count": 2},
+        {"day": "2025-03-15", "income": 50, "expense": 200, "count": 2},
+    ]
+    assert summary["categories"] == {"Аренда": 450, "КЦ": -1000}
+    assert summary["total_income"] == 1050
+    assert summary["total_expense"] == 500
+    assert summary["count"] == 4
+
+    assert db.get_monthly_summary(2025, 5)["days"] == []
+
+def test_duplicate_transaction_is_ignored(db):
+    transaction = {
+        "date": "10.05.2025 09:00", "type": "Расход", "amount": -100,
+        "description": "Такси", "category": "Другое"
+    }
+    first_id = db.add_transaction(transaction)
+    assert first_id is not None
+    # Тот же день, то же содержимое - дубликат, даже если время другое
+    assert db.add_transaction(dict(transaction, date="10.05.2025 18:30")) is None
+    assert db.exists_transaction(transaction)
+    assert db.add_transaction(dict(transaction, date="11.05.2025 09:00")) is not None
+    assert len(db.get_all_transactions()) == 2
+
+    # Правка, превращающая операцию в дубликат, отклоняется
+    second_id = db.add_transaction(dict(transaction, description="Такси домой"))
+    assert db.update_transaction(second_id, {"description": "Такси"}) is False
+    assert db.update_transaction(second_id, {"description": "Такси в аэропорт"}) is True
+    assert db.exists_transaction(dict(transaction, description="Такси в аэропорт"))
+
+def test_fingerprint_backfill_reports_existing_duplicates(tmp_path):
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL, type TEXT NOT NULL, amount REAL NOT NULL,
+            description TEXT NOT NULL, category TEXT NOT NULL,
+            payment_type TEXT NOT NULL DEFAULT 'Наличные',
+            exclude_from_total INTEGER DEFAULT 0
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO transactions (date, type, amount, description, category) VALUES (?, ?, ?, ?, ?)",
+        [("01.06.2024 10:00", "Расход", -10, "Кофе", "Другое"),
+         ("01.06.2024 15:00", "Расход", -10, "Кофе", "Другое"),
+         ("02.06.2024 10:00", "Расход", -10, "Кофе", "Другое")]
+    )
+    conn.commit()
+    conn.close()
+
+    legacy = DatabaseManager(str(path))
+    try:
+        assert len(legacy.get_all_transactions()) == 3
+        duplicates = legacy.get_duplicate_transactions()
+        assert [(tr["id"], tr["duplicate_of"]) for tr in duplicates] == [(2, 1)]
+    finally:
+        legacy.close()
+
+def test_interrupted_fingerprint_backfill_resumes_on_open(tmp_path):
+    path = str(tmp_path / "resume.db")
+    db = DatabaseManager(path)
+    transaction = {"date": "01.06.2024 10:00", "type": "Расход", "amount": -10,
+                   "description": "Кофе", "category": "Другое"}
+    for description in ["Кофе", "Чай", "Сок"]:
+        db.add_transaction(dict(transaction, description=description))
+    # Заполнение прервано, а строка 3 к тому же совпадает со строкой 1
+    db.conn.execute("UPDATE transactions SET fingerprint = NULL WHERE id IN (2, 3)")
+    db.conn.execute("UPDATE transactions SET description = 'Кофе' WHERE id = 3")
+    db.conn.commit()
+    db.close()
+
+    db = DatabaseManager(path)
+    try:
+        assert db.conn.execute("SELECT COUNT(*) FROM transactions WHERE fingerprint IS NULL").fetchone()[0] == 0
+        assert db.exists_transaction(dict(transaction, description="Чай"))
+        assert [(tr["id"], tr["duplicate_of"]) for tr in db.get_duplicate_transactions()] == [(3, 1)]
+    finally:
+        db.close()
+
 # ---------- Тесты авто-сделок ----------
 def test_add_and_get_car_deal(db):
     deal = {
@@ -76,6 +259,677 @@ def test_update_car_deal(db):
     assert deal["price"] == 18000
     assert deal["header"] == 8000
 
+# ---------- Тесты профилей подключения ----------
+def test_profile_applied_on_open(tmp_path):
+    db = DatabaseManager(str(tmp_path / "profile.db"))
+    try:
+        settings = db.get_effective_settings()
+        assert settings == {"profile": "interactive", "journal_mode": "WAL", "synchronous": "NORMAL",
+                            "cache_size": -16000, "mmap_size": 64 * 1024 * 1024, "temp_store": "MEMORY",
+                            "busy_timeout": 5000, "query_only": 0}
+    finally:
+        db.close()
+
+    with pytest.raises(ValueError):
+        DatabaseManager(":memory:", profile="turbo")
+
+def test_profile_switch_is_temporary(tmp_path):
+    db = DatabaseManager(str(tmp_path / "profile.db"))
+    try:
+        with db.profile("reporting"):
+            assert db.get_effective_settings()["query_only"] == 1
+            with pytest.raises(sqlite3.OperationalError):
+                db.conn.execute("DELETE FROM transactions")
+        assert db.get_effective_settings()["profile"] == "interactive"
+        assert db.get_effective_settings()["query_only"] == 0
+    finally:
+        db.close()
+
+def test_import_runs_in_bulk_profile(db, tmp_path):
+    path = tmp_path / "bulk.xlsx"
+    pd.DataFrame({"Дата": ["01.01.2024 10:00"], "Тип": ["Расход"], "Сумма": [10], "Описание": ["op"],
+                  "Категория": ["КЦ"]}).to_excel(path, sheet_name="Транзакции", index=False)
+    seen = []
+
+    def progress(done, total, message):
+        seen.append(db.get_effective_settings()["synchronous"])
+
+    db.import_from_excel(str(path), chunk_size=10, progress=progress)
+    db.import_from_excel(str(path), progress=progress)
+    assert seen == ["OFF", "OFF"]
+    assert db.get_effective_settings()["synchronous"] == "NORMAL"
+
+# ---------- Тесты пачек (batch) ----------
+def test_batch_commits_once_on_exit(tmp_path):
+    path = str(tmp_path / "batch.db")
+    db = DatabaseManager(path)
+    other = sqlite3.connect(path)
+    try:
+        with db.batch():
+            for i in range(3):
+                db.add_transaction({"date": f"0{i + 1}.01.2024 10:00", "type": "Расход", "amount": i,
+                                    "description": f"op {i}", "category": "КЦ"})
+            db.update_initial_capital(100)
+            # Пока пачка открыта, другое подключение ничего не видит
+            assert other.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 0
+        assert other.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 3
+        assert other.execute("SELECT initial_capital FROM settings").fetchone()[0] == 100
+    finally:
+        other.close()
+        db.close()
+
+def test_batch_rolls_back_on_exception(db):
+    db.add_transaction({"date": "01.01.2024 10:00", "type": "Расход", "amount": 1,
+                        "description": "before", "category": "КЦ"})
+    with pytest.raises(RuntimeError):
+        with db.batch():
+            db.add_transaction({"date": "02.01.2024 10:00", "type": "Расход", "amount": 2,
+                                "description": "inside", "category": "КЦ"})
+            db.add_car_deal({"brand": "Kia", "year": "2020", "vin": "K", "header": 10})
+            raise RuntimeError("stop")
+    assert [tr["description"] for tr in db.get_all_transactions()] == ["before"]
+    assert db.count_car_deals() == 0
+    assert db.get_totals()["car_profit"] == 0
+
+def test_nested_batch_uses_savepoint(db):
+    with db.batch():
+        db.add_car_deal({"brand": "Kia", "year": "2020", "vin": "K"})
+        with pytest.raises(ValueError):
+            with db.batch():
+                db.add_car_deal({"brand": "BMW", "year": "2021", "vin": "B"})
+                raise ValueError("inner")
+        db.add_car_deal({"brand": "Audi", "year": "2022", "vin": "A"})
+    assert [deal["brand"] for deal in db.get_all_car_deals()] == ["Audi", "Kia"]
+    assert not db.conn.in_transaction
+
+# ---------- Тесты справочников ----------
+def test_lookup_tables_store_ids(db):
+    assert db.get_transaction_types() == ["Приход", "Расход"]
+    assert db.get_payment_types() == ["Наличные", "Безнал", "Другое"]
+    assert db.get_categories()[:2] == ["КЦ", "Реклама"]
+    assert set(db.get_excluded_categories()) == {"ЗП окладники", "ЗП проценты", "Комиссия брок"}
+
+    tr_id = db.add_transaction({"date": "01.01.2024 10:00", "type": "Расход", "amount": -5,
+                                "description": "op", "category": "Новая", "payment_type": "Карта"})
+    assert db.get_categories()[-1] == "Новая" and db.get_payment_types()[-1] == "Карта"
+    raw = db.conn.execute("SELECT category_id, payment_type_id FROM transactions WHERE id = ?",
+                          (tr_id,)).fetchone()
+    assert all(isinstance(value, int) for value in raw)
+
+    assert db.update_transaction(tr_id, {"category": "Аренда"})
+    assert db.get_transaction(tr_id).category == "Аренда"
+    view_row = db.conn.execute("SELECT category, payment_type FROM transactions_view").fetchone()
+    assert tuple(view_row) == ("Аренда", "Карта")
+
+def test_lookup_cache_survives_rollback(db):
+    with pytest.raises(RuntimeError):
+        with db.batch():
+            db.add_transaction({"date": "01.01.2024 10:00", "type": "Расход", "amount": -5,
+                                "description": "op", "category": "Временная"})
+            raise RuntimeError("stop")
+    assert "Временная" not in db.get_categories()
+    db.add_transaction({"date": "01.01.2024 10:00", "type": "Расход", "amount": -5,
+                        "description": "op", "category": "Временная"})
+    assert db.get_all_transactions()[0].category == "Временная"
+
+def test_text_columns_migrated_to_lookups(tmp_path):
+    path = tmp_path / "text.db"
+    db = DatabaseManager(str(path))
+    db.add_transaction({"date": "01.01.2024 10:00", "type": "Расход", "amount": -5,
+                        "description": "keep", "category": "Аренда"})
+    db.close()
+
+    # Та же база в текстовой схеме (как до справочников) с отдельной таблицей исключений
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE old AS SELECT id, date, type, amount, description, category, payment_type,
+                                   exclude_from_total, date_iso, fingerprint FROM transactions_view;
+        DROP VIEW transactions_view;
+        DROP TABLE transactions;
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL, type TEXT NOT NULL,
+            amount REAL NOT NULL, description TEXT NOT NULL, category TEXT NOT NULL,
+            payment_type TEXT NOT NULL DEFAULT 'Наличные', exclude_from_total INTEGER DEFAULT 0,
+            date_iso TEXT, fingerprint TEXT
+        );
+        INSERT INTO transactions SELECT * FROM old;
+        INSERT INTO transactions (date, type, amount, description, category, payment_type, date_iso, fingerprint)
+        VALUES ('02.01.2024 10:00', 'Расход', -7, 'legacy', 'Старая', 'Чек', '2024-01-02 10:00:00', 'f2');
+        DELETE FROM transactions WHERE id = 2;
+        INSERT INTO transactions (date, type, amount, description, category, payment_type, date_iso, fingerprint)
+        VALUES ('03.01.2024 10:00', 'Расход', -9, 'legacy 2', 'Старая', 'Чек', '2024-01-03 10:00:00', 'f3');
+        DROP TABLE old;
+        DROP TABLE categories;
+        CREATE TABLE excluded_categories (name TEXT PRIMARY KEY);
+        INSERT INTO excluded_categories VALUES ('Старая');
+    """)
+    conn.close()
+
+    db = DatabaseManager(str(path))
+    try:
+        assert [(tr.id, tr.category, tr.payment_type) for tr in db.get_all_transactions()] == \
+            [(3, "Старая", "Чек"), (1, "Аренда", "Наличные")]
+        assert "Старая" in db.get_categories() and "Чек" in db.get_payment_types()
+        assert db.get_excluded_categories() == ["Старая"]
+        db.rebuild_totals()
+        assert db.get_totals()["expense_sum"] == -5
+        # AUTOINCREMENT не переиспользует удаленный id
+        new_id = db.add_transaction({"date": "04.01.2024 10:00", "type": "Расход", "amount": -1,
+                                     "description": "new", "category": "Аренда"})
+        assert new_id == 4
+    finally:
+        db.close()
+
+def test_failed_lookup_migration_rolls_back(tmp_path):
+    path = str(tmp_path / "broken.db")
+    conn = sqlite3.connect(path)
+    # description без NOT NULL: копирование в новую таблицу упадет посреди пересборки
+    conn.executescript("""
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL, type TEXT NOT NULL,
+            amount REAL NOT NULL, description TEXT, category TEXT NOT NULL,
+            payment_type TEXT NOT NULL DEFAULT 'Наличные'
+        );
+        INSERT INTO transactions (date, type, amount, description, category)
+        VALUES ('01.01.2024 10:00', 'Расход', -5, NULL, 'Старая');
+    """)
+    conn.close()
+
+    with pytest.raises(sqlite3.IntegrityError):
+        DatabaseManager(path)
+
+    conn = sqlite3.connect(path)
+    try:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(transactions)")]
+        assert "category" in columns and "category_id" not in columns
+        assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 1
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'transactions_new'").fetchone() is None
+        assert conn.execute("SELECT 1 FROM categories WHERE name = 'Старая'").fetchone() is None
+    finally:
+        conn.close()
+
+# ---------- Тесты итогов ----------
+def test_totals_follow_inserts_updates_and_deletes(db):
+    income_id = db.add_transaction({"date": "01.01.2025 10:00", "type": "Приход", "amount": 500,
+                                    "description": "a", "category": "КЦ"})
+    expense_id = db.add_transaction({"date": "02.01.2025 10:00", "type": "Расход", "amount": -200,
+                                     "description": "b", "category": "Аренда"})
+    db.add_transaction({"date": "03.01.2025 10:00", "type": "Расход", "amount": -1000,
+                        "description": "c", "category": "ЗП окладники"})
+    deal_id = db.add_car_deal({"brand": "Kia", "year": "2020", "vin": "K", "header": 300})
+    assert db.get_totals() == {"total_income": 500, "expense_sum": -200, "car_profit": 300}
+
+    db.update_transaction(expense_id, {"amount": -250})
+    assert db.get_totals()["expense_sum"] == -250
+    db.update_transaction(expense_id, {"category": "ЗП проценты"})
+    assert db.get_totals()["expense_sum"] == 0
+    db.update_transaction(expense_id, {"category": "Аренда", "exclude_from_total": 1})
+    assert db.get_totals()["expense_sum"] == 0
+    db.update_transaction(income_id, {"type": "Расход", "amount": -500})
+    assert db.get_totals()["total_income"] == 0 and db.get_totals()["expense_sum"] == -500
+
+    db.update_car_deal(deal_id, {"header": 120})
+    assert db.get_totals()["car_profit"] == 120
+    db.delete_car_deal(deal_id)
+    db.delete_transaction(income_id)
+    assert db.get_totals() == {"total_income": 0, "expense_sum": 0, "car_profit": 0}
+
+def test_opening_current_database_writes_nothing(tmp_path):
+    path = str(tmp_path / "current.db")
+    DatabaseManager(path).close()
+    conn = sqlite3.connect(path, isolation_level=None)
+    schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    # Другое подключение держит блокировку записи: открытие не должно ее ждать
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        db = DatabaseManager(path)
+        assert db.conn.total_changes == 0
+        db.close()
+    finally:
+        conn.execute("ROLLBACK")
+    assert conn.execute("PRAGMA schema_version").fetchone()[0] == schema_version
+
+    # Устаревшее представление заменяется при смене версии схемы
+    conn.executescript("""
+        DROP VIEW transactions_view;
+        CREATE VIEW transactions_view AS SELECT id FROM transactions;
+        PRAGMA user_version = 0;
+    """)
+    conn.close()
+    db = DatabaseManager(path)
+    try:
+        db.add_transaction({"date": "01.01.2025 10:00", "type": "Приход", "amount": 5,
+                            "description": "a", "category": "КЦ"})
+        assert [tr.category for tr in db.get_all_transactions()] == ["КЦ"]
+    finally:
+        db.close()
+
+def test_totals_triggers_restored_and_replaced_by_schema_version(tmp_path):
+    path = str(tmp_path / "triggers.db")
+    db = DatabaseManager(path)
+    # Одного триггера нет, другой устарел, версия схемы старая
+    db.conn.executescript("""
+        DROP TRIGGER trg_transactions_totals_insert;
+        DROP TRIGGER trg_car_deals_totals_insert;
+        CREATE TRIGGER trg_car_deals_totals_insert AFTER INSERT ON car_deals BEGIN SELECT 1; END;
+        PRAGMA user_version = 0;
+    """)
+    db.close()
+
+    db = DatabaseManager(path)
+    try:
+        assert db.conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        db.add_transaction({"date": "01.01.2025 10:00", "type": "Приход", "amount": 500,
+                            "description": "a", "category": "КЦ"})
+        db.add_car_deal({"brand": "Kia", "year": "2020", "vin": "K", "header": 300})
+        assert db.get_totals() == {"total_income": 500, "expense_sum": 0, "car_profit": 300}
+    finally:
+        db.close()
+
+def test_totals_rebuilt_for_legacy_database_and_excluded_change(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    db = DatabaseManager(path)
+    db.add_transaction({"date": "01.01.2025 10:00", "type": "Расход", "amount": -100,
+                        "description": "a", "category": "Комиссия брок"})
+    db.add_transaction({"date": "02.01.2025 10:00", "type": "Расход", "amount": -40,
+                        "description": "b", "category": "Аренда"})
+    db.conn.execute("DROP TABLE totals")
+    db.conn.commit()
+    db.close()
+
+    db = DatabaseManager(path)
+    try:
+        assert db.get_totals()["expense_sum"] == -40
+        db.set_excluded_categories(["Аренда"])
+        assert db.get_excluded_categories() == ["Аренда"]
+        assert db.get_totals()["expense_sum"] == -100
+    finally:
+        db.close()
+
+# ---------- Тесты компактных записей ----------
+def test_records_are_slotted_and_dict_compatible(db):
+    for i in range(2):
+        db.add_transaction({"date": f"0{i + 1}.01.2024 10:00", "type": "Расход", "amount": -10 - i,
+                            "description": f"op {i}", "category": "Аренда", "payment_type": "Безнал"})
+    first, second = db.get_all_transactions()
+    assert isinstance(first, TransactionRecord)
+    assert not hasattr(first, "__dict__")
+    assert first.amount == first["amount"] == -11
+    assert first.get("missing", "x") == "x"
+    with pytest.raises(KeyError):
+        first["missing"]
+    assert dict(first)["description"] == "op 1"
+    assert first == dict(first.items()) and first != second
+    # Повторяющиеся строки - один объект на все строки
+    assert first.category is second.category
+    assert first.payment_type is second.payment_type
+
+    db.add_car_deal({"brand": "Kia", "year": "2020", "vin": "K1", "price": 10})
+    deal = db.get_car_deal(1)
+    assert (deal.brand, deal["price"], "vin" in deal) == ("Kia", 10, True)
+
+# ---------- Тесты keyset-пагинации ----------
+def test_iter_transactions_keyset(db):
+    for i in range(23):
+        db.add_transaction({"date": f"{i % 4 + 1:02d}.01.2024 10:00", "type": "Расход", "amount": i,
+                            "description": f"op {i}", "category": "КЦ"})
+    # Строки со старой нераспознанной датой идут в конце, как в get_all_transactions
+    db.conn.execute("UPDATE transactions SET date_iso = NULL WHERE id % 5 = 0")
+    db.conn.commit()
+    expected = [tr["id"] for tr in db.get_all_transactions()]
+
+    page = db.iter_transactions(limit=10)
+    assert [tr["id"] for tr in page] == expected[:10]
+    page = db.iter_transactions(after=transaction_key(page[-1]), limit=10)
+    assert [tr["id"] for tr in page] == expected[10:20]
+    back = db.iter_transactions(after=transaction_key(page[0]), limit=3, direction="asc")
+    assert [tr["id"] for tr in back] == expected[7:10][::-1]
+
+    streamed = [tr["id"] for batch in db.iter_transaction_batches(batch_size=4) for tr in batch]
+    assert streamed == expected
+    streamed = [tr["id"] for batch in db.iter_transaction_batches(batch_size=6, direction="asc") for tr in batch]
+    assert streamed == expected[::-1]
+    with pytest.raises(ValueError):
+        db.iter_transactions(direction="up")
+
+def test_iter_car_deals_keyset(db):
+    for i in range(12):
+        db.add_car_deal({"brand": f"car {i}", "year": str(2018 + i % 3), "vin": str(i)})
+    expected = [deal["id"] for deal in db.get_all_car_deals()]
+    streamed = [deal["id"] for batch in db.iter_car_deal_batches(batch_size=5) for deal in batch]
+    assert streamed == expected
+    page = db.iter_car_deals(after=car_deal_key(db.get_car_deal(expected[3])), limit=4)
+    assert [deal["id"] for deal in page] == expected[4:8]
+
+def test_keyset_queries_use_index(db):
+    plan = " ".join(row[3] for row in db.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM transactions WHERE (date_iso, id) < (?, ?) "
+        "ORDER BY date_iso DESC, id DESC LIMIT 10", ("2024-01-01", 1)))
+    assert "idx_transactions_date_iso" in plan and "TEMP B-TREE" not in plan
+
+# ---------- Тесты фильтров отчета ----------
+def test_transaction_filter_results(db):
+    rows = [
+        ("01.03.2025 10:00", "Расход", -100, "Аренда", "Безнал", False),
+        ("05.03.2025 10:00", "Приход", 500, "КЦ", "Наличные", False),
+        ("10.03.2025 10:00", "Расход", -40, "Аренда", "Наличные", True),
+        ("02.04.2025 10:00", "Расход", -70, "Аренда", "Безнал", False),
+        ("03.04.2025 10:00", "Расход", -30, "Реклама", "Безнал", False),
+    ]
+    for i, (date, tr_type, amount, category, payment, excluded) in enumerate(rows):
+        db.add_transaction({"date": date, "type": tr_type, "amount": amount, "description": f"op {i}",
+                            "category": category, "payment_type": payment, "exclude_from_total": excluded})
+
+    def descriptions(flt):
+        return [tr.description for tr in db.get_transactions_page(0, 100, flt)]
+
+    march = TransactionFilter(date_from="2025-03-01", date_to="2025-04-01")
+    assert descriptions(march) == ["op 2", "op 1", "op 0"]
+    rent = TransactionFilter(categories=["Аренда"], exclude_from_total=False)
+    assert descriptions(rent) == ["op 3", "op 0"]
+    assert descriptions(TransactionFilter(categories=["Аренда", "Реклама"], payment_types=["Безнал"])) == \
+        ["op 4", "op 3", "op 0"]
+    assert descriptions(TransactionFilter(types=["Приход"])) == ["op 1"]
+    assert descriptions(TransactionFilter(categories=["Нет такой"])) == []
+    assert len(descriptions(TransactionFilter())) == 5
+
+    assert db.count_transactions(rent) == 2
+    assert db.get_filtered_summary(march) == {"count": 3, "income": 500, "expense": -140}
+
+    expense = TransactionFilter(types=["Расход"])
+    page = db.iter_transactions(limit=2, flt=expense)
+    assert [tr.description for tr in page] == ["op 4", "op 3"]
+    page = db.iter_transactions(after=transaction_key(page[-1]), limit=10, flt=expense)
+    assert [tr.description for tr in page] == ["op 2", "op 0"]
+
+def test_transaction_filter_uses_indexes(db):
+    options = {"date_from": "2024-01-01", "date_to": "2024-02-01", "types": ["Расход"],
+               "categories": ["КЦ"], "payment_types": ["Безнал", "Наличные"], "exclude_from_total": False}
+    for size in range(1, len(options) + 1):
+        for names in itertools.combinations(options, size):
+            if names == ("exclude_from_total",):
+                continue  # один флаг почти ничего не отсекает - для него индекса нет намеренно
+            clause, params = db.compile_filter(TransactionFilter(**{name: options[name] for name in names}))
+            for query in (f"SELECT id FROM transactions_view WHERE {clause} ORDER BY date_iso DESC, id DESC LIMIT 10",
+                          f"SELECT COUNT(*) FROM transactions WHERE {clause}"):
+                plan = [row[3] for row in db.conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+                assert not any(step.startswith("SCAN") for step in plan), (names, plan)
+
+    # Одно значение справочника - строки идут из индекса уже в порядке даты
+    clause, params = db.compile_filter(TransactionFilter(categories=["КЦ"], date_from="2024-01-01"))
+    plan = " ".join(row[3] for row in db.conn.execute(
+        f"EXPLAIN QUERY PLAN SELECT id FROM transactions_view WHERE {clause} "
+        "ORDER BY date_iso DESC, id DESC LIMIT 10", params))
+    assert "idx_transactions_category_date" in plan and "TEMP B-TREE" not in plan
+
+def test_filter_indexes_replaced_on_schema_upgrade(tmp_path):
+    path = str(tmp_path / "wide.db")
+    db = DatabaseManager(path)
+    # Широкие индексы прежней версии схемы
+    db.conn.executescript("""
+        DROP INDEX idx_transactions_category_date;
+        CREATE INDEX idx_transactions_category_date
+            ON transactions(category_id, date_iso, id, type_id, payment_type_id, exclude_from_total, amount);
+        CREATE INDEX idx_transactions_excluded_date ON transactions(exclude_from_total, date_iso);
+        PRAGMA user_version = 1;
+    """)
+    db.close()
+
+    db = DatabaseManager(path)
+    try:
+        indexes = dict(db.conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"))
+        assert "idx_transactions_excluded_date" not in indexes
+        assert indexes["idx_transactions_category_date"].endswith("transactions(category_id, date_iso)")
+    finally:
+        db.close()
+
+# ---------- Тесты полнотекстового поиска ----------
+def test_search_transactions_and_car_deals(db):
+    rent = db.add_transaction({"date": "01.03.2025 10:00", "type": "Расход", "amount": -500,
+                               "description": "Аренда офиса на Ленина", "category": "Аренда"})
+    db.add_transaction({"date": "02.03.2025 10:00", "type": "Расход", "amount": -100,
+                        "description": "Реклама на Авито", "category": "Реклама"})
+    deal = db.add_car_deal({"brand": "Kia Rio", "year": "2020", "vin": "XWEABC123", "comment": "битая дверь"})
+
+    assert [tr.id for tr in db.search_transactions("аренд")] == [rent]
+    assert [tr.id for tr in db.search_transactions("офис ЛЕН")] == [rent]
+    assert db.search_transactions("аренда авито") == []
+    assert db.search_transactions("  ") == []
+    for text in ['"', "AND", "NEAR(", "a-b", "*"]:
+        assert db.search_transactions(text) == []
+    assert [d.id for d in db.search_car_deals("xweab")] == [deal]
+    assert [d.id for d in db.search_car_deals("дверь")] == [deal]
+
+    db.update_transaction(rent, {"description": "Коммунальные платежи"})
+    assert db.search_transactions("аренд") == []
+    assert [tr.id for tr in db.search_transactions("коммун")] == [rent]
+    db.delete_car_deal(deal)
+    assert db.search_car_deals("kia") == []
+
+def test_search_index_follows_import(db, tmp_path):
+    db.add_transaction({"date": "01.03.2025 10:00", "type": "Расход", "amount": -1,
+                        "description": "ручная запись", "category": "КЦ"})
+    path = tmp_path / "search.xlsx"
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        pd.DataFrame({
+            "Дата": [f"{day:02d}.04.2025 10:00" for day in range(1, 6)], "Тип": "Расход",
+            "Сумма": range(5), "Описание": [f"импорт запись {i}" for i in range(5)],
+            "Категория": "КЦ", "Тип_оплаты": "Безнал",
+        }).to_excel(writer, sheet_name="Транзакции", index=False)
+        pd.DataFrame({"Марка": ["Lada"], "Год": [2019], "VIN": ["LADA1"]}).to_excel(
+            writer, sheet_name="Авто-сделки", index=False)
+    db.import_from_excel(str(path), chunk_size=2)
+
+    assert len(db.search_transactions("запись")) == 6
+    assert len(db.search_transactions("импорт")) == 5
+    assert len(db.search_car_deals("lada")) == 1
+    for index in ("transactions_fts", "car_deals_fts"):
+        db.conn.execute(f"INSERT INTO {index} ({index}) VALUES ('integrity-check')")
+    # Триггер вставки восстановлен после импорта
+    db.add_transaction({"date": "02.03.2025 10:00", "type": "Расход", "amount": -2,
+                        "description": "после импорта", "category": "КЦ"})
+    assert len(db.search_transactions("после")) == 1
+
+def test_search_index_built_for_existing_rows(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE car_deals (id INTEGER PRIMARY KEY AUTOINCREMENT, brand TEXT NOT NULL, "
+                 "year TEXT NOT NULL, vin TEXT NOT NULL, comment TEXT, price REAL DEFAULT 0, "
+                 "cost REAL DEFAULT 0, expenses REAL DEFAULT 0, header REAL DEFAULT 0)")
+    conn.execute("INSERT INTO car_deals (brand, year, vin) VALUES ('Toyota Camry', '2018', 'JT123')")
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(path)
+    try:
+        assert [d.brand for d in db.search_car_deals("camr")] == ["Toyota Camry"]
+    finally:
+        db.close()
+
+def test_search_triggers_restored_on_open(tmp_path):
+    path = str(tmp_path / "fts.db")
+    db = DatabaseManager(path)
+    db.conn.execute("DROP TRIGGER trg_car_deals_fts_update")
+    db.conn.commit()
+    db.close()
+
+    db = DatabaseManager(path)
+    try:
+        deal_id = db.add_car_deal({"brand": "Kia", "year": "2020", "vin": "K"})
+        db.update_car_deal(deal_id, {"brand": "Skoda"})
+        assert [d.id for d in db.search_car_deals("skoda")] == [deal_id]
+        assert db.search_car_deals("kia") == []
+    finally:
+        db.close()
+
+# ---------- Тесты модели интерфейса ----------
+def test_model_applies_single_changes(db):
+    db.add_transaction({"date": "01.01.2025 10:00", "type": "Приход", "amount": 500,
+                        "description": "a", "category": "КЦ"})
+    db.add_transaction({"date": "03.01.2025 10:00", "type": "Расход", "amount": -200,
+                        "description": "b", "category": "Аренда"})
+    model = TrackerModel(db)
+    assert model.totals == {"total_income": 500, "expense_sum": -200, "car_profit": 0}
+
+    index, row = model.add_transaction({"date": "02.01.2025 10:00", "type": "Расход", "amount": -50,
+                                        "description": "c", "category": "Реклама"})
+    assert index == 1
+    assert [tr["description"] for tr in model.transactions] == ["b", "c", "a"]
+    assert model.add_transaction({"date": "02.01.2025 11:00", "type": "Расход", "amount": -50,
+                                  "description": "c", "category": "Реклама"}) is None
+
+    # Исключенная категория не меняет итоги
+    model.add_transaction({"date": "04.01.2025 10:00", "type": "Расход", "amount": -1000,
+                           "description": "d", "category": "ЗП окладники"})
+    assert model.totals["expense_sum"] == -250
+
+    old_index, new_index, row = model.update_transaction(row["id"], {"date": "05.01.2025 10:00"})
+    assert (old_index, new_index) == (2, 0)
+    model.update_transaction(row["id"], {"exclude_from_total": 1})
+    assert model.totals["expense_sum"] == -200
+
+    index, removed = model.delete_transaction(row["id"])
+    assert index == 0 and removed["description"] == "c"
+    assert [tr["description"] for tr in model.transactions] == ["d", "b", "a"]
+    assert model.transactions == db.get_all_transactions()
+
+    _, deal = model.add_car_deal({"brand": "Kia", "year": "2020", "vin": "K", "header": 300})
+    model.add_car_deal({"brand": "BMW", "year": "2022", "vin": "B", "header": 100})
+    assert [d["brand"] for d in model.car_deals] == ["BMW", "Kia"]
+    # Позиция найденной поиском строки - как ее видит таблица отчета
+    assert model.car_deal_position(db.search_car_deals("Kia")[0]) == 1
+    assert model.transaction_position(db.search_transactions("b")[0]) == 1
+    model.update_car_deal(deal["id"], {"header": 50})
+    assert model.totals["car_profit"] == 150
+    model.delete_car_deal(deal["id"])
+    assert model.totals["car_profit"] == 100
+    assert model.car_deals == db.get_all_car_deals()
+
+def test_columnar_store_matches_sql_summaries(db):
+    rows = [("01.03.2024 10:00", "Приход", 500, "КЦ"), ("01.03.2024 12:00", "Расход", -120, "Аренда"),
+            ("15.03.2024 09:00", "Расход", -80, "ЗП окладники"), ("31.03.2024 23:59", "Приход", 40, "Аренда"),
+            ("01.04.2024 00:00", "Расход", -999, "Аренда"), ("29.02.2024 10:00", "Приход", 7, "КЦ")]
+    for i, (day, kind, amount, category) in enumerate(rows):
+        db.add_transaction({"date": day, "type": kind, "amount": amount, "description": f"op {i}",
+                            "category": category})
+    model = TrackerModel(db)
+    assert model.columns.monthly_summary(2024, 3) == db.get_monthly_summary(2024, 3)
+    assert model.columns.totals(db.get_excluded_categories()) == \
+        {key: value for key, value in db.get_totals().items() if key != "car_profit"}
+
+    # Правки через модель попадают в колонки без перезагрузки
+    _, row = model.add_transaction({"date": "20.03.2024 10:00", "type": "Расход", "amount": -60,
+                                    "description": "new", "category": "Реклама"})
+    model.update_transaction(1, {"amount": 650, "category": "Реклама"})
+    model.update_transaction(row.id, {"date": "02.04.2024 10:00"})
+    model.delete_transaction(2)
+    for month in (2, 3, 4):
+        assert model.columns.monthly_summary(2024, month) == db.get_monthly_summary(2024, month)
+    assert model.columns.monthly_summary(2023, 3) == {"days": [], "categories": {}, "total_income": 0.0,
+                                                      "total_expense": 0.0, "count": 0}
+
+def test_columnar_store_grows_on_append():
+    store = ColumnarStore(capacity=2)
+    for i in range(5):
+        store.append(TransactionRecord(i + 1, "", "Приход", 10.0, "", "КЦ", "Безнал", False, None))
+    assert store.size == 5 and len(store.ids) >= 5
+    # Строки без даты в месячные сводки не попадают, но входят в итоги
+    assert store.monthly_summary(1970, 1)["count"] == 0
+    assert store.totals([]) == {"total_income": 50.0, "expense_sum": 0.0}
+
+class FakeTree:
+    """Минимальная замена ttk.Treeview/Scrollbar для проверки виртуальной таблицы без дисплея"""
+    def __init__(self):
+        self.items = {}
+        self.scroll = None
+
+    def configure(self, **kwargs):
+        pass
+
+    def bind(self, *args, **kwargs):
+        pass
+
+    def get_children(self):
+        return list(self.items)
+
+    def delete(self, *items):
+        for item in items:
+            del self.items[item]
+
+    def insert(self, parent, index, iid, text, values):
+        self.items[iid] = values
+
+    def exists(self, iid):
+        return iid in self.items
+
+    def selection_set(self, iid):
+        pass
+
+    def set(self, first, last):
+        self.scroll = (first, last)
+
+def test_virtual_treeview_renders_only_window(db):
+    for i in range(250):
+        db.add_car_deal({"brand": f"car {i}", "year": "2020", "vin": str(i)})
+    fetched = []
+
+    def fetch_page(offset, limit):
+        fetched.append(offset)
+        return db.get_car_deals_page(offset, limit)
+
+    tree = FakeTree()
+    view = VirtualTreeview(tree, tree, fetch_page, db.count_car_deals,
+                           make_iid=lambda deal: f"car_{deal['id']}",
+                           make_values=lambda deal: (deal["brand"],),
+                           page_size=50, buffer_rows=2)
+    view.visible_rows = 10
+    view.refresh()
+    assert tree.get_children() == [f"car_{i}" for i in range(250, 238, -1)]
+    assert fetched == [0]
+
+    view.on_scrollbar("moveto", "0.5")
+    assert view.first == 125
+    assert tree.get_children()[0] == "car_125"
+    assert len(tree.get_children()) == 12
+    assert tree.scroll == (0.5, 0.54)
+
+    view.scroll_to(10_000)
+    assert view.first == 240
+    assert len(tree.get_children()) == 10
+    assert fetched == [0, 100, 200]
+
+def test_virtual_treeview_reads_neighbour_pages_by_key(db):
+    for i in range(250):
+        db.add_car_deal({"brand": f"car {i}", "year": str(2000 + i % 5), "vin": str(i)})
+    by_offset, by_key = [], []
+
+    def fetch_page(offset, limit):
+        by_offset.append(offset)
+        return db.get_car_deals_page(offset, limit)
+
+    def fetch_after(key, limit, direction):
+        by_key.append(direction)
+        return db.iter_car_deals(key, limit, direction)
+
+    tree = FakeTree()
+    view = VirtualTreeview(tree, tree, fetch_page, db.count_car_deals,
+                           make_iid=lambda deal: f"car_{deal['id']}",
+                           make_values=lambda deal: (deal["brand"],),
+                           page_size=50, cached_pages=2,
+                           fetch_after=fetch_after, row_key=car_deal_key)
+    view.visible_rows = 10
+    view.refresh()
+    # Прокрутка вперед и обратно: соседние страницы читаются по ключу
+    for first in list(range(0, 241, 10)) + list(range(240, -1, -10)):
+        view.scroll_to(first)
+    assert by_offset == [0]
+    assert by_key == ["desc"] * 4 + ["asc"] * 3
+    # Прыжок полосой прокрутки далеко от кэша - через OFFSET
+    view.on_scrollbar("moveto", "0.8")
+    assert by_offset == [0, 200]
+    assert [view.make_iid(row) for row in view.rows(0, 250)] == \
+        [f"car_{deal['id']}" for deal in db.get_all_car_deals()]
+
 # ---------- Тесты настроек ----------
 def test_initial_capital(db):
     assert db.get_initial_capital() == 0
@@ -130,7 +984,8 @@ def test_export_and_import_excel(db, tmp_path):
     assert db2.get_initial_capital() == 0.0
 
     imported = db2.import_from_excel(str(export_file))
-    assert imported is True
+    assert imported == {"transactions": 1, "car_deals": 1, "initial_capital": 777.0,
+                        "skipped_transactions": 0, "skipped_car_deals": 0}
 
     # проверяем, что данные перенеслись
     trs = db2.get_all_transactions()
@@ -149,6 +1004,491 @@ def test_export_and_import_excel(db, tmp_path):
 
     assert capital == 777.0
 
+def test_export_sheets_and_headers(db, tmp_path):
+    db.add_transaction({
+        "date": "01.02.2025 10:00", "type": "Расход", "amount": -5.5,
+        "description": "Чай", "category": "Другое", "exclude_from_total": True
+    })
+    db.add_car_deal({"brand": "Kia", "year": "2020", "vin": "K1", "price": 10, "cost": 7, "header": 3})
+    db.update_initial_capital(100)
+
+    path = tmp_path / "export.xlsx"
+    monthly = {"month_info": {"Год": 2025, "Месяц": "Февраль"},
+               "category_stats": {"Другое": {"Сумма": 5.5}}}
+    assert db.export_to_excel(str(path), monthly) is True
+
+    sheets = pd.read_excel(path, sheet_name=None)
+    assert list(sheets) == ["Транзакции", "Авто-сделки", "Настройки", "Месяц_Категории", "Месяц_Инфо"]
+    assert list(sheets["Транзакции"].columns) == [
+        "id", "Дата", "Тип", "Сумма", "Описание", "Категория", "Тип_оплаты", "Исключено_из_расхода"
+    ]
+    assert sheets["Транзакции"].iloc[0]["Исключено_из_расхода"] == True
+    assert list(sheets["Авто-сделки"].columns) == [
+        "id", "Марка", "Год", "VIN", "Комментарий", "Цена_продажи", "Закупочная_стоимость", "Расходы", "Прибыль"
+    ]
+    assert sheets["Настройки"].iloc[0]["Стартовый_капитал"] == 100
+    assert list(sheets["Месяц_Категории"].columns) == ["Категория", "Сумма"]
+
+def test_export_skips_empty_tables(db, tmp_path):
+    path = tmp_path / "empty.xlsx"
+    assert db.export_to_excel(str(path)) is True
+    assert list(pd.read_excel(path, sheet_name=None)) == ["Настройки"]
+
+def test_import_normalizes_columns_and_skips_duplicates(db, tmp_path):
+    path = tmp_path / "import.xlsx"
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        pd.DataFrame({
+            "Дата": [datetime(2025, 3, 1, 10, 30), "02.03.2025 11:00", "02.03.2025 11:00", None],
+            "Тип": ["Расход", "Приход", "Приход", None],
+            "Сумма": [150, -200, -200, None],
+            "Описание": ["Бензин", " Оплата ", " Оплата ", None],
+            "Категория": ["Другое", None, None, "КЦ"],
+        }).to_excel(writer, sheet_name="Транзакции", index=False)
+        pd.DataFrame({
+            "Марка": ["Kia", None, "Lada"],
+            "Год": [2020, 2019, None],
+            "VIN": ["K1", "X", None],
+            "Цена_продажи": [1000, 1, 500],
+            "Закупочная_стоимость": [800, 1, None],
+            "Расходы": [50, 0, None],
+        }).to_excel(writer, sheet_name="Авто-сделки", index=False)
+
+    counts = db.import_from_excel(str(path))
+    assert counts == {"transactions": 3, "car_deals": 2, "initial_capital": None,
+                      "skipped_transactions": 1, "skipped_car_deals": 0}
+
+    trs = {tr["description"]: tr for tr in db.get_all_transactions()}
+    assert trs["Бензин"]["amount"] == -150
+    assert trs["Бензин"]["date"] == "01.03.2025 10:30"
+    assert trs["Бензин"]["date_iso"] == "2025-03-01 10:30:00"
+    assert trs["Оплата"]["amount"] == 200
+    assert trs["Оплата"]["category"] == "Другое"
+    assert trs[""]["type"] == "Приход" and trs[""]["amount"] == 0
+
+    deals = {deal["brand"]: deal for deal in db.get_all_car_deals()}
+    assert deals["Kia"]["year"] == "2020"
+    assert deals["Kia"]["header"] == 150
+    assert deals["Lada"]["vin"] == "" and deals["Lada"]["header"] == 500
+
+    # Повторный импорт того же файла ничего не добавляет
+    counts = db.import_from_excel(str(path))
+    assert counts["transactions"] == 0
+    assert counts["skipped_transactions"] == 4
+    assert counts["skipped_car_deals"] == 2
+    assert len(db.get_all_transactions()) == 3
+    assert len(db.get_all_car_deals()) == 2
+
+def test_import_parses_exclude_flag_spellings():
+    flags = ["False", "0", "Нет", "", "мусор", None, 0.0, False, "True", " да ", "1", 2, True]
+    frame = normalize_transactions_frame(pd.DataFrame({"Исключено_из_расхода": flags}))
+    assert frame["exclude_from_total"].tolist() == [0] * 8 + [1] * 5
+
+def test_streaming_import_matches_full_import(db, tmp_path):
+    path = tmp_path / "stream.xlsx"
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        pd.DataFrame({
+            "Дата": [f"{day:02d}.07.2025 10:00" for day in range(1, 8)] + ["01.07.2025 10:00"],
+            "Тип": ["Расход", "Приход"] * 3 + ["Расход", "Расход"],
+            "Сумма": [10, 20, 30, 40, 50, 60, 70, 10],
+            "Описание": [f"op {i}" for i in range(7)] + ["op 0"],
+            "Категория": "КЦ",
+            "Тип_оплаты": "Безнал",
+        }).to_excel(writer, sheet_name="Транзакции", index=False)
+        pd.DataFrame({
+            "Марка": ["Kia", "BMW", "Kia"], "Год": [2020, 2021, 2020], "VIN": ["K1", "B1", "K1"],
+            "Цена_продажи": [1000, 2000, 1000], "Закупочная_стоимость": [800, 1500, 800],
+        }).to_excel(writer, sheet_name="Авто-сделки", index=False)
+        pd.DataFrame({"Стартовый_капитал": [123.0]}).to_excel(writer, sheet_name="Настройки", index=False)
+
+    counts = db.import_from_excel(str(path), chunk_size=3)
+    assert counts == {"transactions": 7, "car_deals": 2, "initial_capital": 123.0,
+                      "skipped_transactions": 1, "skipped_car_deals": 1}
+
+    full = DatabaseManager(":memory:")
+    try:
+        full.import_from_excel(str(path))
+        def strip_ids(rows):
+            return [{k: v for k, v in row.items() if k != "id"} for row in rows]
+        assert strip_ids(db.get_all_transactions()) == strip_ids(full.get_all_transactions())
+        assert strip_ids(db.get_all_car_deals()) == strip_ids(full.get_all_car_deals())
+    finally:
+        full.close()
+
+def test_insert_frames_commit_and_skip_duplicates(db):
+    frame = normalize_transactions_frame(pd.DataFrame({
+        "Дата": ["01.08.2025 10:00", "02.08.2025 10:00"], "Тип": ["Расход", "Приход"],
+        "Сумма": [10, 20], "Описание": ["a", "b"], "Категория": "КЦ",
+    }))
+    assert db.insert_transactions_frame(frame) == 2
+    assert not db.conn.in_transaction
+    assert db.insert_transactions_frame(frame) == 0
+
+    deals = normalize_car_deals_frame(pd.DataFrame({"Марка": ["Kia"], "Год": [2020], "VIN": ["K1"],
+                                                    "Цена_продажи": [1000], "Закупочная_стоимость": [800]}))
+    # Внутри batch() запись - часть пачки и откатывается вместе с ней
+    with pytest.raises(RuntimeError):
+        with db.batch():
+            assert db.insert_car_deals_frame(deals) == 1
+            raise RuntimeError()
+    assert db.count_car_deals() == 0
+    assert db.insert_car_deals_frame(deals) == 1
+
+# ---------- Тесты расчетов отчетов ----------
+def test_compute_summary():
+    totals = {"total_income": 1000.0, "expense_sum": -1500.0, "car_profit": 300.0}
+    summary = compute_summary(totals, initial_capital=1200.0)
+    assert summary == {"initial_capital": 1200.0, "total_income": 1000.0, "total_expense": 1500.0,
+                       "additional_investment": 300.0, "car_profit": 300.0, "total_profit": 1000.0}
+    assert compute_summary(totals, initial_capital=5000.0)["additional_investment"] == 0
+
+def test_build_monthly_report(db):
+    db.add_transaction({"date": "01.03.2025 10:00", "type": "Приход", "amount": 1000,
+                        "description": "in", "category": "КЦ"})
+    db.add_transaction({"date": "02.03.2025 10:00", "type": "Расход", "amount": -300,
+                        "description": "out", "category": "Аренда", "payment_type": "Безнал"})
+    report = build_monthly_report(db.get_monthly_summary(2025, 3), db.get_transactions_for_month(2025, 3),
+                                  2025, "Март", db.get_categories())
+    assert [row["Дата"] for row in report["daily_summary"]] == ["01.03.2025", "02.03.2025"]
+    assert [row["Тип_оплаты"] for row in report["daily_details"]] == ["Безнал", "Наличные"]
+    assert report["month_info"]["Итоговый_баланс"] == 700
+    assert report["category_stats"]["Аренда"] == {"Сумма": 300, "Сумма_руб": "300.00 ₽", "Тип": "Расход"}
+
+# ---------- Тесты бенчмарков ----------
+def test_benchmark_suite_smoke(tmp_path):
+    results = run_size(300, str(tmp_path), repeat=1, excel_max=300, log=lambda message: None, car_deals=20)
+    assert {"seed", "add_transaction_x1000", "get_all_transactions", "exists_transaction_x1000",
+            "monthly_report", "excel_export", "excel_import"} <= set(results)
+    assert all(stats["median"] >= 0 for stats in results.values())
+    check = DatabaseManager(str(tmp_path / "bench_300_import.db"))
+    try:
+        assert check.count_transactions() == 300 and check.count_car_deals() == 20
+    finally:
+        check.close()
+
+def test_benchmark_compare_flags_regressions():
+    baseline = {"results": {"1000": {"fast": {"median": 1.0}, "slow": {"median": 1.0},
+                                     "tiny": {"median": 0.0001}}}}
+    current = {"results": {"1000": {"fast": {"median": 0.5}, "slow": {"median": 1.5},
+                                    "tiny": {"median": 0.0009}, "added": {"median": 2.0}}}}
+    statuses = {row["name"]: row["status"] for row in compare(current, baseline, threshold=0.25)}
+    assert statuses == {"fast": "faster", "slow": "regression", "tiny": "ok", "added": "new"}
+
+def test_generator_is_reproducible_and_realistic():
+    first = pd.concat(generate.transaction_chunks(2000, seed=5, chunk=700))
+    second = pd.concat(generate.transaction_chunks(2000, seed=5, chunk=700))
+    pd.testing.assert_frame_equal(first, second)
+    assert set(first["Категория"]) == set(generate.CATEGORY_PROFILES)
+    assert set(first["Тип_оплаты"]) == set(generate.PAYMENT_TYPES)
+    assert ((first["Тип"] == "Расход") == (first["Сумма"] < 0)).all()
+    assert first["date_iso"].str[:10].is_monotonic_increasing
+    assert first["Исключено_из_расхода"].any()
+
+    deals = pd.concat(generate.car_deal_chunks(300, seed=5))
+    assert deals["VIN"].str.len().eq(17).all() and deals["VIN"].is_unique
+    assert (deals["Прибыль"] == deals["Цена_продажи"] - deals["Закупочная_стоимость"] - deals["Расходы"]).all()
+
+def test_generator_writes_database_and_workbook(tmp_path):
+    db_path, book_path = str(tmp_path / "gen.db"), str(tmp_path / "gen.xlsx")
+    assert generate.main([db_path, "--transactions", "500", "--car-deals", "40", "--chunk", "200",
+                          "--capital", "1000"]) == 0
+    assert generate.main([db_path]) == 2  # файл уже есть
+    assert generate.main([book_path, "--transactions", "500", "--car-deals", "40", "--chunk", "200",
+                          "--capital", "1000"]) == 0
+
+    from_db = DatabaseManager(db_path)
+    from_book = DatabaseManager(":memory:")
+    try:
+        from_book.import_from_excel(book_path)
+        exported = tmp_path / "export.xlsx"
+        from_db.export_to_excel(str(exported))
+        for sheet in ("Транзакции", "Авто-сделки", "Настройки"):
+            assert list(pd.read_excel(book_path, sheet_name=sheet).columns) == \
+                list(pd.read_excel(exported, sheet_name=sheet).columns)
+
+        assert from_db.count_car_deals() == from_book.count_car_deals() == 40
+        assert from_db.count_transactions() == from_book.count_transactions() > 490
+        assert from_db.get_initial_capital() == from_book.get_initial_capital() == 1000
+        assert from_db.get_totals() == from_book.get_totals()
+    finally:
+        from_db.close()
+        from_book.close()
+
+# ---------- Тесты командной строки ----------
+def test_cli_import_summary_reports_and_vacuum(tmp_path, capsys):
+    db_path, book_path = str(tmp_path / "cli.db"), str(tmp_path / "in.xlsx")
+    generate.write_workbook(book_path, 300, 20, seed=3, years=1, start="2021-01-01", initial_capital=500)
+    assert money_cli.main(["--db", str(tmp_path / "missing.db"), "summary"]) == 2
+    assert not (tmp_path / "missing.db").exists()
+
+    assert money_cli.main(["--db", db_path, "import", book_path, "--json"]) == 0
+    imported = json.loads(capsys.readouterr().out)
+    assert imported["car_deals"] == 20 and imported["initial_capital"] == 500
+
+    assert money_cli.main(["--db", db_path, "summary", "--json"]) == 0
+    summary = json.loads(capsys.readouterr().out)
+    check = DatabaseManager(db_path)
+    try:
+        assert summary == {**compute_summary(check.get_totals(), 500),
+                           "transactions": check.count_transactions(), "car_deals": 20}
+        month = check.get_monthly_summary(2021, 6)
+    finally:
+        check.close()
+
+    assert money_cli.main(["--db", db_path, "monthly-report", "--year", "2021", "--month", "6", "--json"]) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report["month_info"]["Месяц"] == "Июнь"
+    assert report["month_info"]["Общий_приход"] == pytest.approx(month["total_income"])
+
+    monthly_book = tmp_path / "june.xlsx"
+    assert money_cli.main(["--db", db_path, "monthly-report", "--year", "2021", "--month", "6",
+                           "-o", str(monthly_book)]) == 0
+    assert "Общая_информация" in pd.ExcelFile(monthly_book).sheet_names
+    full_book = tmp_path / "full.xlsx"
+    assert money_cli.main(["--db", db_path, "export", str(full_book), "--year", "2021", "--month", "6"]) == 0
+    assert {"Транзакции", "Месяц_Инфо"} <= set(pd.ExcelFile(full_book).sheet_names)
+    assert money_cli.main(["--db", db_path, "export", str(full_book), "--year", "2021"]) == 2
+
+    assert money_cli.main(["--db", db_path, "vacuum"]) == 0
+    assert "КБ" in capsys.readouterr().out
+
+def test_cli_does_not_import_tkinter():
+    code = "import sys, money_cli; print(sorted(m for m in sys.modules if 'tkinter' in m))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    assert result.stdout.strip() == "[]"
+
+def test_cli_does_not_import_numpy():
+    # summary и vacuum работают без numpy - он нужен только ColumnarStore окна
+    code = "import sys, money_cli; print('numpy' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    assert result.stdout.strip() == "False"
+
+# ---------- Тесты запуска ----------
+def test_startup_import_defers_excel_libraries():
+    result = startup.import_time("money_cli")
+    assert result["deferred_loaded"] == []
+    assert result["seconds"] > 0 and result["heaviest"]
+
+def test_startup_budget_check():
+    stderr = ("import time: self [us] | cumulative | imported package\n"
+              "import time:       120 |        300 |   numpy\n"
+              "import time:      5000 |     180000 | money_core\n")
+    assert startup.parse_importtime(stderr) == {"numpy": {"self": 120, "cumulative": 300},
+                                                "money_core": {"self": 5000, "cumulative": 180000}}
+    results = {"import money_core": {"median": 0.180, "heaviest": [("numpy", 300)], "deferred_loaded": []},
+               "first_window": {"median": 3.0}}
+    assert startup.check_budget(results, {"import money_core": 250, "first_window": 2500}) == [
+        "first_window: 3000 мс при бюджете 2500 мс"]
+    results["import money_core"]["deferred_loaded"] = ["pandas"]
+    assert startup.check_budget(results, {})[0] == "import money_core: при импорте загружены pandas"
+
+# ---------- Тесты фоновых задач ----------
+def test_export_cancelled_by_progress(db, tmp_path):
+    for i in range(3):
+        db.add_transaction({"date": f"0{i + 1}.01.2024 10:00", "type": "Расход", "amount": i + 1,
+                            "description": f"op {i}", "category": "КЦ", "payment_type": "Безнал"})
+
+    def cancel(done, total, message):
+        raise OperationCancelled()
+
+    with pytest.raises(OperationCancelled):
+        db.export_to_excel(str(tmp_path / "out.xlsx"), progress=cancel)
+
+
+class FakeRoot:
+    """Заменяет Tk: after только запоминает callback, опрос запускается вручную"""
+    def __init__(self):
+        self.callbacks = []
+
+    def after(self, ms, callback):
+        self.callbacks.append(callback)
+
+    def run_pending(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+def test_background_worker_runs_jobs_and_cancels(tmp_path):
+    db_file = str(tmp_path / "worker.db")
+    DatabaseManager(db_file).close()
+    root = FakeRoot()
+    worker = BackgroundWorker(root, db_file)
+    results, errors, progress_calls, states = [], [], [], []
+    worker.on_progress = lambda title, done, total, message: progress_calls.append((done, total))
+    worker.on_state = lambda busy, title: states.append(busy)
+
+    def add_job(db, progress):
+        progress(1, 2, "")
+        db.add_transaction({"date": "01.01.2024 10:00", "type": "Приход", "amount": 5,
+                            "description": "bg", "category": "КЦ", "payment_type": "Безнал"})
+        progress(2, 2, "")
+        return db.count_transactions()
+
+    def cancelled_job(db, progress):
+        worker.cancel()
+        progress(1, 1, "")
+        return "не дошли"
+
+    worker.submit("add", add_job, on_done=results.append, on_error=errors.append)
+    worker.submit("cancel", cancelled_job, on_done=results.append, on_error=errors.append)
+    worker.stop()
+    worker.thread.join(timeout=10)
+    root.run_pending()
+
+    assert results == [1]
+    assert len(errors) == 1 and isinstance(errors[0], OperationCancelled)
+    assert progress_calls == [(1, 2), (2, 2)]
+    assert states == [True, True, True, False]
+
+    check = DatabaseManager(db_file)
+    try:
+        assert check.count_transactions() == 1
+    finally:
+        check.close()
+
+# ---------- Тесты замеров времени ----------
+def test_instrumentation_stats_and_dump(tmp_path):
+    timings = Instrumentation(enabled=True)
+    for ms in range(1, 101):
+        timings.record("op", ms / 1000)
+    with timings.timer("block"):
+        pass
+
+    stats = timings.snapshot()
+    assert list(stats) == ["op", "block"]
+    assert stats["op"]["count"] == 100
+    assert stats["op"]["p50"] == pytest.approx(0.050)
+    assert stats["op"]["p95"] == pytest.approx(0.095)
+    assert stats["op"]["max"] == pytest.approx(0.100)
+    assert stats["block"]["count"] == 1
+
+    path = tmp_path / "timings.json"
+    timings.dump(str(path))
+    assert json.loads(path.read_text(encoding="utf-8"))["timings"]["op"]["count"] == 100
+
+    timings.enabled = False
+    with timings.timer("off"):
+        pass
+    timings.reset()
+    assert timings.snapshot() == {}
+
+def test_database_calls_are_timed(db):
+    INSTRUMENTATION.reset()
+    db.count_transactions()
+    assert INSTRUMENTATION.snapshot() == {}  # выключено - ничего не пишется
+
+    INSTRUMENTATION.enabled = True
+    try:
+        db.add_transaction({"date": "01.01.2025 10:00", "type": "Приход", "amount": 5,
+                            "description": "замер", "category": "КЦ", "payment_type": "Безнал"})
+        with db.batch():
+            db.count_transactions()
+    finally:
+        INSTRUMENTATION.enabled = False
+    stats = INSTRUMENTATION.snapshot()
+    INSTRUMENTATION.reset()
+    assert stats["db.add_transaction"]["count"] == 1
+    assert stats["db.count_transactions"]["count"] == 1
+    assert "db.batch" not in stats
+
+# ---------- Тесты трассировки SQL ----------
+def test_normalize_sql_and_parameters_shape():
+    assert normalize_sql("SELECT *  FROM t\n WHERE a = 'x''y' AND b IN (?, ?, ?) AND c > -1.5") == \
+        "SELECT * FROM t WHERE a = ? AND b IN (?...) AND c > ?"
+    assert normalize_sql("RELEASE batch_0") == "RELEASE batch_0"
+    assert parameters_shape(("a", 1, 2, 3, None)) == "(str, int×3, NoneType)"
+    assert parameters_shape({"q": "x"}) == "{q: str}"
+    assert parameters_shape(()) == "()"
+
+def test_query_tracer_is_silent_by_default(db, capsys):
+    tracer = db.enable_query_tracer(QueryTracer(threshold_ms=0))
+    db.count_transactions()
+    db.disable_query_tracer()
+    assert tracer.slow and capsys.readouterr().out == ""
+
+def test_query_tracer_reports_plans_and_slow_statements(db):
+    messages = []
+    tracer = db.enable_query_tracer(QueryTracer(threshold_ms=0, log=messages.append))
+    transaction = {"date": "01.01.2025 10:00", "type": "Приход", "amount": 5,
+                   "description": "трасса", "category": "КЦ", "payment_type": "Безнал"}
+    db.add_transaction(transaction)
+    assert db.exists_transaction(transaction)
+    db.add_car_deal({"brand": "BMW", "year": 2010, "vin": "V1", "price": 10, "cost": 5})
+    assert len(db.get_all_car_deals()) == 1
+    db.conn.execute("SELECT COUNT(*) FROM car_deals WHERE comment = ?", ("x",)).fetchone()
+    with db.batch():
+        db.conn.executemany("UPDATE car_deals SET comment = ? WHERE id = ?", ((str(i), 1) for i in range(3)))
+    db.disable_query_tracer()
+    db.count_transactions()
+
+    queries = {row["sql"]: row for row in tracer.report()}
+    assert "SELECT COUNT(*) FROM transactions" not in queries  # после disable не пишется
+    scan = queries["SELECT COUNT(*) FROM car_deals WHERE comment = ?"]
+    assert scan["flags"] == ["scan"] and scan["plan"] == ["SCAN car_deals"]
+    fingerprint = queries["SELECT ? FROM transactions WHERE fingerprint = ? LIMIT ?"]
+    assert fingerprint["flags"] == [] and "idx_transactions_fingerprint" in fingerprint["plan"][0]
+    insert = next(row for sql, row in queries.items() if sql.startswith("INSERT OR IGNORE INTO transactions"))
+    assert insert["substatements"] > 0  # триггеры итогов и поискового индекса
+    assert queries["UPDATE car_deals SET comment = ? WHERE id = ?"]["rows"] == 3
+
+    slow = {entry["sql"]: entry for entry in tracer.slow}
+    assert slow["UPDATE car_deals SET comment = ? WHERE id = ?"]["parameters"] == "3×(str, int)"
+    assert slow["SELECT COUNT(*) FROM car_deals WHERE comment = ?"]["parameters"] == "(str)"
+    assert any("SCAN car_deals" in message for message in messages)
+    assert json.dumps(tracer.to_dict())
+
+# ---------- Тесты ленивых вкладок ----------
+class FakeNotebook:
+    """Заменяет ttk.Notebook: выбранная вкладка задается индексом"""
+    def __init__(self):
+        self.selected = 0
+
+    def index(self, tab):
+        return self.selected
+
+
+def test_tabs_built_on_first_show_and_refreshed_when_dirty(db):
+    calls = []
+    app = MoneyTrackerApp.__new__(MoneyTrackerApp)  # без окна: только логика вкладок
+    app.notebook = FakeNotebook()
+    app.tabs = {name: (None, name, lambda name=name: calls.append(("setup", name)),
+                       lambda name=name: calls.append(("refresh", name)))
+                for name in ("add", "report", "monthly")}
+    app.built_tabs, app.dirty_tabs = set(), set()
+
+    app.on_tab_changed()
+    assert calls == [("setup", "add")]
+    app.refresh_tab("report")  # еще не построена - построится со свежими данными
+    assert calls == [("setup", "add")] and not app.dirty_tabs
+
+    app.notebook.selected = 1
+    app.on_tab_changed()
+    app.refresh_tab("report", lambda: calls.append(("rows", "report")))  # открыта - частичное обновление
+    assert calls[1:] == [("setup", "report"), ("rows", "report")]
+
+    app.notebook.selected = 0
+    app.on_tab_changed()
+    app.refresh_tab("report")
+    app.refresh_tab("report")
+    assert app.dirty_tabs == {"report"} and len(calls) == 3  # скрытая - только помечена
+
+    app.notebook.selected = 1
+    app.on_tab_changed()
+    app.on_tab_changed()
+    assert calls[3:] == [("refresh", "report")] and not app.dirty_tabs
+
+    # Экспорт без открытой вкладки месяца берет текущий месяц
+    app.db, app.model = db, TrackerModel(db)
+    app.categories = db.get_categories()
+    now = datetime.now()
+    db.add_transaction({"date": now.strftime("%d.%m.%Y %H:%M"), "type": "Приход", "amount": 70,
+                        "description": "месяц", "category": "КЦ", "payment_type": "Безнал"})
+    app.model.reload()
+    info = app.get_monthly_report_data()["month_info"]
+    assert (info["Год"], info["Общий_приход"]) == (now.year, 70)
+
 # ---------- Тест закрытия ----------
 def test_close_connection(db):
     db.close()